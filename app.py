@@ -1,13 +1,28 @@
 import os
 import cv2  # OpenCV for image/video processing
 import numpy as np
-from flask import Flask, render_template, request, jsonify, url_for, send_from_directory
+from flask import (Flask, render_template, request, jsonify, url_for, send_from_directory, send_file, Response,
+                   has_request_context, stream_with_context)
 import base64  # To encode/decode image data for display/mask
+import io
+import json  # For Server-Sent Events payloads and cache metadata
+import hashlib  # For content-addressed result cache keys
+import contextlib
+import functools
+import zipfile  # For batch results
 import datetime  # For current year in footer
 import tempfile  # For handling temporary files securely
 import uuid  # For unique output filenames
 import mimetypes  # To guess file type based on extension
-import traceback  # For detailed error logging
+import logging  # Leveled logging (LOG_LEVEL)
+import multiprocessing  # For the segmented video engine
+import threading  # For the pipelined video engine
+import queue
+import copy
+import collections  # For the prepared mask LRU
+import time
+import mmap  # For copy-free access to spooled uploads
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 
 # --- Flask App Setup ---
 app = Flask(__name__)
@@ -17,77 +32,1537 @@ OUTPUT_FOLDER = os.path.join('static', 'output')
 # Max file size: 100 MB (100 * 1024 * 1024 bytes)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
+# Video encoder settings (per-request 'video_codec' / 'video_container' fields override them).
+# 'mp4v' in MP4 works everywhere; others (e.g. 'avc1', 'VP80' + webm, 'MJPG' + avi) depend on the OpenCV build.
+app.config['VIDEO_FOURCC'] = os.environ.get('VIDEO_FOURCC', 'mp4v')
+app.config['VIDEO_CONTAINER'] = os.environ.get('VIDEO_CONTAINER', 'mp4')
+# Worker processes per video job (1 = process frames in the request's own process)
+app.config['VIDEO_WORKERS'] = int(os.environ.get('VIDEO_WORKERS', '1'))
+# Worker threads of the in-process decode/process/encode pipeline (0 or 1 = plain serial loop)
+app.config['VIDEO_PIPELINE_THREADS'] = int(os.environ.get('VIDEO_PIPELINE_THREADS', '4'))
+# Most decoded frames the pipeline keeps in memory at once (0 = twice the thread count)
+app.config['VIDEO_MAX_IN_FLIGHT'] = int(os.environ.get('VIDEO_MAX_IN_FLIGHT', '0'))
+# Threads of the tiled engine for very large images (0 = the process's OpenCV thread count)
+app.config['IMAGE_TILE_WORKERS'] = int(os.environ.get('IMAGE_TILE_WORKERS', '0'))
+# Background jobs (/api/jobs): concurrent jobs per server process, queued jobs before
+# submissions are refused, and how long finished jobs stay queryable
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', '2'))
+app.config['JOB_MAX_PENDING'] = int(os.environ.get('JOB_MAX_PENDING', '16'))
+app.config['JOB_RETENTION_SECONDS'] = int(os.environ.get('JOB_RETENTION_SECONDS', '3600'))
+# Folder shared by the server processes of this host: one state file per job, so any worker
+# can answer a job's status polls, event stream and cancellation
+app.config['JOB_STATE_FOLDER'] = os.environ.get('JOB_STATE_FOLDER',
+                                                os.path.join(tempfile.gettempdir(), 'watermark_jobs'))
+# An /api/jobs/<id>/events stream occupies a server worker, so it is closed after this many
+# seconds (below gunicorn's default 30 s timeout) and the EventSource client reconnects
+app.config['JOB_EVENTS_MAX_SECONDS'] = float(os.environ.get('JOB_EVENTS_MAX_SECONDS', '20'))
+# Default for the 'result_format' form field of /api/process: 'url' (image saved under
+# /output/), 'binary' (raw image bytes in the response body) or 'data_uri' (legacy base64 JSON)
+app.config['DEFAULT_RESULT_FORMAT'] = os.environ.get('DEFAULT_RESULT_FORMAT', 'url')
+# Result cache: finished results are stored in the output folder under a hash of their inputs.
+# OUTPUT_MAX_BYTES bounds the whole output folder (cache entries and orphaned files, least
+# recently used first); files younger than OUTPUT_GRACE_SECONDS are never evicted.
+app.config['RESULT_CACHE_ENABLED'] = os.environ.get('RESULT_CACHE_ENABLED', '1') == '1'
+app.config['OUTPUT_MAX_BYTES'] = int(os.environ.get('OUTPUT_MAX_BYTES', str(5 * 1024 * 1024 * 1024)))
+app.config['OUTPUT_GRACE_SECONDS'] = int(os.environ.get('OUTPUT_GRACE_SECONDS', '3600'))
+# Prepared mask cache: decoded/resized masks with their regions and blur weights, kept in
+# memory per (mask hash, frame size) up to this many bytes (0 disables it)
+app.config['MASK_CACHE_MAX_BYTES'] = int(os.environ.get('MASK_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Parallel items per /api/batch request
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', str(min(8, os.cpu_count() or 1))))
+# Server log level: DEBUG adds per-frame progress, WARNING keeps only problems
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Resource governor: CPU_THREAD_BUDGET (OpenCV threads) and MEMORY_BUDGET_BYTES cover the whole server
+# and are split evenly across WEB_CONCURRENCY worker processes (gunicorn's default --workers reads the
+# same variable, so set it instead of --workers). MEMORY_BUDGET_BYTES=0 uses 75% of the container/host
+# memory limit, -1 disables admission control. Requests wait up to ADMISSION_WAIT_SECONDS for memory,
+# then get a 503 with Retry-After: ADMISSION_RETRY_AFTER.
+app.config['WEB_CONCURRENCY'] = int(os.environ.get('WEB_CONCURRENCY', '1'))
+app.config['CPU_THREAD_BUDGET'] = int(os.environ.get('CPU_THREAD_BUDGET', str(os.cpu_count() or 1)))
+app.config['MEMORY_BUDGET_BYTES'] = int(os.environ.get('MEMORY_BUDGET_BYTES', '0'))
+app.config['ADMISSION_WAIT_SECONDS'] = float(os.environ.get('ADMISSION_WAIT_SECONDS', '10'))
+app.config['ADMISSION_RETRY_AFTER'] = int(os.environ.get('ADMISSION_RETRY_AFTER', '15'))
+
+# --- Logging ---
+# No-op if the WSGI server (e.g. gunicorn) already configured the root logger
+logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("app")
+logger.setLevel(app.config['LOG_LEVEL'])
+
+logger.info(f"[APP] Max upload size set to: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024):.0f} MB")
+logger.warning("[APP] IMPORTANT: If using Nginx/Apache, ensure 'client_max_body_size' (or equivalent) is also set!")
+
+# Inpainting radii used by the image and video helpers
+IMAGE_INPAINT_RADIUS = 9
+VIDEO_INPAINT_RADIUS = 5
+# If the mask regions (plus margins) cover more than this fraction of the frame,
+# cropping buys nothing and the whole frame is inpainted in one call.
+ROI_MAX_AREA_FRACTION = 0.6
+# Image output formats: name -> (encoder extension, MIME type)
+IMAGE_OUTPUT_FORMATS = {
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "jpeg": (".jpg", "image/jpeg"),
+}
+# Video containers: name -> MIME type
+VIDEO_CONTAINERS = {"mp4": "video/mp4", "avi": "video/x-msvideo", "mkv": "video/x-matroska", "webm": "video/webm"}
+# Extensions /output/ serves: the result files above (other files in the folder are internal)
+SERVED_OUTPUT_EXTENSIONS = frozenset([extension for extension, _ in IMAGE_OUTPUT_FORMATS.values()]
+                                     + [f".{container}" for container in VIDEO_CONTAINERS])
+# Accepted values of the 'result_format' form field
+RESULT_FORMATS = ("url", "binary", "data_uri")
+# Read size when streaming uploads to disk, and chunk size of streamed binary responses
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Uploads at least this large are memory-mapped from Werkzeug's spool file instead of read
+UPLOAD_MMAP_MIN_BYTES = 1024 * 1024
+# Image headers are parsed from at most this many leading bytes (JPEG APPn segments come first)
+IMAGE_HEADER_BYTES = 1024 * 1024
+# Bump when processing changes so stale cached results are not served
+RESULT_CACHE_VERSION = 1
+# Pyramid inpainting: regions with at least this many masked pixels are inpainted at reduced
+# resolution first (see inpaint_pyramid); the low-res hole is kept around this size
+PYRAMID_MIN_MASKED_PIXELS = int(os.environ.get('PYRAMID_MIN_MASKED_PIXELS', '250000'))
+PYRAMID_TARGET_MASKED_PIXELS = 40000
+PYRAMID_MAX_LEVELS = 4
+# Blur kernels from this size up use the downscale-blur-upscale approximation
+BLUR_APPROX_MIN_KERNEL = int(os.environ.get('BLUR_APPROX_MIN_KERNEL', '41'))
+BLUR_MODES = ("full", "mask")
+# Images with at least this many pixels use the tiled engine: mask regions are inpainted in
+# parallel and the blur runs tile by tile (tiles of about IMAGE_TILE_SIZE pixels square)
+IMAGE_TILE_MIN_PIXELS = int(os.environ.get('IMAGE_TILE_MIN_PIXELS', str(40 * 1000 * 1000)))
+IMAGE_TILE_SIZE = int(os.environ.get('IMAGE_TILE_SIZE', '1024'))
+# Each worker of the segmented video engine gets at least this many frames; progress of
+# running segments is reported (and cancellation noticed) about this often
+MIN_SEGMENT_FRAMES = 50
+SEGMENT_PROGRESS_SECONDS = 0.5
+# A running job writes its progress to its state file at most this often
+JOB_STATE_WRITE_SECONDS = 0.5
+# Video preview: default and maximum sampled frames, longest side of each processed frame,
+# and the frame gap above which the reader seeks instead of decoding through
+PREVIEW_FRAMES = 12
+PREVIEW_MAX_FRAMES = 48
+PREVIEW_MAX_SIDE = int(os.environ.get('PREVIEW_MAX_SIDE', '480'))
+PREVIEW_SEEK_MIN_GAP = 30
+# Admission control estimates: full-size colour buffers alive at once while an image is processed
+# (the decoded frame, worked on in place, and the encoder output), and per video frame being processed
+IMAGE_PEAK_FRAME_COPIES = 2
+VIDEO_FRAME_COPIES = 4
+# Assumed decoded/encoded size ratio for images whose header cannot be read
+IMAGE_FALLBACK_EXPANSION = 10
+
+
+# --- Instrumentation ---
+def _format_labels(pairs):
+    """Renders [(name, value), ...] as a Prometheus label set ('' when empty)."""
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """
+    Prometheus histogram with optional labels, exposed by /metrics.
+
+    Values live in the server process, so with several gunicorn workers each worker
+    reports its own series (scrape them per worker or use a single worker).
+    """
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # Label values -> [cumulative bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        """Returns the metric's lines in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in snapshot:
+            labels = list(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', f'{bound:g}')])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]:.6g}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """
+    Prometheus gauge whose value is read from a callback when /metrics is scraped.
+
+    Also used for callback-backed counters (metric_type='counter').
+    """
+
+    def __init__(self, name, documentation, read_value, metric_type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.read_value = read_value
+        self.metric_type = metric_type
+        metrics_registry.append(self)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}",
+                f"{self.name} {self.read_value():.6g}"]
+
+
+metrics_registry = []
+STAGE_SECONDS = Histogram(
+    "watermark_stage_seconds", "Time per request spent in each processing stage (summed over frames and workers).",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300), ("kind", "stage")
+)
+VIDEO_FPS = Histogram(
+    "watermark_video_fps", "Throughput of processed videos in frames per second.",
+    (1, 2, 5, 10, 15, 25, 30, 60, 120, 240)
+)
+PAYLOAD_BYTES = Histogram(
+    "watermark_payload_bytes", "Size of uploaded inputs (direction=in) and produced results (direction=out).",
+    (1e4, 1e5, 1e6, 1e7, 1e8, 1e9), ("kind", "direction")
+)
+QUEUE_DEPTH = Histogram(
+    "watermark_queue_depth", "Items already waiting in a queue when a new one is added.",
+    (0, 1, 2, 4, 8, 16, 32, 64), ("queue",)
+)
+
+
+class StageTimer:
+    """
+    Wall-clock time per processing stage of one request, reported as `details.timings_ms`.
+
+    A stage may be entered many times (e.g. once per video frame); its times add up.
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """Context manager timing one pass through `stage`."""
+        span_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - span_started)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def as_ms(self):
+        """Stage totals in milliseconds, plus 'total' (time since the timer was created)."""
+        with self._lock:
+            timings = {stage: round(seconds * 1000, 2) for stage, seconds in self.seconds.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+    def observe(self, kind):
+        """Records every stage total in the STAGE_SECONDS histogram."""
+        with self._lock:
+            stage_totals = list(self.seconds.items())
+        stage_totals.append(("total", time.perf_counter() - self.started))
+        for stage, seconds in stage_totals:
+            STAGE_SECONDS.observe(seconds, kind=kind, stage=stage)
+
+# --- Resource Governor ---
+try:
+    from PIL import Image as PILImage  # Header-only dimension reads for admission control
+    PIL_DEFAULT_MAX_PIXELS = PILImage.MAX_IMAGE_PIXELS # Raised to fit the memory budget, see _configure_resource_budgets
+except ImportError:
+    PILImage = None
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request's memory cannot be reserved; carries the HTTP status to answer with."""
+
+    def __init__(self, message, http_status=503, retry_after=None):
+        super().__init__(message)
+        self.http_status = http_status
+        self.retry_after = retry_after
+
+
+class MemoryGovernor:
+    """
+    Admission control for one server process: the estimated peak memory of all requests
+    being processed at once stays within `budget_bytes`.
+
+    A request that does not fit waits until running requests release enough; one larger
+    than the whole budget is refused straight away. A budget <= 0 admits everything.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.reserved_bytes = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self):
+        return self.budget_bytes > 0
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes, timeout=None, timer=None):
+        """
+        Holds `nbytes` of the budget for the duration of the with-block.
+
+        Args:
+            nbytes (int): Estimated peak memory of the request.
+            timeout (float, optional): Seconds to wait for room; None waits indefinitely.
+            timer (StageTimer, optional): Receives the wait as 'admission_wait'.
+
+        Raises:
+            AdmissionRejectedError: 413 if `nbytes` exceeds the whole budget, 503 on timeout.
+        """
+        if not self.enabled:
+            yield
+            return
+        wait_started = time.perf_counter()
+        with self._condition:
+            if nbytes > self.budget_bytes:
+                self.rejected += 1
+                raise AdmissionRejectedError(
+                    f"Request needs ~{nbytes / 2 ** 20:.0f} MB, more than this server's "
+                    f"{self.budget_bytes / 2 ** 20:.0f} MB memory budget.", http_status=413
+                )
+            QUEUE_DEPTH.observe(self.waiting, queue="admission")
+            self.waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self.reserved_bytes + nbytes <= self.budget_bytes,
+                                                    timeout)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.rejected += 1
+                raise AdmissionRejectedError("Server is busy with other large requests. Try again later.",
+                                             http_status=503, retry_after=app.config['ADMISSION_RETRY_AFTER'])
+            self.reserved_bytes += nbytes
+        if timer is not None:
+            timer.add("admission_wait", time.perf_counter() - wait_started)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.reserved_bytes -= nbytes
+                self._condition.notify_all()
+
+
+def _detect_memory_limit():
+    """Returns the container (cgroup) memory limit or the physical memory in bytes, whichever is lower."""
+    limits = []
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as limit_file:
+                value = limit_file.read().strip()
+        except OSError:
+            continue
+        if value.isdigit(): # 'max' means unlimited
+            limits.append(int(value))
+    try:
+        limits.append(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+    except (AttributeError, ValueError, OSError):
+        pass # Not available on Windows
+    return min(limits) if limits else None
+
+
+def read_image_dimensions(image_bytes):
+    """
+    Returns (width, height) from the image header without decoding the pixels, or None.
+
+    Raises:
+        AdmissionRejectedError: 413 if the header exceeds Pillow's decompression bomb limit.
+    """
+    if PILImage is None:
+        return None
+    try:
+        with PILImage.open(io.BytesIO(bytes(image_bytes[:IMAGE_HEADER_BYTES]))) as image:
+            return image.size
+    except PILImage.DecompressionBombError as bomb_err:
+        raise AdmissionRejectedError(f"Image is too large to process: {bomb_err}", http_status=413)
+    except Exception:
+        return None
+
+
+def estimate_image_peak_bytes(image_bytes):
+    """Estimated peak memory of processing one image (upload, full-size frame copies and the mask)."""
+    dimensions = read_image_dimensions(image_bytes)
+    if dimensions is None:
+        return len(image_bytes) * IMAGE_FALLBACK_EXPANSION
+    width, height = dimensions
+    return len(image_bytes) + width * height * (3 * IMAGE_PEAK_FRAME_COPIES + 1)
+
+
+def estimate_video_peak_bytes(video_path, workers=1, pipeline_threads=0, max_in_flight=0, preview=False):
+    """
+    Estimated peak memory of processing a video with the given engine settings, based on the
+    frame size in the container header.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        cap.release()
+    if frame_width <= 0 or frame_height <= 0:
+        return 0 # Unreadable; the helper reports the error
+    frame_bytes = frame_width * frame_height * 3
+    mask_bytes = frame_width * frame_height
+    if preview:
+        # One full-size frame at a time, plus the small processed tiles and the sheet
+        return 2 * frame_bytes + mask_bytes + 2 * PREVIEW_MAX_FRAMES * PREVIEW_MAX_SIDE ** 2 * 3
+    if workers > 1:
+        return workers * (VIDEO_FRAME_COPIES * frame_bytes + mask_bytes)
+    if pipeline_threads > 1:
+        in_flight = max(max_in_flight or 2 * pipeline_threads, pipeline_threads + 1)
+        return (in_flight + (VIDEO_FRAME_COPIES - 1) * pipeline_threads) * frame_bytes + mask_bytes
+    return VIDEO_FRAME_COPIES * frame_bytes + mask_bytes
+
+
+def _configure_resource_budgets():
+    """Splits the server-wide CPU thread and memory budgets across worker processes (see `memory_governor`)."""
+    server_workers = max(1, app.config['WEB_CONCURRENCY'])
+    cv_threads = max(1, app.config['CPU_THREAD_BUDGET'] // server_workers)
+    cv2.setNumThreads(cv_threads)
+    memory_budget = app.config['MEMORY_BUDGET_BYTES']
+    if memory_budget == 0:
+        detected_limit = _detect_memory_limit()
+        memory_budget = int(detected_limit * 0.75) if detected_limit else -1
+    worker_budget = memory_budget // server_workers if memory_budget > 0 else -1
+    logger.info(f"[APP] Per-worker budget ({server_workers} worker(s)): {cv_threads} OpenCV thread(s), "
+                f"{f'{worker_budget / 2 ** 20:.0f} MB' if worker_budget > 0 else 'unlimited'} memory.")
+    memory_governor.budget_bytes = worker_budget
+    if PILImage is not None and worker_budget > 0:
+        # Let headers of images that fit the budget through Pillow's bomb check; the governor refuses
+        # the rest. Without a budget Pillow's own limit stays in place.
+        budget_pixels = worker_budget // (3 * IMAGE_PEAK_FRAME_COPIES + 1)
+        PILImage.MAX_IMAGE_PIXELS = max(PIL_DEFAULT_MAX_PIXELS, budget_pixels)
+
+
+# Unlimited until the server process is set up (`_setup_server_process`); the CLI and the
+# segmented engine's workers import this module and keep it that way
+memory_governor = MemoryGovernor(-1)
+Gauge("watermark_memory_budget_bytes", "Memory budget of this worker process (-1 = unlimited).",
+      lambda: memory_governor.budget_bytes)
+Gauge("watermark_memory_reserved_bytes", "Estimated peak memory of the requests being processed.",
+      lambda: memory_governor.reserved_bytes)
+Gauge("watermark_admission_rejected_total", "Requests refused by admission control (413 or 503).",
+      lambda: memory_governor.rejected, metric_type="counter")
+
+
+# --- Output Encoding ---
+def detect_image_format(image_bytes):
+    """Returns the IMAGE_OUTPUT_FORMATS name matching the data's signature ('png' if unknown)."""
+    header = bytes(image_bytes[:12])
+    if header.startswith(b'\xff\xd8'):
+        return "jpeg"
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return "webp"
+    return "png"
+
+
+# --- Mask Preparation ---
+def prepare_mask(mask_bytes, width, height, log_prefix="IMG"):
+    """
+    Decodes a PNG mask, resizes it to the target size and thresholds it to 0/255.
+
+    Args:
+        mask_bytes (bytes): Raw bytes of the PNG mask image.
+        width (int): Target width.
+        height (int): Target height.
+        log_prefix (str, optional): Tag for log lines ("IMG", "VID", ...).
+
+    Returns:
+        np.ndarray or None: The binary mask, or None if it could not be decoded or is empty.
+    """
+    nparr_mask = np.frombuffer(mask_bytes, np.uint8)
+    decoded_mask = cv2.imdecode(nparr_mask, cv2.IMREAD_GRAYSCALE)
+    if decoded_mask is None:
+        logger.warning(f"[{log_prefix}] Could not decode received mask data.")
+        return None
+    # Resize mask if needed
+    if decoded_mask.shape[0] != height or decoded_mask.shape[1] != width:
+        logger.warning(f"[{log_prefix}] Resizing mask from {decoded_mask.shape} to {(height, width)}")
+        mask = cv2.resize(decoded_mask, (width, height), interpolation=cv2.INTER_NEAREST)
+    else:
+        mask = decoded_mask
+    # Ensure mask is binary (0 or 255)
+    _, mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY) # Use 127 threshold for safety
+    # Check if mask contains anything to inpaint
+    if cv2.countNonZero(mask) == 0:
+        logger.warning(f"[{log_prefix}] Provided mask was empty (all black). No inpainting needed.")
+        return None
+    logger.info(f"[{log_prefix}] Valid mask loaded.")
+    return mask
+
+
+class PreparedMask:
+    """
+    A mask prepared for one frame size, plus derived data computed on first use and kept.
+
+    Holds the binary mask from `prepare_mask` (None if it was undecodable or empty), its
+    non-empty flag, the padded region boxes per margin (`compute_mask_rois`) and the feathered
+    blend weights of the dilated mask per blur kernel (`mask_blur_regions`). Entries are shared
+    between requests through `mask_cache`, so all arrays are read-only.
+    """
+
+    def __init__(self, mask):
+        if mask is not None:
+            mask.flags.writeable = False
+        self.mask = mask
+        self.non_empty = mask is not None
+        self._rois = {}
+        self._blur_regions = {}
+        self._lock = threading.Lock()
+
+    def rois(self, margin):
+        """Memoized `compute_mask_rois(mask, margin)`; [] for an empty mask."""
+        with self._lock:
+            if margin not in self._rois:
+                self._rois[margin] = compute_mask_rois(self.mask, margin) if self.non_empty else []
+            return self._rois[margin]
+
+    def blur_regions(self, kernel_size):
+        """Memoized `mask_blur_regions(mask, kernel_size)`; [] for an empty mask."""
+        with self._lock:
+            if kernel_size not in self._blur_regions:
+                regions = mask_blur_regions(self.mask, kernel_size) if self.non_empty else []
+                for _, alpha in regions:
+                    alpha.flags.writeable = False
+                self._blur_regions[kernel_size] = regions
+            return self._blur_regions[kernel_size]
+
+    @property
+    def nbytes(self):
+        """Memory held by the mask and its derived arrays."""
+        total = self.mask.nbytes if self.mask is not None else 0
+        for regions in list(self._blur_regions.values()):
+            total += sum(alpha.nbytes for _, alpha in regions)
+        return total
+
+
+class MaskCache:
+    """
+    In-process LRU cache of PreparedMask entries, keyed by (mask hash, width, height).
+
+    Clients reuse a handful of watermark masks at a few resolutions, so decoding, resizing,
+    thresholding and region analysis happen once per combination instead of per request.
+    Entries grow as derived data is added to them; the least recently used ones are dropped
+    whenever the total exceeds `max_bytes`. Safe to use from worker threads.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, mask_bytes, width, height, log_prefix="IMG"):
+        """Returns the PreparedMask of `mask_bytes` at width x height, preparing it on a miss."""
+        key = (hashlib.sha256(mask_bytes).hexdigest(), width, height)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            entry = PreparedMask(prepare_mask(mask_bytes, width, height, log_prefix=log_prefix))
+            with self._lock:
+                self.misses += 1
+                if self.max_bytes > 0:
+                    entry = self._entries.setdefault(key, entry) # Another thread may have prepared it meanwhile
+        else:
+            logger.debug("[%s] Prepared mask cache hit (%dx%d).", log_prefix, width, height)
+        self._evict()
+        return entry
+
+    def _evict(self):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            total_bytes = sum(entry.nbytes for entry in self._entries.values())
+            while self._entries and total_bytes > self.max_bytes:
+                _, entry = self._entries.popitem(last=False)
+                total_bytes -= entry.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry.nbytes for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+mask_cache = MaskCache(app.config['MASK_CACHE_MAX_BYTES'])
+Gauge("watermark_mask_cache_hits_total", "Prepared mask cache hits.", lambda: mask_cache.hits,
+      metric_type="counter")
+Gauge("watermark_mask_cache_misses_total", "Prepared mask cache misses.", lambda: mask_cache.misses,
+      metric_type="counter")
+Gauge("watermark_mask_cache_evictions_total", "Prepared masks evicted from the cache.",
+      lambda: mask_cache.evictions, metric_type="counter")
+Gauge("watermark_mask_cache_bytes", "Memory held by cached prepared masks.",
+      lambda: mask_cache.stats()["bytes"])
+
+
+# --- Inpainting Helpers ---
+def compute_mask_rois(mask, margin):
+    """
+    Splits a binary mask into connected regions and returns their padded bounding boxes.
+
+    Each component's bounding box is grown by `margin` pixels (clipped to the frame),
+    and boxes that overlap after padding are merged, so every returned box contains
+    whole components plus the known pixels TELEA reads around them.
+
+    Args:
+        mask (np.ndarray): Single-channel binary mask (0 or 255).
+        margin (int): Padding in pixels around each component (use the inpaint radius + 1).
+
+    Returns:
+        list: (x0, y0, x1, y1) boxes, end-exclusive. Empty if the mask has no pixels set.
+    """
+    mask_h, mask_w = mask.shape[:2]
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    boxes = []
+    for label in range(1, num_labels):  # Label 0 is the background
+        x, y, w, h = stats[label, :4]
+        boxes.append([max(0, x - margin), max(0, y - margin),
+                      min(mask_w, x + w + margin), min(mask_h, y + h + margin)])
+
+    # Merge overlapping boxes until no two boxes intersect
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while boxes:
+            box = boxes.pop()
+            i = 0
+            while i < len(boxes):
+                other = boxes[i]
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    box = [min(box[0], other[0]), min(box[1], other[1]),
+                           max(box[2], other[2]), max(box[3], other[3])]
+                    boxes.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append(box)
+        boxes = result
+    return [tuple(int(v) for v in box) for box in boxes]
+
+
+def inpaint_mask_regions(frame, mask, inpaint_radius, rois=None, flags=cv2.INPAINT_TELEA, pyramid_threshold=None,
+                         dst=None, workers=1):
+    """
+    Inpaints only the masked regions of a frame instead of the whole frame.
+
+    Each region is cropped with a margin of the inpaint radius, inpainted on its own
+    and pasted back. The result matches a full-frame `cv2.inpaint` call because TELEA
+    only reads pixels within the radius of the hole. The merged regions are disjoint, so
+    `dst` may be `frame` itself: each crop is read before anything is written into it.
+
+    Args:
+        frame (np.ndarray): BGR input frame. Not modified unless passed as `dst`.
+        mask (np.ndarray): Single-channel binary mask with the frame's dimensions.
+        inpaint_radius (int): Radius passed to `cv2.inpaint`.
+        rois (list, optional): Precomputed boxes from `compute_mask_rois`. Computed if None.
+        flags (int, optional): Inpainting algorithm. Defaults to cv2.INPAINT_TELEA.
+        pyramid_threshold (int, optional): Regions with at least this many masked pixels use
+            `inpaint_pyramid` instead of a full-resolution call. None disables it.
+        dst (np.ndarray, optional): Preallocated output with the frame's shape and dtype; may
+            be `frame` to inpaint in place. A new array is allocated if None.
+        workers (int, optional): Threads that inpaint regions concurrently. The boxes are
+            disjoint, so each thread writes only its own. Defaults to 1.
+
+    Returns:
+        np.ndarray: The inpainted frame (`dst` if given).
+    """
+    def inpaint(src, src_mask, out=None):
+        if pyramid_threshold is not None and cv2.countNonZero(src_mask) >= pyramid_threshold:
+            result = inpaint_pyramid(src, src_mask, inpaint_radius, flags=flags)
+            if out is None:
+                return result
+            np.copyto(out, result)
+            return out
+        return cv2.inpaint(src, src_mask, inpaintRadius=inpaint_radius, flags=flags, dst=out)
+
+    if rois is None:
+        rois = compute_mask_rois(mask, inpaint_radius + 1)
+    if dst is None:
+        dst = frame.copy()
+    elif dst is not frame:
+        np.copyto(dst, frame)
+    if not rois:
+        return dst
+
+    frame_h, frame_w = frame.shape[:2]
+    roi_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rois)
+    if workers <= 1 and roi_area > ROI_MAX_AREA_FRACTION * frame_h * frame_w:
+        # cv2.inpaint supports dst aliasing src: it works on dst after copying src into it
+        return inpaint(dst, mask, out=dst)
+
+    def inpaint_roi(box):
+        x0, y0, x1, y1 = box
+        # Crop-sized temporary; the crop view into dst is written only after it is read
+        dst[y0:y1, x0:x1] = inpaint(dst[y0:y1, x0:x1], mask[y0:y1, x0:x1])
+
+    if workers > 1 and len(rois) > 1:
+        # Largest regions first, so one big region does not start last and hold up the rest
+        ordered = sorted(rois, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inpaint") as pool:
+            list(pool.map(inpaint_roi, ordered)) # cv2.inpaint releases the GIL
+    else:
+        for box in rois:
+            inpaint_roi(box)
+    return dst
+
+
+def inpaint_pyramid(frame, mask, inpaint_radius, flags=cv2.INPAINT_TELEA, levels=None, band_width=None):
+    """
+    Multi-scale inpainting for large holes: fill at low resolution, refine the edge at full resolution.
+
+    The frame is downscaled by 2**levels, inpainted there, and the fill is upsampled into the
+    hole. A band of `band_width` pixels along the inside of the hole boundary - where the
+    upsampled fill meets real pixels and seams would show - is then inpainted again at full
+    resolution. TELEA cost grows with the hole area, so this is much cheaper for big masks.
+
+    Args:
+        frame (np.ndarray): BGR input. Not modified.
+        mask (np.ndarray): Binary mask with the frame's dimensions.
+        inpaint_radius (int): Radius for both inpainting passes.
+        flags (int, optional): Inpainting algorithm. Defaults to cv2.INPAINT_TELEA.
+        levels (int, optional): Pyramid levels; by default chosen so the low-res hole has
+            about PYRAMID_TARGET_MASKED_PIXELS pixels (at most PYRAMID_MAX_LEVELS).
+        band_width (int, optional): Full-resolution refinement band. Defaults to twice the
+            downscale factor, at least the inpaint radius.
+
+    Returns:
+        np.ndarray: The inpainted frame (a new array).
+    """
+    frame_h, frame_w = frame.shape[:2]
+    if levels is None:
+        masked_pixels = cv2.countNonZero(mask)
+        levels = 0
+        while levels < PYRAMID_MAX_LEVELS and masked_pixels / (4 ** levels) > PYRAMID_TARGET_MASKED_PIXELS:
+            levels += 1
+    scale = 2 ** levels
+    small_w, small_h = max(1, frame_w // scale), max(1, frame_h // scale)
+    if levels == 0 or min(small_w, small_h) < 2 * inpaint_radius:
+        return cv2.inpaint(frame, mask, inpaintRadius=inpaint_radius, flags=flags)
+
+    # 1. Inpaint a downscaled copy; any partially covered low-res pixel counts as hole
+    small_frame = cv2.resize(frame, (small_w, small_h), interpolation=cv2.INTER_AREA)
+    small_mask = cv2.resize(mask, (small_w, small_h), interpolation=cv2.INTER_AREA)
+    _, small_mask = cv2.threshold(small_mask, 0, 255, cv2.THRESH_BINARY)
+    small_filled = cv2.inpaint(small_frame, small_mask, inpaintRadius=inpaint_radius, flags=flags)
+
+    # 2. Upsample the fill into the hole
+    result = frame.copy()
+    upsampled = cv2.resize(small_filled, (frame_w, frame_h), interpolation=cv2.INTER_LINEAR)
+    hole = mask > 0
+    np.copyto(result, upsampled, where=hole[..., None] if result.ndim == 3 else hole)
+
+    # 3. Refine the boundary band at full resolution
+    if band_width is None:
+        band_width = max(inpaint_radius, 2 * scale)
+    band_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * band_width + 1, 2 * band_width + 1))
+    band_mask = cv2.subtract(mask, cv2.erode(mask, band_kernel))
+    band_rois = compute_mask_rois(band_mask, inpaint_radius + 1)
+    return inpaint_mask_regions(result, band_mask, inpaint_radius, rois=band_rois, flags=flags)
+
+
+class PatchReuseInpainter:
+    """
+    Inpaints video frames with a static mask, reusing the previous patch when the
+    surroundings of a mask region have not changed.
+
+    For every region the ring of known pixels around the hole (the pixels TELEA reads)
+    is compared with the ring of the frame the patch was last computed from. If the
+    mean absolute difference stays under `threshold`, the cached patch is pasted into
+    the hole; otherwise (motion, scene cut) the region is inpainted again and becomes
+    the new reference. Comparing against the reference rather than the previous frame
+    keeps slow drift from accumulating.
+    """
+
+    def __init__(self, mask, inpaint_radius, threshold, rois=None):
+        """
+        Args:
+            mask (np.ndarray): Static single-channel binary mask.
+            inpaint_radius (int): Radius passed to `cv2.inpaint`.
+            threshold (float): Max mean absolute ring difference (0-255) for reuse.
+            rois (list, optional): Precomputed boxes from `compute_mask_rois`.
+        """
+        self.mask = mask
+        self.inpaint_radius = inpaint_radius
+        self.threshold = float(threshold)
+        self.rois = rois if rois is not None else compute_mask_rois(mask, inpaint_radius + 1)
+        ring_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * inpaint_radius + 1,) * 2)
+        self.regions = []
+        for x0, y0, x1, y1 in self.rois:
+            hole = mask[y0:y1, x0:x1]
+            ring = cv2.subtract(cv2.dilate(hole, ring_kernel), hole)
+            self.regions.append({
+                "box": (x0, y0, x1, y1),
+                "hole": hole,
+                "hole_bool": hole > 0,
+                "ring": ring,
+                "reference": None,  # Frame crop the cached patch was computed from
+                "patch": None,      # Inpainted crop
+            })
+        self.patches_total = 0
+        self.patches_reused = 0
+
+    def process(self, frame):
+        """Returns the inpainted frame (a new array); `frame` is not modified."""
+        result = frame.copy()
+        for region in self.regions:
+            x0, y0, x1, y1 = region["box"]
+            crop = frame[y0:y1, x0:x1]
+            self.patches_total += 1
+            if region["reference"] is not None:
+                ring_diff = cv2.mean(cv2.absdiff(crop, region["reference"]), mask=region["ring"])
+                channels = crop.shape[2] if crop.ndim == 3 else 1
+                if sum(ring_diff[:channels]) / channels <= self.threshold:
+                    np.copyto(result[y0:y1, x0:x1], region["patch"], where=region["hole_bool"][..., None])
+                    self.patches_reused += 1
+                    continue
+            patch = cv2.inpaint(crop, region["hole"], inpaintRadius=self.inpaint_radius, flags=cv2.INPAINT_TELEA)
+            region["reference"] = crop.copy()
+            region["patch"] = patch
+            result[y0:y1, x0:x1] = patch
+        return result
+
+    @property
+    def reuse_ratio(self):
+        """Fraction of region patches served from the cache (0.0 if nothing processed)."""
+        return self.patches_reused / self.patches_total if self.patches_total else 0.0
+
+class VideoFrameProcessor:
+    """
+    Per-frame work of the video helper: static-mask inpainting followed by optional blur.
+
+    Instances are picklable, so the segmented engine can ship one to each worker
+    process; each copy keeps its own patch-reuse state.
+    """
+
+    def __init__(self, mask=None, blur_kernel_size=0, reuse_threshold=0, blur_mode="full", rois=None,
+                 blur_regions=None):
+        """
+        Args:
+            mask (np.ndarray, optional): Static binary mask. None means no inpainting.
+            blur_kernel_size (int, optional): Odd Gaussian kernel size, 0 for no blur.
+            reuse_threshold (float, optional): Enables PatchReuseInpainter when > 0.
+            blur_mode (str, optional): 'full' or 'mask', see `apply_blur`.
+            rois (list, optional): Precomputed inpaint boxes for the mask (margin
+                VIDEO_INPAINT_RADIUS + 1). Computed if None.
+            blur_regions (list, optional): Precomputed `mask_blur_regions` for mode 'mask'.
+                Computed if None.
+        """
+        self.mask = mask
+        self.blur_kernel_size = blur_kernel_size
+        self.blur_mode = blur_mode
+        if rois is None:
+            rois = compute_mask_rois(mask, VIDEO_INPAINT_RADIUS + 1) if mask is not None else []
+        self.rois = rois
+        # The feathered blend weights are the same for every frame, so compute them once
+        if blur_regions is None and blur_mode == "mask" and mask is not None and blur_kernel_size > 0:
+            blur_regions = mask_blur_regions(mask, blur_kernel_size)
+        self.blur_regions = blur_regions
+        self.patch_reuser = None
+        if self.rois and reuse_threshold > 0:
+            self.patch_reuser = PatchReuseInpainter(mask, VIDEO_INPAINT_RADIUS, reuse_threshold, rois=self.rois)
+        # Seconds spent per stage by this copy (plain floats, so the processor stays picklable)
+        self.stage_seconds = {}
+
+    def process(self, frame):
+        """Returns the processed frame."""
+        processed_frame = frame
+        if self.rois:
+            started = time.perf_counter()
+            if self.patch_reuser is not None:
+                processed_frame = self.patch_reuser.process(frame)
+            else:
+                processed_frame = inpaint_mask_regions(frame, self.mask, VIDEO_INPAINT_RADIUS, rois=self.rois)
+            self._add_stage_time("inpaint", started)
+        if self.blur_kernel_size > 0:
+            started = time.perf_counter()
+            processed_frame = apply_blur(processed_frame, self.blur_kernel_size, mask=self.mask, mode=self.blur_mode,
+                                         blur_regions=self.blur_regions)
+            self._add_stage_time("blur", started)
+        return processed_frame
+
+    def _add_stage_time(self, stage, started):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - started
+
+    def patch_counts(self):
+        """Returns (patches_total, patches_reused) from temporal patch reuse."""
+        if self.patch_reuser is None:
+            return 0, 0
+        return self.patch_reuser.patches_total, self.patch_reuser.patches_reused
+
+
+# --- Blur Engine ---
+def blur_downscale_factor(kernel_size, exact=False):
+    """Downscale factor `gaussian_blur` uses for `kernel_size` (1 means the exact filter)."""
+    sigma = 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+    factor = int(sigma // 3)
+    if exact or kernel_size < BLUR_APPROX_MIN_KERNEL or factor < 2:
+        return 1
+    return factor
+
+
+def gaussian_blur(img, kernel_size, exact=False, dst=None):
+    """
+    Gaussian blur with the sigma OpenCV derives from `kernel_size`, approximated for big kernels.
+
+    From BLUR_APPROX_MIN_KERNEL up, the image is downscaled (INTER_AREA), blurred with the
+    equivalent smaller sigma and upscaled again, which costs a fraction of the exact
+    separable filter and stays within a few intensity levels of it (see
+    benchmarks/bench_blur.py).
+
+    Args:
+        img (np.ndarray): Input image. Not modified unless passed as `dst`.
+        kernel_size (int): Odd kernel size, as passed to cv2.GaussianBlur.
+        exact (bool, optional): Always use cv2.GaussianBlur. Defaults to False.
+        dst (np.ndarray, optional): Preallocated output with the image's shape and dtype; may
+            be `img` to blur in place. A new array is allocated if None.
+
+    Returns:
+        np.ndarray: The blurred image (`dst` if given).
+    """
+    # Same sigma cv2.GaussianBlur uses when sigma=0
+    sigma = 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+    factor = blur_downscale_factor(kernel_size, exact=exact)
+    if factor == 1:
+        return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0, dst=dst)
+
+    img_h, img_w = img.shape[:2]
+    small = cv2.resize(img, (max(1, img_w // factor), max(1, img_h // factor)), interpolation=cv2.INTER_AREA)
+    # Area downsampling already applied a box filter of variance (factor^2 - 1) / 12
+    small_sigma = max(0.5, np.sqrt(max(sigma ** 2 - (factor ** 2 - 1) / 12, 0.25)) / factor)
+    small_kernel = int(2 * round(3 * small_sigma) + 1)
+    small = cv2.GaussianBlur(small, (small_kernel, small_kernel), small_sigma)
+    return cv2.resize(small, (img_w, img_h), dst=dst, interpolation=cv2.INTER_LINEAR)
+
+
+def mask_blur_regions(mask, kernel_size):
+    """
+    Blend weights for `blur_mask_region`: the dilated, feathered mask per padded region box.
+
+    Args:
+        mask (np.ndarray): Binary mask.
+        kernel_size (int): Odd Gaussian kernel size of the blur.
+
+    Returns:
+        list: ((x0, y0, x1, y1), alpha) pairs; alpha is float32 in [0, 1], 1 inside the hole.
+    """
+    feather = kernel_size // 2 + 1
+    # Rectangular element: separable, so cheap even at large kernels; the feather rounds it off
+    dilate_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * feather + 1, 2 * feather + 1))
+    regions = []
+    # The padding covers the dilation, the feather and the blur's own support
+    for x0, y0, x1, y1 in compute_mask_rois(mask, 3 * feather + 1):
+        region = cv2.dilate(mask[y0:y1, x0:x1], dilate_kernel)
+        alpha = gaussian_blur(region, 2 * feather + 1).astype(np.float32) / 255.0
+        alpha = cv2.max(alpha, (mask[y0:y1, x0:x1] > 0).astype(np.float32)) # Hole itself fully blurred
+        regions.append(((x0, y0, x1, y1), alpha))
+    return regions
+
+
+def blur_mask_region(img, mask, kernel_size, exact=False, dst=None, regions=None):
+    """
+    Blurs only around the mask, feathering into the untouched surroundings.
+
+    The mask is dilated by the kernel radius, and the blurred pixels are alpha-blended in with a
+    feathered (blurred) copy of that dilated mask. Only the bounding boxes of the mask regions
+    (padded by the kernel size) are filtered, so cost scales with the mask, not the frame.
+    The boxes are disjoint, so `dst` may be `img` itself.
+
+    Args:
+        img (np.ndarray): BGR input. Not modified unless passed as `dst`.
+        mask (np.ndarray): Binary mask with the image's dimensions.
+        kernel_size (int): Odd Gaussian kernel size.
+        exact (bool, optional): Passed to `gaussian_blur`. Defaults to False.
+        dst (np.ndarray, optional): Preallocated output; may be `img`. A new array if None.
+        regions (list, optional): Precomputed `mask_blur_regions(mask, kernel_size)`, e.g. from
+            a PreparedMask. Computed if None.
+
+    Returns:
+        np.ndarray: The image with the masked area blurred (`dst` if given).
+    """
+    if dst is None:
+        dst = img.copy()
+    elif dst is not img:
+        np.copyto(dst, img)
+    if regions is None:
+        regions = mask_blur_regions(mask, kernel_size)
+    for (x0, y0, x1, y1), alpha in regions:
+        crop = dst[y0:y1, x0:x1]
+        blurred = gaussian_blur(crop, kernel_size, exact=exact)
+        if crop.ndim == 3:
+            alpha = alpha[..., None]
+        dst[y0:y1, x0:x1] = (blurred * alpha + crop * (1.0 - alpha) + 0.5).astype(np.uint8)
+    return dst
+
+
+def apply_blur(img, kernel_size, mask=None, mode="full", exact=False, dst=None, blur_regions=None):
+    """
+    Blur step shared by the image and video helpers.
+
+    Args:
+        img (np.ndarray): Input image. Not modified unless passed as `dst`.
+        kernel_size (int): Odd Gaussian kernel size; 0 returns `img` unchanged (or copied into `dst`).
+        mask (np.ndarray, optional): Binary mask, needed for mode 'mask'.
+        mode (str, optional): 'full' blurs the whole frame, 'mask' only the (feathered) mask
+            area. 'mask' without a mask falls back to 'full'. Defaults to 'full'.
+        exact (bool, optional): Disable the large-kernel approximation. Defaults to False.
+        dst (np.ndarray, optional): Preallocated output; may be `img` to blur in place.
+        blur_regions (list, optional): Precomputed blend weights for mode 'mask', see
+            `blur_mask_region`.
+
+    Returns:
+        np.ndarray: The blurred image (`dst` if given).
+    """
+    if kernel_size <= 0:
+        if dst is None or dst is img:
+            return img
+        np.copyto(dst, img)
+        return dst
+    if mode == "mask" and mask is not None:
+        return blur_mask_region(img, mask, kernel_size, exact=exact, dst=dst, regions=blur_regions)
+    return gaussian_blur(img, kernel_size, exact=exact, dst=dst)
+
+
+# --- Tiled Image Engine ---
+def tile_boxes(width, height, tile_size):
+    """Splits a width x height frame into (x0, y0, x1, y1) tiles of at most tile_size square."""
+    return [(x0, y0, min(width, x0 + tile_size), min(height, y0 + tile_size))
+            for y0 in range(0, height, tile_size) for x0 in range(0, width, tile_size)]
+
+
+def blur_tiled(img, kernel_size, mask=None, mode="full", exact=False, blur_regions=None, workers=1,
+               tile_size=IMAGE_TILE_SIZE):
+    """
+    `apply_blur` for very large images: tiles are blurred concurrently with bounded working memory.
+
+    Each tile is blurred from a crop padded by the kernel's reach, so it sees the same pixels
+    a whole-frame blur would and no seams appear. The exact filter gives identical results.
+    For the large-kernel approximation, crops and tiles start on multiples of the downscale
+    factor, so that neighbouring tiles sample the same low-resolution grid.
+
+    Mode 'full' writes into a new frame. Mode 'mask' processes only the tiles overlapping
+    the feathered mask regions; it computes them all, then pastes them into `img` in place.
+
+    Args:
+        img (np.ndarray): BGR input. Modified in place in mode 'mask'.
+        kernel_size (int): Odd Gaussian kernel size (> 0).
+        mask (np.ndarray, optional): Binary mask, needed for mode 'mask'.
+        mode (str, optional): 'full' or 'mask', as in `apply_blur`. Defaults to 'full'.
+        exact (bool, optional): Disable the large-kernel approximation. Defaults to False.
+        blur_regions (list, optional): Precomputed `mask_blur_regions` for mode 'mask'.
+        workers (int, optional): Threads blurring tiles. Defaults to 1.
+        tile_size (int, optional): Tile side in pixels. Defaults to IMAGE_TILE_SIZE.
+
+    Returns:
+        tuple: (blurred image, number of tiles processed)
+    """
+    img_h, img_w = img.shape[:2]
+    factor = blur_downscale_factor(kernel_size, exact=exact)
+    tile_size = max(factor, tile_size // factor * factor)
+    pad = kernel_size // 2 + 2 * factor
+
+    def blur_box(x0, y0, x1, y1):
+        crop_x0, crop_y0 = max(0, x0 - pad) // factor * factor, max(0, y0 - pad) // factor * factor
+        crop_x1 = min(img_w, -(-(x1 + pad) // factor) * factor)
+        crop_y1 = min(img_h, -(-(y1 + pad) // factor) * factor)
+        blurred = gaussian_blur(img[crop_y0:crop_y1, crop_x0:crop_x1], kernel_size, exact=exact)
+        return blurred[y0 - crop_y0:y1 - crop_y0, x0 - crop_x0:x1 - crop_x0]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tile") as pool:
+        if mode == "mask" and mask is not None:
+            if blur_regions is None:
+                blur_regions = mask_blur_regions(mask, kernel_size)
+            pieces = []
+            for (rx0, ry0, rx1, ry1), alpha in blur_regions:
+                for tx0, ty0, tx1, ty1 in tile_boxes(img_w, img_h, tile_size):
+                    x0, y0, x1, y1 = max(rx0, tx0), max(ry0, ty0), min(rx1, tx1), min(ry1, ty1)
+                    if x0 < x1 and y0 < y1:
+                        pieces.append(((x0, y0, x1, y1), alpha[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]))
+
+            def blend_piece(piece):
+                (x0, y0, x1, y1), alpha = piece
+                crop = img[y0:y1, x0:x1]
+                if crop.ndim == 3:
+                    alpha = alpha[..., None]
+                return (blur_box(x0, y0, x1, y1) * alpha + crop * (1.0 - alpha) + 0.5).astype(np.uint8)
+
+            # Every piece reads its padded surroundings, so nothing is written until all are done
+            blended = list(pool.map(blend_piece, pieces))
+            for ((x0, y0, x1, y1), _), result in zip(pieces, blended):
+                img[y0:y1, x0:x1] = result
+            return img, len(pieces)
+
+        dst = np.empty_like(img)
+        boxes = tile_boxes(img_w, img_h, tile_size)
+
+        def blur_tile(box):
+            x0, y0, x1, y1 = box
+            dst[y0:y1, x0:x1] = blur_box(x0, y0, x1, y1)
+
+        list(pool.map(blur_tile, boxes))
+        return dst, len(boxes)
+
+
+# --- Segmented Video Engine ---
+# Set in each worker process by _init_segment_worker: a frame counter shared by all segments
+# of the video and an event the parent sets to stop them
+_segment_frames_done = None
+_segment_cancel_event = None
+
+
+def _init_segment_worker(frames_done, cancel_event):
+    """Pool initializer: keeps the shared progress counter and cancel event of this video."""
+    global _segment_frames_done, _segment_cancel_event
+    _segment_frames_done = frames_done
+    _segment_cancel_event = cancel_event
+
+
+def _process_video_segment(video_path, segment_path, frame_processor, fourcc, fps, frame_size,
+                           start_frame, frame_count, cv_threads=1):
+    """
+    Worker process entry point: decodes, processes and encodes one frame range.
+
+    Each frame is added to the shared progress counter; once the parent sets the cancel
+    event the segment stops at its next frame and returns what it has done.
+
+    Args:
+        frame_count (int or None): Frames to process; None reads to the end of the video.
+        cv_threads (int, optional): OpenCV threads for this worker, its share of the parent's budget.
+
+    Returns:
+        tuple: (frames_written, patches_total, patches_reused, stage_seconds)
+    """
+    cv2.setNumThreads(cv_threads)
+    cap = cv2.VideoCapture(video_path)
+    writer = None
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {video_path}")
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        writer = cv2.VideoWriter(segment_path, fourcc, fps, frame_size)
+        if not writer.isOpened():
+            raise ValueError(f"Could not open video writer for segment: {segment_path}")
+        frames_written = 0
+        stage_seconds = frame_processor.stage_seconds
+        stage_seconds.update(decode=0.0, encode=0.0)
+        while frame_count is None or frames_written < frame_count:
+            if _segment_cancel_event is not None and _segment_cancel_event.is_set():
+                break
+            started = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            stage_seconds["decode"] += time.perf_counter() - started
+            processed_frame = frame_processor.process(frame)
+            started = time.perf_counter()
+            writer.write(processed_frame)
+            stage_seconds["encode"] += time.perf_counter() - started
+            frames_written += 1
+            if _segment_frames_done is not None:
+                with _segment_frames_done.get_lock():
+                    _segment_frames_done.value += 1
+        return (frames_written,) + frame_processor.patch_counts() + (stage_seconds,)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+
+
+def process_video_segments(video_path, output_path, frame_processor, fourcc, fps, frame_size,
+                           total_frames, workers, progress_callback=None, timer=None):
+    """
+    Processes a video in parallel: one frame range per worker process, then joins them.
+
+    Segments are written with the lossless FFV1 codec (falling back to the output codec
+    if FFV1 is unavailable), so the final encode in the join is the only lossy step.
+    Segments are joined strictly in frame order.
+
+    Args:
+        video_path (str): Input video path.
+        output_path (str): Final output path.
+        frame_processor (VideoFrameProcessor): Per-frame work, copied to each worker.
+        fourcc (int): Codec of the final output.
+        fps (float): Output frame rate.
+        frame_size (tuple): (width, height).
+        total_frames (int): Frame count reported by the container (may be approximate).
+        workers (int): Number of worker processes / segments.
+        progress_callback (callable, optional): Called as progress_callback(frames_done, total_frames)
+            about every SEGMENT_PROGRESS_SECONDS with the frames processed by all segments so far.
+            If it raises, queued segments are cancelled and running ones stop at their next frame.
+        timer (StageTimer, optional): Receives the workers' per-stage times and the join time.
+
+    Returns:
+        tuple: (frames_written, patches_total, patches_reused)
+    """
+    segment_fourcc = cv2.VideoWriter_fourcc(*'FFV1')
+    probe_path = os.path.join(os.path.dirname(output_path) or '.', f"{uuid.uuid4()}_probe.avi")
+    probe = cv2.VideoWriter(probe_path, segment_fourcc, fps, frame_size)
+    if not probe.isOpened():
+        logger.warning("[VID] FFV1 codec unavailable; segments will use the output codec.")
+        segment_fourcc = fourcc
+    probe.release()
+    if os.path.exists(probe_path):
+        os.remove(probe_path)
+
+    segment_length = -(-total_frames // workers) # Ceiling division
+    segment_base = os.path.splitext(output_path)[0]
+    segment_paths = [f"{segment_base}_seg{i:03d}.avi" for i in range(workers)]
+    logger.info(f"[VID] Segmented engine: {workers} worker(s), ~{segment_length} frames per segment.")
+
+    frames_written = patches_total = patches_reused = 0
+    cv_threads = max(1, cv2.getNumThreads() // workers) # The workers share this process's thread budget
+    mp_context = multiprocessing.get_context('spawn')
+    frames_done = mp_context.Value('q', 0)
+    cancel_event = mp_context.Event()
+    try:
+        # 'spawn' avoids forking a threaded server process (and OpenCV's own thread pool)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_init_segment_worker,
+                                 initargs=(frames_done, cancel_event)) as pool:
+            futures = []
+            for i, segment_path in enumerate(segment_paths):
+                start_frame = i * segment_length
+                # The last segment reads to EOF, since the reported frame count may be short
+                frame_count = segment_length if i < workers - 1 else None
+                futures.append(pool.submit(_process_video_segment, video_path, segment_path, frame_processor,
+                                           segment_fourcc, fps, frame_size, start_frame, frame_count,
+                                           cv_threads))
+            pending = set(futures)
+            reported_frames = -1
+            try:
+                while pending:
+                    done, pending = wait(pending, timeout=SEGMENT_PROGRESS_SECONDS, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        seg_frames, seg_total, seg_reused, seg_stage_seconds = future.result()
+                        patches_total += seg_total
+                        patches_reused += seg_reused
+                        if timer is not None:
+                            for stage, seconds in seg_stage_seconds.items():
+                                timer.add(stage, seconds)
+                        logger.debug("[VID] Segment %d/%d done (%d frames).", futures.index(future) + 1, workers,
+                                     seg_frames)
+                    if progress_callback is not None and frames_done.value != reported_frames:
+                        reported_frames = frames_done.value
+                        progress_callback(reported_frames, total_frames)
+            except BaseException:
+                cancel_event.set() # Running segments stop at their next frame
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        # Join segments in frame order
+        join_started = time.perf_counter()
+        writer = cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+        if not writer.isOpened():
+            raise ValueError(f"Could not open video writer for path: {output_path}")
+        try:
+            for segment_path in segment_paths:
+                segment_cap = cv2.VideoCapture(segment_path)
+                try:
+                    while True:
+                        ret, frame = segment_cap.read()
+                        if not ret:
+                            break
+                        writer.write(frame)
+                        frames_written += 1
+                finally:
+                    segment_cap.release()
+        finally:
+            writer.release()
+        if timer is not None:
+            timer.add("join", time.perf_counter() - join_started)
+        logger.info(f"[VID] Joined {len(segment_paths)} segment(s) into: {output_path}")
+    finally:
+        for segment_path in segment_paths:
+            if os.path.exists(segment_path):
+                try:
+                    os.remove(segment_path)
+                except OSError as remove_err:
+                    logger.error(f"[VID] Could not remove segment file {segment_path}: {remove_err}")
+
+    return frames_written, patches_total, patches_reused
+
+
+# --- Pipelined Video Engine ---
+def _format_stage_stats(stage_counters, wall_seconds):
+    """Turns raw {stage: [frames, busy_seconds]} counters into per-stage throughput figures."""
+    stage_stats = {}
+    for stage, (frames, busy_seconds) in stage_counters.items():
+        stage_stats[stage] = {
+            "frames": frames,
+            "busy_seconds": round(busy_seconds, 3),
+            "fps": round(frames / busy_seconds, 1) if busy_seconds > 0 else None,
+        }
+    stage_stats["wall_seconds"] = round(wall_seconds, 3)
+    stage_stats["wall_fps"] = round(stage_counters["write"][0] / wall_seconds, 1) if wall_seconds > 0 else None
+    return stage_stats
+
+
+def run_frame_pipeline(cap, writer, frame_processor, threads, max_in_flight, total_frames=0,
+                       progress_callback=None, timer=None):
+    """
+    Streams frames through a reader thread, `threads` worker threads and an ordered writer thread.
+
+    Stages are connected by bounded queues, and a semaphore caps the number of frames alive
+    at once (queued, being processed or waiting to be written in order) at `max_in_flight`.
+    OpenCV releases the GIL inside decode, inpaint, blur and encode, so the stages overlap.
+    Each worker thread gets its own copy of `frame_processor` because patch reuse is stateful.
+
+    Args:
+        cap (cv2.VideoCapture): Opened input.
+        writer (cv2.VideoWriter): Opened output.
+        frame_processor (VideoFrameProcessor): Per-frame work.
+        threads (int): Number of worker threads.
+        max_in_flight (int): Upper bound on decoded frames held in memory.
+        total_frames (int, optional): Expected frame count, used for progress output only.
+        progress_callback (callable, optional): Called from the writer thread as
+            progress_callback(frames_written, total_frames); an exception stops the pipeline.
+        timer (StageTimer, optional): Receives decode/encode busy time and the workers' stage times.
+
+    Returns:
+        tuple: (frames_written, patches_total, patches_reused, stage_stats)
+    """
+    max_in_flight = max(max_in_flight, threads + 1)
+    work_queue = queue.Queue(maxsize=max_in_flight)
+    done_queue = queue.Queue(maxsize=max_in_flight)
+    slots = threading.BoundedSemaphore(max_in_flight)
+    stop_event = threading.Event()
+    errors = []
+    counters_lock = threading.Lock()
+    stage_counters = {"read": [0, 0.0], "process": [0, 0.0], "write": [0, 0.0]}
+    processors = [copy.deepcopy(frame_processor) for _ in range(threads)]
+
+    def count(stage, seconds):
+        with counters_lock:
+            stage_counters[stage][0] += 1
+            stage_counters[stage][1] += seconds
+
+    def put(target_queue, item):
+        # Bounded put that gives up when another stage has failed
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            frame_index = 0
+            while not stop_event.is_set():
+                if not slots.acquire(timeout=0.1):
+                    continue
+                started = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    slots.release()
+                    break
+                count("read", time.perf_counter() - started)
+                # A full queue here means the workers, not decoding, are the bottleneck
+                QUEUE_DEPTH.observe(work_queue.qsize(), queue="video_frames")
+                if not put(work_queue, (frame_index, frame)):
+                    return
+                frame_index += 1
+        except Exception as read_err:
+            errors.append(read_err)
+            stop_event.set()
+        finally:
+            for _ in range(threads):
+                put(work_queue, None)
+
+    def worker(processor):
+        try:
+            while not stop_event.is_set():
+                try:
+                    item = work_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                frame_index, frame = item
+                started = time.perf_counter()
+                processed_frame = processor.process(frame)
+                count("process", time.perf_counter() - started)
+                if not put(done_queue, (frame_index, processed_frame)):
+                    return
+        except Exception as process_err:
+            errors.append(process_err)
+            stop_event.set()
+        finally:
+            put(done_queue, None)
+
+    def ordered_writer():
+        pending = {}
+        next_index = 0
+        finished_workers = 0
+        try:
+            while not stop_event.is_set() and finished_workers < threads:
+                try:
+                    item = done_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    finished_workers += 1
+                    continue
+                pending[item[0]] = item[1]
+                while next_index in pending:
+                    started = time.perf_counter()
+                    writer.write(pending.pop(next_index))
+                    count("write", time.perf_counter() - started)
+                    slots.release()
+                    next_index += 1
+                    if progress_callback is not None:
+                        progress_callback(next_index, total_frames)
+                    if total_frames > 0 and (next_index % 100 == 0 or next_index == total_frames):
+                        logger.debug("[VID] Processed %d/%d frames (%.1f%%)...", next_index, total_frames,
+                                     next_index / total_frames * 100)
+                    elif next_index % 100 == 0:
+                        logger.debug("[VID] Processed %d frames...", next_index)
+            if pending and not stop_event.is_set():
+                raise RuntimeError(f"Pipeline finished with {len(pending)} frame(s) missing their predecessors.")
+        except Exception as write_err:
+            errors.append(write_err)
+            stop_event.set()
+
+    wall_started = time.perf_counter()
+    pipeline_threads = [threading.Thread(target=reader, name="vid-read", daemon=True)]
+    pipeline_threads += [threading.Thread(target=worker, args=(processor,), name=f"vid-proc-{i}", daemon=True)
+                         for i, processor in enumerate(processors)]
+    pipeline_threads.append(threading.Thread(target=ordered_writer, name="vid-write", daemon=True))
+    for thread in pipeline_threads:
+        thread.start()
+    for thread in pipeline_threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    patches_total = sum(processor.patch_counts()[0] for processor in processors)
+    patches_reused = sum(processor.patch_counts()[1] for processor in processors)
+    stage_stats = _format_stage_stats(stage_counters, time.perf_counter() - wall_started)
+    if timer is not None:
+        timer.add("decode", stage_counters["read"][1])
+        timer.add("encode", stage_counters["write"][1])
+        for processor in processors:
+            for stage, seconds in processor.stage_seconds.items():
+                timer.add(stage, seconds)
+    return stage_counters["write"][0], patches_total, patches_reused, stage_stats
 
-# Create output directory if it doesn't exist
-os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
-print(f"[*] Output folder configured at: {os.path.abspath(app.config['OUTPUT_FOLDER'])}")
-print(f"[*] Max upload size set to: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024):.0f} MB")
-print("[!] IMPORTANT: If using Nginx/Apache, ensure 'client_max_body_size' (or equivalent) is also set!")
 
 # --- Image Processing Helper ---
-def attempt_image_object_removal_with_mask(image_bytes, mask_bytes=None, blur_amount=0):
+def attempt_image_object_removal_with_mask(image_bytes, mask_bytes=None, blur_amount=0, prepared_mask_lookup=None,
+                                           output_format=None, png_compression=None, quality=None, blur_mode="full",
+                                           stats=None, timer=None, tile_workers=0):
     """
     Processes an image: applies inpainting based on a mask, then optionally blurs.
 
+    The decoded frame is inpainted and blurred in place, so apart from small per-region
+    crops only the decoded frame and the encoder's output buffer are alive at once.
+    Images of at least IMAGE_TILE_MIN_PIXELS use the tiled engine: mask regions are
+    inpainted concurrently and the blur runs tile by tile (see `blur_tiled`).
+
     Args:
-        image_bytes (bytes): Raw bytes of the input image.
+        image_bytes (bytes-like): Raw bytes of the input image (bytes, or a buffer such as
+            the memory-mapped upload from `read_upload_buffer`). Never copied.
         mask_bytes (bytes, optional): Raw bytes of the PNG mask image. Defaults to None.
         blur_amount (int, optional): Blur level (0-50). 0 means no blur. Defaults to 0.
+        prepared_mask_lookup (callable, optional): Called as lookup(width, height) to get the
+            PreparedMask for this size instead of looking `mask_bytes` up in `mask_cache`.
+            Used by the batch endpoint. Defaults to None.
+        output_format (str, optional): 'png', 'webp' or 'jpeg'. None matches the input format.
+        png_compression (int, optional): PNG compression level 0-9 (OpenCV default if None).
+        quality (int, optional): WebP/JPEG quality 1-100 (OpenCV default if None).
+        blur_mode (str, optional): 'full' blurs the whole image, 'mask' only the feathered mask
+            area (see `apply_blur`). Defaults to 'full'.
+        stats (dict, optional): If given, receives output_format, encode_ms and output_bytes
+            (and tile_workers / blur_tiles when the tiled engine ran).
+        timer (StageTimer, optional): Receives decode, mask_prep, inpaint, blur and encode times.
+        tile_workers (int, optional): Threads for the tiled engine; 0 uses cv2.getNumThreads().
 
     Returns:
         tuple: (processed_image_bytes, status_message, processing_info_string)
-               Returns original image bytes on error.
+               The processed image is a memoryview over the encoder's buffer (no bytes copy).
+               Returns the original `image_bytes` on error.
     """
     processing_info = "Local OpenCV Image Processing"
     final_status_message = ""
     processed_img_bytes = image_bytes # Default to original on error
+    timer = timer or StageTimer()
     try:
         # 1. Decode Input Image
         nparr_img = np.frombuffer(image_bytes, np.uint8)
-        img_original = cv2.imdecode(nparr_img, cv2.IMREAD_COLOR)
-        if img_original is None:
+        with timer.span("decode"):
+            img_processed = cv2.imdecode(nparr_img, cv2.IMREAD_COLOR)
+        del nparr_img
+        if img_processed is None:
             raise ValueError("Could not decode input image data.")
-        img_h, img_w = img_original.shape[:2]
-        img_processed = img_original.copy() # Work on a copy
-        print(f"[IMG] Decoded input image: {img_w}x{img_h}")
+        img_h, img_w = img_processed.shape[:2]
+        logger.info(f"[IMG] Decoded input image: {img_w}x{img_h}")
+        tiled = img_w * img_h >= IMAGE_TILE_MIN_PIXELS
+        workers = 1
+        if tiled:
+            workers = max(1, tile_workers or cv2.getNumThreads())
+            logger.info(f"[IMG] Large image: tiled processing on {workers} thread(s).")
+            if stats is not None:
+                stats["tile_workers"] = workers
 
         # 2. Load and Validate Mask
         mask = None
         mask_applied = False
         if mask_bytes:
             try:
-                nparr_mask = np.frombuffer(mask_bytes, np.uint8)
-                decoded_mask = cv2.imdecode(nparr_mask, cv2.IMREAD_GRAYSCALE)
-                if decoded_mask is None:
-                    print("[IMG WARN] Could not decode received mask data.")
-                else:
-                    # Resize mask if needed
-                    if decoded_mask.shape[0] != img_h or decoded_mask.shape[1] != img_w:
-                        print(f"[IMG WARN] Resizing mask from {decoded_mask.shape} to {(img_h, img_w)}")
-                        mask = cv2.resize(decoded_mask, (img_w, img_h), interpolation=cv2.INTER_NEAREST)
-                    else:
-                        mask = decoded_mask
-                    # Ensure mask is binary (0 or 255)
-                    _, mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY) # Use 127 threshold for safety
-                    # Check if mask contains anything to inpaint
-                    if np.sum(mask > 0) > 0:
-                       mask_applied = True
-                       print("[IMG] Valid mask loaded.")
+                with timer.span("mask_prep"):
+                    if prepared_mask_lookup is not None:
+                        prepared_mask = prepared_mask_lookup(img_w, img_h)
                     else:
-                        print("[IMG WARN] Provided mask was empty (all black). No inpainting needed.")
-                        mask = None # Treat as no mask provided
+                        prepared_mask = mask_cache.get(mask_bytes, img_w, img_h, log_prefix="IMG")
+                    mask = prepared_mask.mask
+                    mask_rois = prepared_mask.rois(IMAGE_INPAINT_RADIUS + 1)
+                mask_applied = mask is not None
             except Exception as mask_err:
-                print(f"[IMG ERROR] Error processing provided mask: {mask_err}")
-                traceback.print_exc()
+                logger.exception(f"[IMG] Error processing provided mask: {mask_err}")
                 mask = None # Ensure mask is None on error
 
         # 3. Perform Inpainting (if mask is valid)
         if mask_applied and mask is not None:
-            print(f"[IMG] Applying inpainting (TELEA, Radius 5)...")
-            inpainted_img = cv2.inpaint(img_original, mask, inpaintRadius=9, flags=cv2.INPAINT_TELEA)
-            if inpainted_img is None:
-                raise ValueError("Inpainting function failed (returned None).")
-            img_processed = inpainted_img
+            logger.info("[IMG] Applying inpainting (TELEA, Radius 5)...")
+            with timer.span("inpaint"):
+                inpaint_mask_regions(img_processed, mask, IMAGE_INPAINT_RADIUS, rois=mask_rois,
+                                     pyramid_threshold=PYRAMID_MIN_MASKED_PIXELS, dst=img_processed, workers=workers)
             processing_info = "Inpainting (TELEA, R5)"
             final_status_message = "Image inpainting complete. "
         else:
@@ -102,9 +1577,24 @@ def attempt_image_object_removal_with_mask(image_bytes, mask_bytes=None, blur_am
         if blur_amount > 0:
             # Kernel size must be odd
             blur_kernel_size = int(blur_amount) * 2 + 1
-            print(f"[IMG] Applying Gaussian Blur (Kernel: {blur_kernel_size}x{blur_kernel_size})...")
-            img_processed = cv2.GaussianBlur(img_processed, (blur_kernel_size, blur_kernel_size), 0)
-            processing_info += f" + Blur({blur_kernel_size}x{blur_kernel_size})"
+            blur_scope = "mask area" if blur_mode == "mask" and mask_applied else "full image"
+            logger.info(f"[IMG] Applying Gaussian Blur (Kernel: {blur_kernel_size}x{blur_kernel_size}, {blur_scope})...")
+            with timer.span("blur"):
+                blur_regions = None
+                if blur_scope == "mask area":
+                    blur_regions = prepared_mask.blur_regions(blur_kernel_size)
+                # One thread gains nothing from tiling a full-frame blur (OpenCV threads it already)
+                if tiled and (workers > 1 or blur_scope == "mask area"):
+                    img_processed, blur_tiles = blur_tiled(img_processed, blur_kernel_size,
+                                                           mask=mask if mask_applied else None, mode=blur_mode,
+                                                           blur_regions=blur_regions, workers=workers)
+                    if stats is not None:
+                        stats["blur_tiles"] = blur_tiles
+                else:
+                    apply_blur(img_processed, blur_kernel_size, mask=mask if mask_applied else None,
+                               mode=blur_mode, dst=img_processed, blur_regions=blur_regions)
+            processing_info += f" + Blur({blur_kernel_size}x{blur_kernel_size}"
+            processing_info += ", mask area)" if blur_scope == "mask area" else ")"
             final_status_message += f"Applied blur ({blur_kernel_size}x{blur_kernel_size})."
         else:
             final_status_message += "No blur applied."
@@ -114,177 +1604,894 @@ def attempt_image_object_removal_with_mask(image_bytes, mask_bytes=None, blur_am
              final_status_message += " Artifacts may be present."
 
         # 5. Encode Result Image
-        is_success, buffer = cv2.imencode(".png", img_processed)
+        output_format = output_format or detect_image_format(image_bytes)
+        extension, _ = IMAGE_OUTPUT_FORMATS[output_format]
+        encode_params = []
+        if output_format == "png" and png_compression is not None:
+            encode_params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+        elif output_format == "webp" and quality is not None:
+            encode_params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+        elif output_format == "jpeg" and quality is not None:
+            encode_params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        encode_started = time.perf_counter()
+        is_success, buffer = cv2.imencode(extension, img_processed, encode_params)
+        del img_processed, mask # Release the frame before the caller handles the output
+        encode_seconds = time.perf_counter() - encode_started
+        timer.add("encode", encode_seconds)
+        encode_ms = encode_seconds * 1000
         if not is_success:
-            raise ValueError("Could not encode processed image to PNG format.")
-        processed_img_bytes = buffer.tobytes()
-        print("[IMG] Processing successful.")
+            raise ValueError(f"Could not encode processed image to {output_format.upper()} format.")
+        processed_img_bytes = buffer.reshape(-1).data
+        if stats is not None:
+            stats["output_format"] = output_format
+            stats["encode_ms"] = round(encode_ms, 2)
+            stats["output_bytes"] = len(processed_img_bytes)
+        logger.info(f"[IMG] Processing successful ({output_format.upper()}, {len(processed_img_bytes)} bytes, encoded in {encode_ms:.1f} ms).")
+
+    except Exception as e:
+        logger.exception(f"[IMG] Error during image processing: {e}")
+        # Return original bytes and error message
+        processed_img_bytes = image_bytes
+        if stats is not None:
+            stats["output_format"] = detect_image_format(image_bytes)
+        final_status_message = f"Error processing image: {e}. Returning original."
+        processing_info = "Error"
+
+    return processed_img_bytes, final_status_message, processing_info
+
+
+# --- Video Processing Helper ---
+def build_video_frame_processor(mask_bytes, frame_width, frame_height, blur_amount=0, reuse_threshold=0,
+                                blur_mode="full", timer=None):
+    """
+    Prepares the static mask and blur kernel for a video and wraps them in a VideoFrameProcessor.
+
+    Shared by the video helper and the preview, so a preview shows exactly what the full
+    render will do (at the preview's frame size).
+
+    Args:
+        mask_bytes (bytes or None): Raw bytes of the static PNG mask.
+        frame_width (int): Width of the frames that will be processed.
+        frame_height (int): Height of the frames that will be processed.
+        blur_amount (int, optional): Blur level (0-50). Defaults to 0.
+        reuse_threshold (float, optional): See `attempt_video_object_removal_with_mask`.
+        blur_mode (str, optional): 'full' or 'mask', see `apply_blur`. Defaults to 'full'.
+        timer (StageTimer, optional): Receives the mask_prep time.
+
+    Returns:
+        tuple: (frame_processor, mask_applied, blur_kernel_size, processing_info_string)
+    """
+    mask_static = None
+    prepared_mask = None
+    if mask_bytes:
+        try:
+            with timer.span("mask_prep") if timer is not None else contextlib.nullcontext():
+                prepared_mask = mask_cache.get(mask_bytes, frame_width, frame_height, log_prefix="VID")
+                mask_static = prepared_mask.mask
+        except Exception as mask_err:
+            logger.exception(f"[VID] Error processing mask for video: {mask_err}")
+            mask_static = prepared_mask = None
+    mask_applied = mask_static is not None
+    if mask_applied:
+        processing_info = "Static Mask Inpainting (TELEA, R5)"
+    else:
+        logger.info("[VID] No valid mask provided or mask was empty. Frames are not inpainted.")
+        processing_info = "No Mask / Skipped Inpainting"
+
+    blur_kernel_size = 0
+    if blur_amount > 0:
+        blur_kernel_size = int(blur_amount) * 2 + 1
+        blur_scope = "mask area" if blur_mode == "mask" and mask_applied else "full frame"
+        logger.info(f"[VID] Blur will be applied (Kernel: {blur_kernel_size}x{blur_kernel_size}, {blur_scope}).")
+        processing_info += f" + Blur({blur_kernel_size}x{blur_kernel_size}"
+        processing_info += ", mask area)" if blur_scope == "mask area" else ")"
+
+    # Mask regions are the same for every frame (and usually for every video of that size)
+    rois = blur_regions = None
+    if mask_applied:
+        rois = prepared_mask.rois(VIDEO_INPAINT_RADIUS + 1)
+        if blur_mode == "mask" and blur_kernel_size > 0:
+            blur_regions = prepared_mask.blur_regions(blur_kernel_size)
+    frame_processor = VideoFrameProcessor(mask_static, blur_kernel_size, reuse_threshold, blur_mode, rois=rois,
+                                          blur_regions=blur_regions)
+    if mask_applied:
+        logger.info(f"[VID] Inpainting {len(frame_processor.rois)} mask region(s) per frame.")
+        if reuse_threshold > 0:
+            logger.info(f"[VID] Temporal patch reuse enabled (threshold {reuse_threshold}).")
+    return frame_processor, mask_applied, blur_kernel_size, processing_info
+
+
+def attempt_video_object_removal_with_mask(video_path, output_path, mask_bytes=None, blur_amount=0,
+                                           reuse_threshold=0, workers=1, pipeline_threads=0,
+                                           max_in_flight=0, progress_callback=None, fourcc_code='mp4v',
+                                           blur_mode="full", stats=None, timer=None):
+    """
+    Processes a video frame-by-frame: applies STATIC mask inpainting, then optional blur.
+
+    Args:
+        video_path (str): Path to the temporary input video file.
+        output_path (str): Path where the processed video should be saved.
+        mask_bytes (bytes, optional): Raw bytes of the static PNG mask image. Defaults to None.
+        blur_amount (int, optional): Blur level (0-50). 0 means no blur. Defaults to 0.
+        reuse_threshold (float, optional): Enables temporal patch reuse when > 0: a region's
+            previous patch is reused while the mean absolute change (0-255) of the pixels
+            around it stays at or below this value. Defaults to 0 (inpaint every frame).
+        workers (int, optional): Number of processes for the segmented engine. Videos too
+            short to split (see MIN_SEGMENT_FRAMES) are processed serially. Defaults to 1.
+        pipeline_threads (int, optional): Worker threads for the in-process pipeline
+            (see run_frame_pipeline). 0 or 1 runs the plain serial loop. Defaults to 0.
+        max_in_flight (int, optional): Frame memory cap for the pipeline. 0 means twice
+            `pipeline_threads`. Defaults to 0.
+        progress_callback (callable, optional): Called as progress_callback(frames_done, total_frames)
+            as frames are written (every SEGMENT_PROGRESS_SECONDS for the segmented engine). Exceptions it raises,
+            e.g. JobCancelledError, abort processing.
+        fourcc_code (str, optional): Four-character codec code for the output writer. Defaults to 'mp4v'.
+        blur_mode (str, optional): 'full' or 'mask', see `apply_blur`. Defaults to 'full'.
+        stats (dict, optional): If given, filled with processing statistics for the response.
+        timer (StageTimer, optional): Receives mask_prep and the per-frame decode, inpaint, blur
+            and encode times (summed over frames, threads and worker processes).
+
+    Returns:
+        tuple: (status_message, processing_info_string)
+               Raises an exception on critical failure.
+    """
+    processing_info = "Local OpenCV Video Processing"
+    final_status_message = ""
+    cap = None
+    writer = None
+    mask_applied_to_video = False
+    timer = timer or StageTimer()
+
+    try:
+        # 1. Open Video Capture
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {video_path}")
+
+        # 2. Get Video Properties
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) # Might be approximate
+
+        if not (fps > 0 and frame_width > 0 and frame_height > 0):
+             raise ValueError(f"Invalid video properties read: {frame_width}x{frame_height} @ {fps:.2f} FPS")
+        logger.info(f"[VID] Input video: {frame_width}x{frame_height} @ {fps:.2f} FPS (~{total_frames} frames).")
+
+        # 3. Load and Prepare Static Mask, Blur Kernel and Per-Frame Processor
+        frame_processor, mask_applied_to_video, blur_kernel_size, processing_info = build_video_frame_processor(
+            mask_bytes, frame_width, frame_height, blur_amount, reuse_threshold, blur_mode, timer
+        )
+
+        # Codec must suit the container of output_path (e.g. 'mp4v' for .mp4, 'MJPG' for .avi)
+        fourcc = cv2.VideoWriter_fourcc(*fourcc_code)
+        workers = max(1, int(workers))
+        use_segments = workers > 1 and total_frames >= workers * MIN_SEGMENT_FRAMES
+        frames_started = time.perf_counter()
+
+        if use_segments:
+            # 5a. Segmented Multi-Process Engine
+            cap.release() # Each worker opens its own capture
+            processed_frame_count, patches_total, patches_reused = process_video_segments(
+                video_path, output_path, frame_processor, fourcc, fps,
+                (frame_width, frame_height), total_frames, workers, progress_callback, timer
+            )
+        else:
+            # 5b. Setup Video Writer
+            writer = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+            if not writer.isOpened():
+                raise ValueError(f"Could not open video writer for path: {output_path}")
+            logger.info(f"[VID] Video writer opened for: {output_path}")
+
+            # 6. Process Frames
+            if pipeline_threads > 1:
+                logger.info(f"[VID] Starting frame pipeline ({pipeline_threads} worker threads)...")
+                processed_frame_count, patches_total, patches_reused, stage_stats = run_frame_pipeline(
+                    cap, writer, frame_processor, pipeline_threads,
+                    max_in_flight or 2 * pipeline_threads, total_frames, progress_callback, timer
+                )
+                logger.info(f"[VID] Pipeline throughput: {stage_stats}")
+                if stats is not None:
+                    stats["pipeline"] = stage_stats
+            else:
+                processed_frame_count = 0
+                decode_seconds = encode_seconds = 0.0
+                logger.info("[VID] Starting frame processing loop...")
+                while True:
+                    started = time.perf_counter()
+                    ret, frame = cap.read()
+                    if not ret:
+                        break # End of video
+                    decode_seconds += time.perf_counter() - started
+
+                    # Apply Inpainting and Blur, then write the processed frame
+                    processed_frame = frame_processor.process(frame)
+                    started = time.perf_counter()
+                    writer.write(processed_frame)
+                    encode_seconds += time.perf_counter() - started
+                    processed_frame_count += 1
+                    if progress_callback is not None:
+                        progress_callback(processed_frame_count, total_frames)
+
+                    # Progress indicator (every 100 frames or last frame)
+                    if total_frames > 0 and (processed_frame_count % 100 == 0 or processed_frame_count == total_frames):
+                         logger.debug("[VID] Processed %d/%d frames (%.1f%%)...", processed_frame_count, total_frames,
+                                      processed_frame_count / total_frames * 100)
+                    elif processed_frame_count % 100 == 0: # Fallback if total_frames is 0
+                         logger.debug("[VID] Processed %d frames...", processed_frame_count)
+                patches_total, patches_reused = frame_processor.patch_counts()
+                timer.add("decode", decode_seconds)
+                timer.add("encode", encode_seconds)
+                for stage, seconds in frame_processor.stage_seconds.items():
+                    timer.add(stage, seconds)
+
+        frames_seconds = time.perf_counter() - frames_started
+        if processed_frame_count and frames_seconds > 0:
+            VIDEO_FPS.observe(processed_frame_count / frames_seconds)
+        logger.info(f"[VID] Finished processing. Total frames written: {processed_frame_count}")
+        reuse_ratio = patches_reused / patches_total if patches_total else 0.0
+        if stats is not None:
+            stats["frames_processed"] = processed_frame_count
+            stats["video_workers"] = workers if use_segments else 1
+            if frame_processor.patch_reuser is not None:
+                stats["patch_reuse_threshold"] = reuse_threshold
+                stats["patch_reuse_ratio"] = round(reuse_ratio, 4)
+        if frame_processor.patch_reuser is not None:
+            logger.info(f"[VID] Patch reuse ratio: {reuse_ratio:.1%}")
+
+        # Construct final status message
+        if mask_applied_to_video:
+             final_status_message = "Video inpainting (static mask) complete. "
+        else:
+             final_status_message = "Video processing complete (no mask applied). "
+
+        if blur_kernel_size > 0:
+             final_status_message += f"Applied blur ({blur_kernel_size}x{blur_kernel_size}). "
+        else:
+             final_status_message += "No blur applied. "
+
+        if mask_applied_to_video:
+             final_status_message += "Artifacts likely, especially with motion."
+
+    except Exception as e:
+        if isinstance(e, JobCancelledError):
+            logger.info(f"[VID] Processing cancelled: {e}")
+        else:
+            logger.exception(f"[VID] Error during video processing: {e}")
+        # Cleanup: Release resources and remove potentially corrupt output file
+        if cap is not None and cap.isOpened(): cap.release()
+        if writer is not None and writer.isOpened(): writer.release()
+        if os.path.exists(output_path):
+            try:
+                os.remove(output_path)
+                logger.info(f"[VID] Removed potentially incomplete output file: {output_path}")
+            except OSError as remove_err:
+                logger.error(f"[VID] Could not remove incomplete output file {output_path}: {remove_err}")
+        # Re-raise the exception to be caught by the route handler
+        raise e
+    finally:
+        # Ensure resources are always released
+        if cap is not None and cap.isOpened():
+            cap.release()
+            # logger.debug("[VID] Video capture released.")
+        if writer is not None and writer.isOpened():
+            writer.release()
+            # logger.debug("[VID] Video writer released.")
+
+    return final_status_message, processing_info
+
+
+def preview_frame_indices(total_frames, frame_count=PREVIEW_FRAMES, frame_step=0):
+    """
+    Frame numbers sampled by the preview: every `frame_step`-th frame if given, otherwise
+    `frame_count` evenly spaced frames. At most PREVIEW_MAX_FRAMES either way.
+
+    If the container does not report a frame count, frames are taken from the start.
+    """
+    if frame_step > 0:
+        stop = total_frames if total_frames > 0 else frame_step * PREVIEW_MAX_FRAMES
+        return list(range(0, stop, frame_step))[:PREVIEW_MAX_FRAMES]
+    frame_count = max(1, min(int(frame_count), PREVIEW_MAX_FRAMES))
+    if total_frames <= 0:
+        return list(range(frame_count))
+    return sorted(set(np.linspace(0, total_frames - 1, min(frame_count, total_frames)).round().astype(int).tolist()))
+
+
+def _contact_sheet(tiles, fps, gap=4):
+    """Lays out [(frame_index, image), ...] in a near-square grid, each tile captioned with its timestamp."""
+    tile_h, tile_w = tiles[0][1].shape[:2]
+    columns = int(np.ceil(np.sqrt(len(tiles))))
+    rows = -(-len(tiles) // columns)
+    sheet = np.full((rows * (tile_h + gap) + gap, columns * (tile_w + gap) + gap, 3), 32, np.uint8)
+    font_scale = max(0.35, tile_h / 400)
+    for position, (frame_index, tile) in enumerate(tiles):
+        y0 = gap + (position // columns) * (tile_h + gap)
+        x0 = gap + (position % columns) * (tile_w + gap)
+        sheet[y0:y0 + tile_h, x0:x0 + tile_w] = tile
+        seconds = frame_index / fps if fps > 0 else 0.0
+        caption = f"#{frame_index}  {int(seconds // 60)}:{seconds % 60:04.1f}"
+        origin = (x0 + 6, y0 + tile_h - 8)
+        cv2.putText(sheet, caption, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(sheet, caption, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 1, cv2.LINE_AA)
+    return sheet
+
+
+def render_video_preview(video_path, mask_bytes=None, blur_amount=0, blur_mode="full", frame_count=PREVIEW_FRAMES,
+                         frame_step=0, max_side=PREVIEW_MAX_SIDE, output_format="jpeg", quality=None, stats=None,
+                         timer=None):
+    """
+    Fast preview of a video job: a contact sheet of sampled frames processed at reduced resolution.
+
+    Only the sampled frames are decoded (seeking across large gaps), each is downscaled so
+    its longest side is at most `max_side`, and then goes through the same mask preparation
+    and frame processor as the full render, with the blur level scaled to match.
+
+    Args:
+        video_path (str): Path to the input video.
+        mask_bytes (bytes, optional): Raw bytes of the static PNG mask.
+        blur_amount (int, optional): Blur level (0-50) of the full render. Defaults to 0.
+        blur_mode (str, optional): 'full' or 'mask', see `apply_blur`. Defaults to 'full'.
+        frame_count (int, optional): Evenly spaced frames to sample. Defaults to PREVIEW_FRAMES.
+        frame_step (int, optional): Sample every Nth frame instead (0 = use frame_count).
+        max_side (int, optional): Longest side of each processed frame. Defaults to PREVIEW_MAX_SIDE.
+        output_format (str, optional): Contact sheet format ('jpeg', 'png' or 'webp').
+        quality (int, optional): WebP/JPEG quality 1-100 (OpenCV default if None).
+        stats (dict, optional): If given, receives preview_frames, preview_frame_indices,
+            preview_scale, output_format and output_bytes.
+        timer (StageTimer, optional): Receives decode, resize, mask_prep, inpaint, blur and encode times.
+
+    Returns:
+        tuple: (contact_sheet_bytes, status_message, processing_info_string)
+               Raises an exception on failure.
+    """
+    timer = timer or StageTimer()
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if not (frame_width > 0 and frame_height > 0):
+            raise ValueError(f"Invalid video properties read: {frame_width}x{frame_height}")
+
+        scale = min(1.0, max_side / max(frame_width, frame_height))
+        preview_size = (max(1, round(frame_width * scale)), max(1, round(frame_height * scale)))
+        # Scale the blur with the frame so the preview looks like the full render
+        preview_blur = max(1, round(blur_amount * scale)) if blur_amount > 0 else 0
+        frame_processor, mask_applied, _, processing_info = build_video_frame_processor(
+            mask_bytes, preview_size[0], preview_size[1], preview_blur, 0, blur_mode, timer
+        )
+
+        indices = preview_frame_indices(total_frames, frame_count, frame_step)
+        logger.info(f"[VID] Preview: {len(indices)} frame(s) of ~{total_frames} at "
+                    f"{preview_size[0]}x{preview_size[1]}.")
+        tiles = []
+        position = 0 # Index of the next frame cap.read() returns
+        for frame_index in indices:
+            with timer.span("decode"):
+                if frame_index - position > PREVIEW_SEEK_MIN_GAP:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                else:
+                    while position < frame_index and cap.grab():
+                        position += 1
+                ret, frame = cap.read()
+            if not ret:
+                break # Reported frame count was too high
+            position = frame_index + 1
+            with timer.span("resize"):
+                if scale < 1.0:
+                    frame = cv2.resize(frame, preview_size, interpolation=cv2.INTER_AREA)
+            tiles.append((frame_index, frame_processor.process(frame)))
+        for stage, seconds in frame_processor.stage_seconds.items():
+            timer.add(stage, seconds)
+        if not tiles:
+            raise ValueError("Could not decode any frames for the preview.")
+
+        sheet = _contact_sheet(tiles, fps)
+        extension, _ = IMAGE_OUTPUT_FORMATS[output_format]
+        encode_params = []
+        if output_format == "webp" and quality is not None:
+            encode_params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+        elif output_format == "jpeg" and quality is not None:
+            encode_params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        with timer.span("encode"):
+            is_success, buffer = cv2.imencode(extension, sheet, encode_params)
+        if not is_success:
+            raise ValueError(f"Could not encode preview to {output_format.upper()} format.")
+        sheet_bytes = buffer.tobytes()
+    finally:
+        cap.release()
+
+    if stats is not None:
+        stats["preview_frames"] = len(tiles)
+        stats["preview_frame_indices"] = [frame_index for frame_index, _ in tiles]
+        stats["preview_scale"] = round(scale, 4)
+        stats["output_format"] = output_format
+        stats["output_bytes"] = len(sheet_bytes)
+    status_message = f"Preview of {len(tiles)} frame(s) at {preview_size[0]}x{preview_size[1]}. "
+    status_message += "Mask applied." if mask_applied else "No mask applied."
+    return sheet_bytes, status_message, f"Preview: {processing_info}"
+
+
+# --- Result Cache ---
+def _pid_is_alive(pid):
+    """True if a process with this pid exists on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True # Exists, owned by another user
+    return True
+
+
+class ResultCache:
+    """
+    Content-addressed cache of finished results, stored in the output folder.
+
+    A result file `<key>.<ext>` sits next to a `<key>.json` sidecar holding the status
+    message, processing info and stats of the run that produced it. File mtimes serve as
+    the LRU clock (hits touch them). `evict` keeps the whole output folder - cache entries,
+    orphaned results and leftover temporary files alike - under a byte budget, skipping
+    files that a server process has marked in use with a `<name>.lock` file (`protect`).
+    """
+
+    LOCK_SUFFIX = ".lock"
+
+    def __init__(self, folder, max_bytes, grace_seconds, enabled=True):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32) # Batches and retries hash the same mask repeatedly
+    def _mask_digest(mask_bytes):
+        """Hashes the mask as the helpers see it (decoded + thresholded), not its PNG encoding."""
+        if not mask_bytes:
+            return "none"
+        decoded_mask = cv2.imdecode(np.frombuffer(mask_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if decoded_mask is None:
+            return "none"
+        binary_mask = decoded_mask > 127
+        if not binary_mask.any():
+            return "none"
+        digest = hashlib.sha256(str(binary_mask.shape).encode())
+        digest.update(np.packbits(binary_mask).tobytes())
+        return digest.hexdigest()
+
+    def make_key(self, kind, input_digest, mask_bytes, blur_amount, algorithm_params=None):
+        """Builds the cache key from the input hash, normalized mask, blur level and algorithm parameters."""
+        key_source = json.dumps({
+            "version": RESULT_CACHE_VERSION,
+            "kind": kind,
+            "input": input_digest,
+            "mask": self._mask_digest(mask_bytes),
+            "blur": int(blur_amount),
+            "params": algorithm_params or {},
+        }, sort_keys=True)
+        return hashlib.sha256(key_source.encode()).hexdigest()
+
+    def _meta_path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def lookup(self, key):
+        """Returns the entry's metadata (and marks it recently used), or None on a miss."""
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as meta_file:
+                entry = json.load(meta_file)
+            result_path = os.path.join(self.folder, entry["result_filename"])
+            now = time.time()
+            os.utime(result_path, (now, now))
+            os.utime(self._meta_path(key), (now, now))
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def store(self, key, result_filename, message, processing_info, stats):
+        """Records metadata for a result file already written to the output folder."""
+        entry = {
+            "result_filename": result_filename,
+            "message": message,
+            "processing_info": processing_info,
+            "stats": {k: v for k, v in stats.items() if k != "cache_hit"},
+            "created_at": time.time(),
+        }
+        temp_meta_path = f"{self._meta_path(key)}.{uuid.uuid4().hex}.tmp"
+        with open(temp_meta_path, 'w', encoding='utf-8') as meta_file:
+            json.dump(entry, meta_file)
+        os.replace(temp_meta_path, self._meta_path(key)) # Atomic, so readers never see half an entry
+        with self._lock:
+            self.stores += 1
+
+    @contextlib.contextmanager
+    def protect(self, *paths):
+        """
+        Keeps the given files from being evicted by any server process while the block runs.
+
+        Each file gets a `<name>.lock` marker holding this process's pid, removed afterwards.
+        Markers left by a process that died are ignored (and cleaned up) by `evict`.
+        """
+        lock_paths = []
+        try:
+            for path in paths:
+                if path:
+                    lock_path = path + self.LOCK_SUFFIX
+                    with open(lock_path, 'w', encoding='utf-8') as lock_file:
+                        lock_file.write(str(os.getpid()))
+                    lock_paths.append(lock_path)
+            yield
+        finally:
+            for lock_path in lock_paths:
+                try:
+                    os.remove(lock_path)
+                except OSError as remove_err:
+                    logger.error(f"[CACHE] Could not remove lock {lock_path}: {remove_err}")
+
+    @staticmethod
+    def _lock_is_live(lock_path):
+        """True if the process that wrote the lock marker is still running."""
+        try:
+            with open(lock_path, 'r', encoding='utf-8') as lock_file:
+                owner_pid = int(lock_file.read().strip())
+        except FileNotFoundError:
+            return False # Released in the meantime
+        except (OSError, ValueError):
+            return True # Being written; assume it is held
+        return _pid_is_alive(owner_pid)
+
+    def evict(self):
+        """Deletes least recently used files until the output folder fits in max_bytes."""
+        if self.max_bytes <= 0:
+            return
+        files = []
+        locks = []
+        total_bytes = 0
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        if entry.name.endswith(self.LOCK_SUFFIX):
+                            locks.append(entry.name)
+                            continue
+                        file_stat = entry.stat()
+                        files.append((file_stat.st_mtime, file_stat.st_size, entry.name))
+                        total_bytes += file_stat.st_size
+        except OSError as scan_err:
+            logger.error(f"[CACHE] Could not scan output folder: {scan_err}")
+            return
+        if total_bytes <= self.max_bytes:
+            return
+
+        cutoff = time.time() - self.grace_seconds
+        protected = set()
+        for lock_name in locks:
+            lock_path = os.path.join(self.folder, lock_name)
+            if self._lock_is_live(lock_path):
+                protected.add(lock_name[:-len(self.LOCK_SUFFIX)])
+            else:
+                try:
+                    os.remove(lock_path)
+                    logger.info(f"[CACHE] Removed stale lock {lock_name}.")
+                except OSError:
+                    pass # Released or cleaned up by another process meanwhile
+        # A result and its sidecar share a stem and are evicted together
+        groups = {}
+        for mtime, size, name in files:
+            group = groups.setdefault(os.path.splitext(name)[0], [0, 0, []])
+            group[0] = max(group[0], mtime)
+            group[1] += size
+            group[2].append(name)
+        for stem, (mtime, size, names) in sorted(groups.items(), key=lambda item: item[1][0]):
+            if total_bytes <= self.max_bytes:
+                break
+            if mtime > cutoff or protected.intersection(names):
+                continue
+            paths = [os.path.join(self.folder, name) for name in names]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError as remove_err:
+                    logger.error(f"[CACHE] Could not evict {path}: {remove_err}")
+            total_bytes -= size
+            with self._lock:
+                self.evictions += 1
+                self.evicted_bytes += size
+            logger.info(f"[CACHE] Evicted {stem} ({size} bytes).")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+result_cache = ResultCache(app.config['OUTPUT_FOLDER'], app.config['OUTPUT_MAX_BYTES'],
+                           app.config['OUTPUT_GRACE_SECONDS'], enabled=app.config['RESULT_CACHE_ENABLED'])
 
-    except Exception as e:
-        print(f"[IMG ERROR] Error during image processing: {e}")
-        traceback.print_exc()
-        # Return original bytes and error message
-        processed_img_bytes = image_bytes
-        final_status_message = f"Error processing image: {e}. Returning original."
-        processing_info = "Error"
 
-    return processed_img_bytes, final_status_message, processing_info
+# --- Background Job Queue ---
+class JobCancelledError(Exception):
+    """Raised from a job's progress callback once the job has been cancelled."""
 
 
-# --- Video Processing Helper ---
-def attempt_video_object_removal_with_mask(video_path, output_path, mask_bytes=None, blur_amount=0):
+class ProcessingJob:
     """
-    Processes a video frame-by-frame: applies STATIC mask inpainting, then optional blur.
+    State of one /api/jobs submission: lifecycle status, progress and the final result payload.
 
-    Args:
-        video_path (str): Path to the temporary input video file.
-        output_path (str): Path where the processed video should be saved.
-        mask_bytes (bytes, optional): Raw bytes of the static PNG mask image. Defaults to None.
-        blur_amount (int, optional): Blur level (0-50). 0 means no blur. Defaults to 0.
-
-    Returns:
-        tuple: (status_message, processing_info_string)
-               Raises an exception on critical failure.
+    The job runs in the server process that accepted it, but its status polls, event stream
+    and cancellation may reach any worker. Every change is therefore also written to a state
+    file in JOB_STATE_FOLDER (read back with `load_job_state`), and other processes cancel the
+    job by creating a `<job_id>.cancel` marker next to it.
     """
-    processing_info = "Local OpenCV Video Processing"
-    final_status_message = ""
-    cap = None
-    writer = None
-    mask_applied_to_video = False
 
-    try:
-        # 1. Open Video Capture
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise ValueError(f"Could not open video file: {video_path}")
+    TERMINAL_STATES = ("finished", "failed", "cancelled")
 
-        # 2. Get Video Properties
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) # Might be approximate
+    def __init__(self, params, url_root):
+        self.job_id = uuid.uuid4().hex
+        self.params = params
+        self.url_root = url_root
+        self.status = "queued"
+        self.owner_pid = os.getpid()
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.frames_done = 0
+        self.total_frames = 0
+        self.result = None
+        self.http_status = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._state_saved_at = 0.0
 
-        if not (fps > 0 and frame_width > 0 and frame_height > 0):
-             raise ValueError(f"Invalid video properties read: {frame_width}x{frame_height} @ {fps:.2f} FPS")
-        print(f"[VID] Input video: {frame_width}x{frame_height} @ {fps:.2f} FPS (~{total_frames} frames).")
+    def is_cancelled(self):
+        """True once the job was cancelled, from this process or (through the marker file) another."""
+        if not self.cancel_event.is_set() and os.path.exists(_job_file_path(self.job_id, ".cancel")):
+            self.cancel_event.set()
+        return self.cancel_event.is_set()
 
-        # 3. Load and Prepare Static Mask
-        mask_static = None
-        if mask_bytes:
-             try:
-                 nparr_mask = np.frombuffer(mask_bytes, np.uint8)
-                 decoded_mask = cv2.imdecode(nparr_mask, cv2.IMREAD_GRAYSCALE)
-                 if decoded_mask is not None:
-                     if decoded_mask.shape[0]!=frame_height or decoded_mask.shape[1]!=frame_width:
-                         print(f"[VID WARN] Resizing STATIC mask from {decoded_mask.shape} to {(frame_height, frame_width)}")
-                         mask_static = cv2.resize(decoded_mask, (frame_width, frame_height), interpolation=cv2.INTER_NEAREST)
-                     else:
-                         mask_static = decoded_mask
-                     # Ensure mask is binary
-                     _, mask_static = cv2.threshold(mask_static, 127, 255, cv2.THRESH_BINARY)
-                     if np.sum(mask_static > 0) > 0:
-                         mask_applied_to_video = True
-                         print("[VID] Valid STATIC mask loaded.")
-                     else:
-                         print("[VID WARN] Provided video mask was empty (all black).")
-                         mask_static = None
-                 else:
-                     print("[VID WARN] Could not decode mask data for video.")
-             except Exception as mask_err:
-                 print(f"[VID ERROR] Error processing mask for video: {mask_err}")
-                 traceback.print_exc()
-                 mask_static = None
-
-        # If no valid mask, create an empty one to prevent errors, but don't set mask_applied_to_video
-        if mask_static is None:
-            print("[VID] No valid mask provided or mask was empty. Creating black mask (no inpainting).")
-            mask_static = np.zeros((frame_height, frame_width), dtype=np.uint8)
-            processing_info = "No Mask / Skipped Inpainting"
-        elif mask_applied_to_video:
-             processing_info = "Static Mask Inpainting (TELEA, R5)"
+    def report_progress(self, frames_done, total_frames):
+        """Progress callback handed to the processing helpers; raises once cancelled."""
+        if self.is_cancelled():
+            raise JobCancelledError(f"Job {self.job_id} was cancelled.")
+        self.frames_done = frames_done
+        self.total_frames = total_frames
+        if time.time() - self._state_saved_at >= JOB_STATE_WRITE_SECONDS:
+            self.save_state()
 
+    def state(self):
+        """Returns the job's state as stored in its state file."""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "input_filename": self.params["filename"],
+            "is_video": self.params["is_video"],
+            "owner_pid": self.owner_pid,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "frames_done": self.frames_done,
+            "total_frames": self.total_frames,
+            "result": self.result,
+            "http_status": self.http_status,
+            "error": self.error,
+        }
 
-        # 4. Setup Video Writer
-        # Use 'mp4v' codec for MP4 output. Others exist (e.g., 'XVID', 'MJPG').
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-        if not writer.isOpened():
-            raise ValueError(f"Could not open video writer for path: {output_path}")
-        print(f"[VID] Video writer opened for: {output_path}")
+    def save_state(self):
+        """Writes the job's state file; atomically, so readers in other processes never see half of it."""
+        state_path = _job_file_path(self.job_id)
+        temp_state_path = f"{state_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_state_path, 'w', encoding='utf-8') as state_file:
+                json.dump(self.state(), state_file)
+            os.replace(temp_state_path, state_path)
+        except (OSError, TypeError, ValueError) as save_err:
+            logger.error(f"[JOB] Could not write state of job {self.job_id}: {save_err}")
+        self._state_saved_at = time.time()
 
-        # 5. Prepare Blur Kernel (if needed)
-        blur_kernel_size = 0
-        if blur_amount > 0:
-            blur_kernel_size = int(blur_amount) * 2 + 1
-            print(f"[VID] Blur will be applied (Kernel: {blur_kernel_size}x{blur_kernel_size}).")
-            processing_info += f" + Blur({blur_kernel_size}x{blur_kernel_size})"
+    def to_dict(self):
+        return describe_job(self.state())
 
-        # 6. Process Frames
-        processed_frame_count = 0
-        print("[VID] Starting frame processing loop...")
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break # End of video
 
-            # Apply Inpainting (will do nothing if mask is all black)
-            processed_frame = cv2.inpaint(frame, mask_static, inpaintRadius=5, flags=cv2.INPAINT_TELEA)
+def _job_file_path(job_id, extension=".json"):
+    return os.path.join(app.config['JOB_STATE_FOLDER'], f"{job_id}{extension}")
 
-            # Apply Blur (if kernel size > 0)
-            if blur_kernel_size > 0:
-                 processed_frame = cv2.GaussianBlur(processed_frame, (blur_kernel_size, blur_kernel_size), 0)
 
-            # Write the processed frame
-            writer.write(processed_frame)
-            processed_frame_count += 1
+def load_job_state(job_id):
+    """
+    Reads a job's state file, written by whichever server process runs the job.
 
-            # Progress indicator (every 100 frames or last frame)
-            if total_frames > 0 and (processed_frame_count % 100 == 0 or processed_frame_count == total_frames):
-                 percent_done = (processed_frame_count / total_frames) * 100
-                 print(f"[VID Progress] Processed {processed_frame_count}/{total_frames} frames ({percent_done:.1f}%)...")
-            elif processed_frame_count % 100 == 0: # Fallback if total_frames is 0
-                 print(f"[VID Progress] Processed {processed_frame_count} frames...")
+    A job left queued or running by a process that no longer exists is reported as failed.
 
-        print(f"[VID] Finished processing. Total frames written: {processed_frame_count}")
+    Returns:
+        dict or None: The state (see `ProcessingJob.state`), or None for an unknown job ID.
+    """
+    try:
+        if uuid.UUID(hex=job_id).hex != job_id: # Also keeps the path inside the state folder
+            return None
+    except ValueError:
+        return None
+    try:
+        with open(_job_file_path(job_id), 'r', encoding='utf-8') as state_file:
+            job_state = json.load(state_file)
+    except (OSError, ValueError):
+        return None
+    if job_state["status"] not in ProcessingJob.TERMINAL_STATES and not _pid_is_alive(job_state["owner_pid"]):
+        job_state["status"] = "failed"
+        job_state["error"] = "The server process running this job exited."
+    return job_state
 
-        # Construct final status message
-        if mask_applied_to_video:
-             final_status_message = "Video inpainting (static mask) complete. "
-        else:
-             final_status_message = "Video processing complete (no mask applied). "
 
-        if blur_kernel_size > 0:
-             final_status_message += f"Applied blur ({blur_kernel_size}x{blur_kernel_size}). "
-        else:
-             final_status_message += "No blur applied. "
+def describe_job(job_state):
+    """Builds the API view of a job state: status, progress (throughput, ETA) and the result or error."""
+    started_at = job_state["started_at"]
+    frames_done = job_state["frames_done"]
+    total_frames = job_state["total_frames"]
+    elapsed = (job_state["finished_at"] or time.time()) - started_at if started_at else 0.0
+    fps = frames_done / elapsed if elapsed > 0 and frames_done else None
+    percent = None
+    eta_seconds = None
+    if total_frames > 0:
+        percent = round(min(frames_done / total_frames, 1.0) * 100, 1)
+        if fps and job_state["status"] == "running":
+            eta_seconds = round(max(total_frames - frames_done, 0) / fps, 1)
+    job_info = {
+        "job_id": job_state["job_id"],
+        "status": job_state["status"],
+        "input_filename": job_state["input_filename"],
+        "is_video": job_state["is_video"],
+        "progress": {
+            "frames_done": frames_done,
+            "total_frames": total_frames,
+            "percent": percent,
+            "fps": round(fps, 2) if fps else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": eta_seconds,
+        },
+    }
+    if job_state["status"] == "finished":
+        job_info["result"] = job_state["result"]
+        job_info["http_status"] = job_state["http_status"]
+    elif job_state["error"]:
+        job_info["error"] = job_state["error"]
+    return job_info
 
-        if mask_applied_to_video:
-             final_status_message += "Artifacts likely, especially with motion."
 
-    except Exception as e:
-        print(f"[VID ERROR] Error during video processing: {e}")
-        traceback.print_exc()
-        # Cleanup: Release resources and remove potentially corrupt output file
-        if cap is not None and cap.isOpened(): cap.release()
-        if writer is not None and writer.isOpened(): writer.release()
-        if os.path.exists(output_path):
+_jobs = {} # Jobs accepted by this process
+_jobs_lock = threading.Lock()
+_job_executor = ThreadPoolExecutor(max_workers=max(1, app.config['JOB_WORKERS']), thread_name_prefix="job")
+Gauge("watermark_jobs_queued", "Background jobs waiting for a worker.",
+      lambda: sum(1 for job in list(_jobs.values()) if job.status == "queued"))
+Gauge("watermark_jobs_running", "Background jobs being processed.",
+      lambda: sum(1 for job in list(_jobs.values()) if job.status == "running"))
+
+
+def _prune_finished_jobs():
+    """
+    Forgets finished jobs older than JOB_RETENTION_SECONDS, and deletes their state files
+    (including those of jobs whose server process exited). Call with _jobs_lock held.
+    """
+    cutoff = time.time() - app.config['JOB_RETENTION_SECONDS']
+    for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < cutoff]:
+        del _jobs[job_id]
+    try:
+        state_filenames = os.listdir(app.config['JOB_STATE_FOLDER'])
+    except OSError as list_err:
+        logger.error(f"[JOB] Could not list job state folder: {list_err}")
+        return
+    for state_filename in state_filenames:
+        job_id, extension = os.path.splitext(state_filename)
+        if extension != ".json":
+            continue
+        try:
+            if os.path.getmtime(_job_file_path(job_id)) >= cutoff: # A finished job's file is written last when it ends
+                continue
+        except OSError:
+            continue
+        job_state = load_job_state(job_id)
+        if job_state is not None and job_state["status"] not in ProcessingJob.TERMINAL_STATES:
+            continue # Still queued in a live process
+        for job_file_path in (_job_file_path(job_id), _job_file_path(job_id, ".cancel")):
             try:
-                os.remove(output_path)
-                print(f"[VID Cleanup] Removed potentially incomplete output file: {output_path}")
+                os.remove(job_file_path)
+            except FileNotFoundError:
+                pass
             except OSError as remove_err:
-                print(f"[VID ERROR] Could not remove incomplete output file {output_path}: {remove_err}")
-        # Re-raise the exception to be caught by the route handler
-        raise e
+                logger.error(f"[JOB] Could not remove {job_file_path}: {remove_err}")
+
+
+def _run_job(job, image_bytes=None, temp_video_path=None, timer=None):
+    """Executes a queued job on the job pool."""
+    try:
+        if job.is_cancelled():
+            raise JobCancelledError(f"Job {job.job_id} was cancelled before it started.")
+        job.status = "running"
+        job.started_at = time.time()
+        job.save_state()
+        if timer is not None:
+            timer.add("queue_wait", job.started_at - job.created_at)
+        logger.info(f"[JOB] Started job {job.job_id} ('{job.params['filename']}').")
+        with app.test_request_context(base_url=job.url_root):
+            api_result, http_status = _process_upload(
+                job.params, image_bytes=image_bytes, temp_video_path=temp_video_path,
+                progress_callback=job.report_progress, timer=timer
+            )
+            temp_video_path = None # Removed by _process_upload
+        if job.is_cancelled():
+            raise JobCancelledError(f"Job {job.job_id} was cancelled.")
+        job.result = api_result
+        job.http_status = http_status
+        job.status = "finished"
+        logger.info(f"[JOB] Finished job {job.job_id} with status: {api_result.get('status', 'N/A')}")
+    except JobCancelledError as cancel_err:
+        job.status = "cancelled"
+        job.error = str(cancel_err)
+        logger.info(f"[JOB] {cancel_err}")
+    except AdmissionRejectedError as admission_err:
+        job.status = "failed"
+        job.error = str(admission_err)
+        logger.warning(f"[JOB] Job {job.job_id} refused by admission control: {admission_err}")
+    except Exception as job_err:
+        job.status = "failed"
+        job.error = f"Server Error: {job_err}"
+        logger.exception(f"[JOB] Job {job.job_id} failed: {job_err}")
     finally:
-        # Ensure resources are always released
-        if cap is not None and cap.isOpened():
-            cap.release()
-            # print("[VID] Video capture released.")
-        if writer is not None and writer.isOpened():
-            writer.release()
-            # print("[VID] Video writer released.")
+        job.finished_at = time.time()
+        job.save_state()
+        if temp_video_path and os.path.exists(temp_video_path):
+            try:
+                os.remove(temp_video_path)
+            except OSError as e_rem_tmp:
+                logger.error(f"[JOB] Failed to remove temporary input {temp_video_path}: {e_rem_tmp}")
 
-    return final_status_message, processing_info
+
+# --- Server Process Setup ---
+_server_setup_lock = threading.Lock()
+_server_setup_done = False
+
+
+@app.before_request
+def _setup_server_process():
+    """
+    Prepares this server process once, before its first request is handled.
+
+    Creates the output and job state folders, applies this worker's share of the CPU thread and memory
+    budgets and trims what previous runs left in the output folder. None of this happens
+    at import, so the CLI and the segmented engine's worker processes, which import this
+    module for its helpers, keep their own thread settings and leave static/output alone.
+    """
+    global _server_setup_done
+    if _server_setup_done:
+        return
+    with _server_setup_lock:
+        if _server_setup_done:
+            return
+        os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+        os.makedirs(app.config['JOB_STATE_FOLDER'], exist_ok=True)
+        logger.info(f"[APP] Output folder configured at: {os.path.abspath(app.config['OUTPUT_FOLDER'])}")
+        _configure_resource_budgets()
+        result_cache.evict() # Trim what previous runs left behind
+        _server_setup_done = True
 
 
 # --- Flask Routes ---
@@ -298,177 +2505,779 @@ def index():
 @app.route('/output/<path:filename>')
 def output_file(filename):
     """Serves files from the output directory."""
-    print(f"[SERVE] Request for output file: {filename}")
+    logger.debug("[SERVE] Request for output file: %s", filename)
     # Security: Prevent accessing files outside the output folder
     safe_folder = os.path.abspath(app.config['OUTPUT_FOLDER'])
     safe_filepath = os.path.abspath(os.path.join(safe_folder, filename))
 
     if not safe_filepath.startswith(safe_folder):
-        print(f"[SERVE FORBIDDEN] Attempt to access path outside output folder: {filename}")
+        logger.warning(f"[SERVE] Attempt to access path outside output folder: {filename}")
         return jsonify({"error": "Forbidden path"}), 403
+    # Only results: never the cache's .json sidecars, .lock markers or partial .tmp files
+    if os.path.splitext(filename)[1].lower() not in SERVED_OUTPUT_EXTENSIONS:
+        logger.warning(f"[SERVE] Refused non-result file in output folder: {filename}")
+        return jsonify({"error": "File not found"}), 404
 
     try:
         # send_from_directory handles Range requests for seeking in videos
         return send_from_directory(app.config['OUTPUT_FOLDER'], filename, as_attachment=False)
     except FileNotFoundError:
-        print(f"[SERVE NOT FOUND] File not found in output folder: {filename}")
+        logger.warning(f"[SERVE] File not found in output folder: {filename}")
         return jsonify({"error": "File not found"}), 404
     except Exception as serve_err:
-        print(f"[SERVE ERROR] Error serving file {filename}: {serve_err}")
-        traceback.print_exc()
+        logger.exception(f"[SERVE] Error serving file {filename}: {serve_err}")
         return jsonify({"error": "Server error serving file"}), 500
 
 
-@app.route('/api/process', methods=['POST'])
-def process_data():
-    """Handles file upload, mask data, processes image/video, returns results."""
-    print("\n--- [API /api/process] Request Received ---")
-    try:
-        # 1. Validate File Input
-        if 'image_file' not in request.files:
-            print("[API ERROR] No 'image_file' part in the request.")
-            return jsonify({"error": "No 'image_file' part in the request."}), 400
-        file = request.files['image_file']
-        if not file or file.filename == '':
-            print("[API ERROR] No file selected or filename is empty.")
-            return jsonify({"error": "No file selected."}), 400
-
-        print(f"[API] Received file: '{file.filename}'")
-
-        # 2. Determine File Type
-        mime_type, _ = mimetypes.guess_type(file.filename)
-        is_video = mime_type and mime_type.startswith('video')
-        is_image = mime_type and mime_type.startswith('image')
-        if not is_video and not is_image:
-            print(f"[API ERROR] Unsupported file type: '{mime_type}' for file '{file.filename}'")
-            return jsonify({"error": f"Unsupported file type: '{mime_type or 'Unknown'}'. Upload image or video."}), 415
-        print(f"[API] Detected file type: {'Video' if is_video else 'Image'} (MIME: {mime_type})")
-
-        # 3. Get Mask Data from Form
-        mask_bytes = None
-        mask_data_uri = request.form.get('mask_data', None)
-        if mask_data_uri and mask_data_uri.startswith('data:image/png;base64,'):
-            try:
-                base64_string = mask_data_uri.split(',', maxsplit=1)[1]
-                mask_bytes = base64.b64decode(base64_string)
-                print(f"[API] Received valid mask data ({len(mask_bytes)} bytes).")
-            except Exception as e_mask:
-                print(f"[API WARN] Error decoding mask base64 data: {e_mask}")
-                mask_bytes = None # Treat as no mask if decoding fails
-        else:
-            print("[API] No valid mask data URI found in form.")
+def _read_mask_from_request():
+    """Returns the mask bytes from a 'mask_file' part or a base64 'mask_data' field, or None."""
+    mask_bytes = None
+    mask_file = request.files.get('mask_file')
+    mask_data_uri = request.form.get('mask_data', None)
+    if mask_file and mask_file.filename != '':
+        mask_bytes = mask_file.read() or None
+        logger.info(f"[API] Received binary mask part ({len(mask_bytes or b'')} bytes).")
+    elif mask_data_uri and mask_data_uri.startswith('data:image/png;base64,'):
+        try:
+            base64_string = mask_data_uri.split(',', maxsplit=1)[1]
+            mask_bytes = base64.b64decode(base64_string)
+            logger.info(f"[API] Received valid mask data ({len(mask_bytes)} bytes).")
+        except Exception as e_mask:
+            logger.warning(f"[API] Error decoding mask base64 data: {e_mask}")
+            mask_bytes = None # Treat as no mask if decoding fails
+    else:
+        logger.info("[API] No mask part or valid mask data URI found in form.")
+    return mask_bytes
+
+
+def _read_blur_mode_from_request():
+    """Returns the 'blur_mode' form value: 'full' (default) or 'mask'."""
+    blur_mode = request.form.get('blur_mode', 'full')
+    if blur_mode not in BLUR_MODES:
+        logger.warning(f"[API] Unknown blur mode '{blur_mode}'. Using 'full'.")
+        blur_mode = 'full'
+    return blur_mode
+
 
-        # 4. Get Blur Amount from Form
+def _read_blur_from_request():
+    """Returns the clamped 'blur_amount' form value (0-50)."""
+    blur_amount = 0
+    try:
+        blur_input = request.form.get('blur_amount', '0')
+        blur_amount = int(float(blur_input)) # Allow float input, convert to int
+        # Clamp blur amount to a reasonable range
+        blur_amount = max(0, min(blur_amount, 50))
+        logger.info(f"[API] Blur amount requested: {blur_input}, using: {blur_amount}")
+    except ValueError:
+        logger.warning(f"[API] Invalid blur amount received ('{blur_input}'). Using 0.")
         blur_amount = 0
+    return blur_amount
+
+
+def _read_encoding_from_request():
+    """
+    Reads the output encoding fields: 'output_format' (auto/png/webp/jpeg), 'png_compression'
+    (0-9), 'quality' (1-100), 'video_codec' (fourcc) and 'video_container'.
+
+    Returns:
+        tuple: (output_format or None for auto, png_compression, quality, video_codec, video_container)
+    """
+    output_format = request.form.get('output_format', 'auto').lower()
+    if output_format == 'jpg':
+        output_format = 'jpeg'
+    if output_format not in IMAGE_OUTPUT_FORMATS:
+        if output_format != 'auto':
+            logger.warning(f"[API] Unknown output format '{output_format}'. Matching the input format.")
+        output_format = None
+
+    def read_int(field, low, high):
+        value = request.form.get(field)
+        if value in (None, ''):
+            return None
         try:
-            blur_input = request.form.get('blur_amount', '0')
-            blur_amount = int(float(blur_input)) # Allow float input, convert to int
-            # Clamp blur amount to a reasonable range
-            blur_amount = max(0, min(blur_amount, 50))
-            print(f"[API] Blur amount requested: {blur_input}, using: {blur_amount}")
+            return max(low, min(int(float(value)), high))
         except ValueError:
-            print(f"[API WARN] Invalid blur amount received ('{blur_input}'). Using 0.")
-            blur_amount = 0
-
-        # --- 5. Process Based on File Type ---
-        api_result = {}
-        status_message = "Processing failed."
-        processing_method_detail = "Unknown"
-        http_status = 500 # Default to server error
-
-        if is_image:
-            print("[API] Starting image processing...")
-            image_bytes = file.read() # Read file content into memory
-            processed_bytes, status_message, processing_method_detail = attempt_image_object_removal_with_mask(
-                image_bytes, mask_bytes, blur_amount
-            )
-            # Encode result for sending back as data URI
+            logger.warning(f"[API] Invalid {field} received ('{value}'). Using the encoder default.")
+            return None
+
+    png_compression = read_int('png_compression', 0, 9)
+    quality = read_int('quality', 1, 100)
+
+    video_codec = request.form.get('video_codec') or app.config['VIDEO_FOURCC']
+    if len(video_codec) != 4:
+        logger.warning(f"[API] Invalid video codec '{video_codec}'. Using '{app.config['VIDEO_FOURCC']}'.")
+        video_codec = app.config['VIDEO_FOURCC']
+    video_container = (request.form.get('video_container') or app.config['VIDEO_CONTAINER']).lower()
+    if video_container not in VIDEO_CONTAINERS:
+        logger.warning(f"[API] Unknown video container '{video_container}'. Using '{app.config['VIDEO_CONTAINER']}'.")
+        video_container = app.config['VIDEO_CONTAINER']
+    return output_format, png_compression, quality, video_codec, video_container
+
+
+def _parse_process_form():
+    """
+    Validates the upload and reads the processing options shared by /api/process and /api/jobs.
+
+    Returns:
+        tuple: (params, None) on success, or (None, (json_response, http_status)) on a client error.
+    """
+    # 1. Validate File Input
+    if 'image_file' not in request.files:
+        logger.error("[API] No 'image_file' part in the request.")
+        return None, (jsonify({"error": "No 'image_file' part in the request."}), 400)
+    file = request.files['image_file']
+    if not file or file.filename == '':
+        logger.error("[API] No file selected or filename is empty.")
+        return None, (jsonify({"error": "No file selected."}), 400)
+
+    logger.info(f"[API] Received file: '{file.filename}'")
+
+    # 2. Determine File Type
+    mime_type, _ = mimetypes.guess_type(file.filename)
+    is_video = mime_type and mime_type.startswith('video')
+    is_image = mime_type and mime_type.startswith('image')
+    if not is_video and not is_image:
+        logger.error(f"[API] Unsupported file type: '{mime_type}' for file '{file.filename}'")
+        return None, (jsonify({"error": f"Unsupported file type: '{mime_type or 'Unknown'}'. Upload image or video."}), 415)
+    logger.info(f"[API] Detected file type: {'Video' if is_video else 'Image'} (MIME: {mime_type})")
+
+    # 3. Get Mask Data: a raw PNG 'mask_file' part, or the legacy base64 'mask_data' field
+    mask_bytes = _read_mask_from_request()
+
+    # 4. Get Blur Amount and Mode from Form
+    blur_amount = _read_blur_from_request()
+    blur_mode = _read_blur_mode_from_request()
+
+    # 5. Get Temporal Patch Reuse Threshold from Form (video only)
+    reuse_threshold = 0.0
+    try:
+        reuse_input = request.form.get('reuse_threshold', '0')
+        reuse_threshold = max(0.0, min(float(reuse_input), 255.0))
+    except ValueError:
+        logger.warning(f"[API] Invalid reuse threshold received ('{reuse_input}'). Disabling patch reuse.")
+        reuse_threshold = 0.0
+
+    # 6. Get Result Format (how an image result is returned)
+    result_format = request.form.get('result_format', app.config['DEFAULT_RESULT_FORMAT'])
+    if result_format not in RESULT_FORMATS:
+        logger.warning(f"[API] Unknown result format '{result_format}'. Using '{app.config['DEFAULT_RESULT_FORMAT']}'.")
+        result_format = app.config['DEFAULT_RESULT_FORMAT']
+
+    # 7. Get Output Encoding Options
+    output_format, png_compression, quality, video_codec, video_container = _read_encoding_from_request()
+
+    # 8. Get Preview Options (video only): contact sheet of sampled frames instead of a full render
+    preview = is_video and request.form.get('preview', '').lower() in ('1', 'true', 'on', 'yes')
+    preview_frames, preview_step = PREVIEW_FRAMES, 0
+    if preview:
+        try:
+            preview_frames = max(1, min(int(request.form.get('preview_frames', PREVIEW_FRAMES)), PREVIEW_MAX_FRAMES))
+            preview_step = max(0, int(request.form.get('preview_step', 0)))
+        except ValueError:
+            logger.warning(f"[API] Invalid preview_frames/preview_step. Using {PREVIEW_FRAMES} evenly spaced frames.")
+            preview_frames, preview_step = PREVIEW_FRAMES, 0
+
+    params = {
+        "file": file,
+        "filename": file.filename,
+        "mime_type": mime_type,
+        "is_video": bool(is_video),
+        "is_image": bool(is_image),
+        "mask_bytes": mask_bytes,
+        "blur_amount": blur_amount,
+        "blur_mode": blur_mode,
+        "reuse_threshold": reuse_threshold,
+        "result_format": result_format,
+        "output_format": output_format,
+        "png_compression": png_compression,
+        "quality": quality,
+        "video_codec": video_codec,
+        "video_container": video_container,
+        "preview": bool(preview),
+        "preview_frames": preview_frames,
+        "preview_step": preview_step,
+    }
+    return params, None
+
+
+def _save_upload_to_temp(file):
+    """
+    Saves an uploaded video to a temporary file in the output folder.
+
+    Returns:
+        tuple: (temp_path, sha256_hexdigest) - the digest keys the result cache.
+    """
+    # Using NamedTemporaryFile needs careful handling on Windows (delete=False)
+    # Save within output folder simplifies potential permission issues
+    temp_suffix = os.path.splitext(file.filename)[1] or '.tmp' # Keep original extension if possible
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=temp_suffix, dir=app.config['OUTPUT_FOLDER']) as temp_video:
+       for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+           digest.update(chunk)
+           temp_video.write(chunk)
+       temp_video_path = temp_video.name
+    logger.info(f"[API] Uploaded video saved temporarily to: {temp_video_path}")
+    return temp_video_path, digest.hexdigest()
+
+
+def read_upload_buffer(file):
+    """
+    Returns an uploaded image's content without copying large uploads into a bytes object.
+
+    Werkzeug spools uploads above a few hundred KB to an anonymous temporary file; that file is
+    memory-mapped read-only, so decoding reads straight from the page cache. The mapping stays
+    valid after the request closes the stream (jobs and batch items use it later). Small or
+    in-memory uploads are simply read.
+
+    Returns:
+        bytes or memoryview: The upload's content.
+    """
+    stream = file.stream
+    stream.seek(0, os.SEEK_END) # Also flushes buffered writes to the spool file
+    size = stream.tell()
+    stream.seek(0)
+    if size >= UPLOAD_MMAP_MIN_BYTES:
+        try:
+            return memoryview(mmap.mmap(stream.fileno(), size, access=mmap.ACCESS_READ))
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass # Not backed by a real file
+    return stream.read()
+
+
+def iter_buffer_chunks(buffer, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Yields a bytes-like object in chunks, so a response body is streamed without one large bytes copy."""
+    view = memoryview(buffer)
+    for offset in range(0, len(view), chunk_size):
+        yield bytes(view[offset:offset + chunk_size])
+
+
+def _output_url(filename):
+    """URL of a file in the output folder; works outside a request (e.g. in job threads)."""
+    if has_request_context():
+        return url_for('output_file', filename=filename, _external=False)
+    with app.test_request_context():
+        return url_for('output_file', filename=filename, _external=False)
+
+
+def _attach_image_result(api_result, result_format, output_format, processed_bytes=None, output_filename=None,
+                         timer=None):
+    """
+    Adds an image result to the API payload in the requested format.
+
+    Either the encoded bytes, a file already in the output folder, or both may be given;
+    whichever is missing is produced from the other. `timer` (a StageTimer) receives the
+    time spent reading/writing the result file and base64-encoding it.
+    """
+    timer = timer or StageTimer()
+    extension, mime_type = IMAGE_OUTPUT_FORMATS.get(output_format, IMAGE_OUTPUT_FORMATS["png"])
+    if processed_bytes is None and result_format != "url":
+        result_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+        with timer.span("output_io"), open(result_path, 'rb') as result_file:
+            processed_bytes = result_file.read()
+    if result_format == "data_uri":
+        # Legacy: encode result for sending back as data URI
+        with timer.span("base64"):
             encoded_image = base64.b64encode(processed_bytes).decode('utf-8')
-            api_result["result_image_data"] = f"data:image/png;base64,{encoded_image}"
-            print(f"[API] Image processing status: {status_message}")
+        api_result["result_image_data"] = f"data:{mime_type};base64,{encoded_image}"
+    elif result_format == "binary":
+        # Sent as the response body by /api/process; never serialized into JSON
+        api_result["result_image_bytes"] = processed_bytes
+        api_result["result_mimetype"] = mime_type
+    else:
+        if output_filename is None:
+            output_filename = f"{uuid.uuid4()}{extension}"
+            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+            with timer.span("output_io"), open(output_path, 'wb') as output_file_handle:
+                output_file_handle.write(processed_bytes)
+        api_result["result_image_url"] = _output_url(output_filename)
+        api_result["result_filename"] = output_filename
 
-        elif is_video:
-            print("[API] Starting video processing...")
-            temp_video_path = None
+
+def _process_upload(params, image_bytes=None, temp_video_path=None, progress_callback=None,
+                    prepared_mask_lookup=None, timer=None, admission_timeout=None):
+    """
+    Runs the image or video helper for a parsed request and builds the API response payload.
+
+    The temporary input video (if any) is always removed.
+
+    Args:
+        params (dict): Output of `_parse_process_form`.
+        image_bytes (bytes, optional): Uploaded image content (image requests).
+        temp_video_path (str, optional): Saved upload (video requests).
+        progress_callback (callable, optional): Passed to the video helper.
+        prepared_mask_lookup (callable, optional): Passed to the image helper.
+        timer (StageTimer, optional): Timer started when the request arrived (and already holding
+            its upload time); a new one is started if omitted. Reported as details.timings_ms.
+        admission_timeout (float, optional): Seconds to wait for the memory governor; None waits
+            as long as it takes (jobs and batch items, which are already queued).
+
+    Returns:
+        tuple: (api_result dict, http_status)
+
+    Raises:
+        AdmissionRejectedError: The request does not fit the memory budget (see MemoryGovernor).
+    """
+    # --- 7. Process Based on File Type ---
+    api_result = {}
+    status_message = "Processing failed."
+    processing_method_detail = "Unknown"
+    http_status = 500 # Default to server error
+    processing_stats = {}
+    mask_bytes = params["mask_bytes"]
+    blur_amount = params["blur_amount"]
+    cache_key = None
+    cached_entry = None
+    timer = timer or StageTimer()
+    output_bytes = None
+
+    if params["is_image"]:
+        PAYLOAD_BYTES.observe(len(image_bytes), kind="image", direction="in")
+        if result_cache.enabled:
+            cache_key = result_cache.make_key(
+                "image", hashlib.sha256(image_bytes).hexdigest(), mask_bytes, blur_amount,
+                {"radius": IMAGE_INPAINT_RADIUS,
+                 "format": params.get("output_format") or detect_image_format(image_bytes),
+                 "png_compression": params.get("png_compression"), "quality": params.get("quality"),
+                 "blur_mode": params.get("blur_mode", "full")}
+            )
+            with timer.span("cache"):
+                cached_entry = result_cache.lookup(cache_key)
+        if cached_entry:
+            logger.info(f"[API] Result cache hit for image ({cache_key[:12]}...).")
+            status_message = cached_entry["message"]
+            processing_method_detail = cached_entry["processing_info"]
+            processing_stats.update(cached_entry["stats"])
+            output_bytes = processing_stats.get("output_bytes")
+            _attach_image_result(api_result, params["result_format"], processing_stats.get("output_format", "png"),
+                                 output_filename=cached_entry["result_filename"], timer=timer)
+        else:
+            with memory_governor.reserve(estimate_image_peak_bytes(image_bytes), admission_timeout, timer):
+                logger.info("[API] Starting image processing...")
+                processed_bytes, status_message, processing_method_detail = attempt_image_object_removal_with_mask(
+                    image_bytes, mask_bytes, blur_amount, prepared_mask_lookup=prepared_mask_lookup,
+                    output_format=params.get("output_format"), png_compression=params.get("png_compression"),
+                    quality=params.get("quality"), blur_mode=params.get("blur_mode", "full"), stats=processing_stats,
+                    timer=timer, tile_workers=app.config['IMAGE_TILE_WORKERS']
+                )
+            output_format = processing_stats.get("output_format", "png")
             output_filename = None
-            try:
-                # Create a temporary file to save the upload
-                # Using NamedTemporaryFile needs careful handling on Windows (delete=False)
-                # Save within output folder simplifies potential permission issues
-                temp_suffix = os.path.splitext(file.filename)[1] or '.tmp' # Keep original extension if possible
-                with tempfile.NamedTemporaryFile(delete=False, suffix=temp_suffix, dir=app.config['OUTPUT_FOLDER']) as temp_video:
-                   file.save(temp_video.name)
-                   temp_video_path = temp_video.name
-                print(f"[API] Uploaded video saved temporarily to: {temp_video_path}")
+            output_bytes = len(processed_bytes)
+            if cache_key and processing_method_detail != "Error":
+                output_filename = f"{cache_key}{IMAGE_OUTPUT_FORMATS[output_format][0]}"
+                output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+                temp_output_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+                with timer.span("output_io"):
+                    with open(temp_output_path, 'wb') as output_file_handle:
+                        output_file_handle.write(processed_bytes)
+                    # Atomic, so a concurrent request for the same key never serves half a file
+                    os.replace(temp_output_path, output_path)
+                with timer.span("cache"):
+                    result_cache.store(cache_key, output_filename, status_message, processing_method_detail,
+                                       processing_stats)
+            _attach_image_result(api_result, params["result_format"], output_format,
+                                 processed_bytes=processed_bytes, output_filename=output_filename, timer=timer)
+        logger.info(f"[API] Image processing status: {status_message}")
+
+    elif params["is_video"] and params.get("preview"):
+        # Fast preview: never cached, it costs a few seconds at most
+        try:
+            PAYLOAD_BYTES.observe(os.path.getsize(temp_video_path), kind="video_preview", direction="in")
+            output_format = params.get("output_format") or "jpeg"
+            peak_bytes = estimate_video_peak_bytes(temp_video_path, preview=True)
+            with memory_governor.reserve(peak_bytes, admission_timeout, timer):
+                logger.info("[API] Starting video preview...")
+                preview_bytes, status_message, processing_method_detail = render_video_preview(
+                    temp_video_path, mask_bytes, blur_amount, blur_mode=params.get("blur_mode", "full"),
+                    frame_count=params.get("preview_frames", PREVIEW_FRAMES), frame_step=params.get("preview_step", 0),
+                    output_format=output_format, quality=params.get("quality"), stats=processing_stats, timer=timer
+                )
+            output_bytes = len(preview_bytes)
+            _attach_image_result(api_result, params["result_format"], output_format,
+                                 processed_bytes=preview_bytes, timer=timer)
+            logger.info(f"[API] Video preview status: {status_message}")
+        except AdmissionRejectedError:
+            raise # Answered with 413/503 by the route
+        except Exception as preview_err:
+            status_message = f"Error during video preview: {preview_err}"
+            processing_method_detail = "Video Error"
+            logger.exception(f"[API] Video Preview Failed: {preview_err}")
+            api_result["error"] = status_message
+        finally:
+            if temp_video_path and os.path.exists(temp_video_path):
+                try:
+                    os.remove(temp_video_path)
+                except OSError as e_rem_tmp:
+                    logger.error(f"[API] Failed to remove temporary input {temp_video_path}: {e_rem_tmp}")
+
+    elif params["is_video"]:
+        output_filename = None
+        video_codec = params.get("video_codec") or app.config['VIDEO_FOURCC']
+        video_container = params.get("video_container") or app.config['VIDEO_CONTAINER']
+        if temp_video_path and os.path.exists(temp_video_path):
+            PAYLOAD_BYTES.observe(os.path.getsize(temp_video_path), kind="video", direction="in")
+        try:
+            if result_cache.enabled and params.get("input_sha256"):
+                cache_key = result_cache.make_key(
+                    "video", params["input_sha256"], mask_bytes, blur_amount,
+                    {"radius": VIDEO_INPAINT_RADIUS, "reuse_threshold": params["reuse_threshold"],
+                     "codec": video_codec, "container": video_container, "blur_mode": params.get("blur_mode", "full")}
+                )
+                with timer.span("cache"):
+                    cached_entry = result_cache.lookup(cache_key)
 
+            if cached_entry:
+                logger.info(f"[API] Result cache hit for video ({cache_key[:12]}...).")
+                status_message = cached_entry["message"]
+                processing_method_detail = cached_entry["processing_info"]
+                processing_stats.update(cached_entry["stats"])
+                output_filename = cached_entry["result_filename"]
+            else:
+                logger.info("[API] Starting video processing...")
                 # Define output path
-                output_filename = f"{uuid.uuid4()}.mp4" # Standardize output to MP4
+                output_filename = f"{uuid.uuid4()}.{video_container}"
                 output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
 
                 # Call the video processing function
-                status_message, processing_method_detail = attempt_video_object_removal_with_mask(
-                    temp_video_path, output_path, mask_bytes, blur_amount
+                peak_bytes = estimate_video_peak_bytes(
+                    temp_video_path, app.config['VIDEO_WORKERS'], app.config['VIDEO_PIPELINE_THREADS'],
+                    app.config['VIDEO_MAX_IN_FLIGHT']
                 )
+                with result_cache.protect(temp_video_path, output_path), \
+                        memory_governor.reserve(peak_bytes, admission_timeout, timer):
+                    status_message, processing_method_detail = attempt_video_object_removal_with_mask(
+                        temp_video_path, output_path, mask_bytes, blur_amount,
+                        reuse_threshold=params["reuse_threshold"], workers=app.config['VIDEO_WORKERS'],
+                        pipeline_threads=app.config['VIDEO_PIPELINE_THREADS'],
+                        max_in_flight=app.config['VIDEO_MAX_IN_FLIGHT'],
+                        progress_callback=progress_callback, fourcc_code=video_codec,
+                        blur_mode=params.get("blur_mode", "full"), stats=processing_stats, timer=timer
+                    )
+                processing_stats["video_codec"] = video_codec
+                processing_stats["video_container"] = video_container
 
-                # If successful, generate URL for the result
-                # url_for generates a relative URL like '/output/filename.mp4'
-                video_url = url_for('output_file', filename=output_filename, _external=False)
-                api_result["result_video_url"] = video_url
-                api_result["result_filename"] = output_filename # For download attribute in HTML
-                print(f"[API] Video processing status: {status_message}")
-                print(f"[API] Result video URL: {video_url}")
-
-            except Exception as video_err:
-                 # Catch errors specifically from video processing helper or file saving
-                 status_message = f"Error during video processing: {video_err}"
-                 processing_method_detail = "Video Error"
-                 print(f"[API ERROR] Video Processing Failed: {video_err}")
-                 traceback.print_exc()
-                 # Clean up the failed output file if it exists (helper might have failed before writing)
-                 if output_filename and os.path.exists(os.path.join(app.config['OUTPUT_FOLDER'], output_filename)):
-                     try: os.remove(os.path.join(app.config['OUTPUT_FOLDER'], output_filename))
-                     except OSError as e_rem: print(f"[API ERROR] Failed to remove partial output {output_filename}: {e_rem}")
-                 api_result["error"] = status_message # Add explicit error field
-            finally:
-                 # Always clean up the temporary input file
-                 if temp_video_path and os.path.exists(temp_video_path):
-                     try:
-                         os.remove(temp_video_path)
-                         print(f"[API] Removed temporary input video: {temp_video_path}")
-                     except OSError as e_rem_tmp:
-                         print(f"[API ERROR] Failed to remove temporary input {temp_video_path}: {e_rem_tmp}")
-
-        # --- 6. Construct Final JSON Response ---
-        if "Error" in status_message or "Error" in processing_method_detail or "error" in api_result:
-            api_result["status"] = "error"
-            http_status = 500 if "error" in api_result else 200 # Use 500 for backend errors, 200 if processing function reported error but route is okay
-        elif "Warning" in status_message or "Skipped" in status_message or "original" in status_message.lower() or "No Mask" in processing_method_detail:
-            api_result["status"] = "warning"
-            http_status = 200
+                if cache_key:
+                    # Content-addressed name, so a resubmission finds it
+                    cached_filename = f"{cache_key}.{video_container}"
+                    os.replace(output_path, os.path.join(app.config['OUTPUT_FOLDER'], cached_filename))
+                    output_filename = cached_filename
+                    result_cache.store(cache_key, output_filename, status_message, processing_method_detail,
+                                       processing_stats)
+
+            # If successful, generate URL for the result
+            # url_for generates a relative URL like '/output/filename.mp4'
+            video_url = _output_url(output_filename)
+            api_result["result_video_url"] = video_url
+            api_result["result_filename"] = output_filename # For download attribute in HTML
+            output_bytes = os.path.getsize(os.path.join(app.config['OUTPUT_FOLDER'], output_filename))
+            logger.info(f"[API] Video processing status: {status_message}")
+            logger.info(f"[API] Result video URL: {video_url}")
+
+        except (JobCancelledError, AdmissionRejectedError):
+            raise # Not processing failures; the job runner / route reports them
+        except Exception as video_err:
+             # Catch errors specifically from video processing helper or file saving
+             status_message = f"Error during video processing: {video_err}"
+             processing_method_detail = "Video Error"
+             logger.exception(f"[API] Video Processing Failed: {video_err}")
+             # Clean up the failed output file if it exists (helper might have failed before writing)
+             if output_filename and not cached_entry and os.path.exists(os.path.join(app.config['OUTPUT_FOLDER'], output_filename)):
+                 try: os.remove(os.path.join(app.config['OUTPUT_FOLDER'], output_filename))
+                 except OSError as e_rem: logger.error(f"[API] Failed to remove partial output {output_filename}: {e_rem}")
+             api_result["error"] = status_message # Add explicit error field
+        finally:
+             # Always clean up the temporary input file
+             if temp_video_path and os.path.exists(temp_video_path):
+                 try:
+                     os.remove(temp_video_path)
+                     logger.info(f"[API] Removed temporary input video: {temp_video_path}")
+                 except OSError as e_rem_tmp:
+                     logger.error(f"[API] Failed to remove temporary input {temp_video_path}: {e_rem_tmp}")
+
+    processing_stats["cache_hit"] = bool(cached_entry)
+    # Every file written to the output folder (results with or without the cache, previews
+    # returned by URL, uploaded videos) counts against OUTPUT_MAX_BYTES
+    if api_result.get("result_filename") or temp_video_path:
+        with timer.span("cache"):
+            result_cache.evict()
+    kind = ("video_preview" if params.get("preview") else "video") if params["is_video"] else "image"
+    if output_bytes is not None:
+        PAYLOAD_BYTES.observe(output_bytes, kind=kind, direction="out")
+
+    # --- 8. Construct Final JSON Response ---
+    if "Error" in status_message or "Error" in processing_method_detail or "error" in api_result:
+        api_result["status"] = "error"
+        http_status = 500 if "error" in api_result else 200 # Use 500 for backend errors, 200 if processing function reported error but route is okay
+    elif "Warning" in status_message or "Skipped" in status_message or "original" in status_message.lower() or "No Mask" in processing_method_detail:
+        api_result["status"] = "warning"
+        http_status = 200
+    else:
+        api_result["status"] = "success"
+        http_status = 200
+
+    api_result["message"] = status_message
+    api_result["details"] = {
+        "processing_method": processing_method_detail,
+        "input_filename": params["filename"],
+        "input_mimetype": params["mime_type"],
+        "is_video": params["is_video"],
+        "mask_provided": bool(mask_bytes),
+        "blur_applied": blur_amount > 0,
+        "blur_level": blur_amount,
+        "blur_mode": params.get("blur_mode", "full"),
+        "preview": bool(params.get("preview")),
+        "disclaimer": "Quality varies. Artifacts possible, especially with video (static mask used). Video processing can be slow."
+    }
+    api_result["details"].update(processing_stats)
+    api_result["details"]["timings_ms"] = timer.as_ms()
+    timer.observe(kind)
+    return api_result, http_status
+
+
+@app.route('/api/process', methods=['POST'])
+def process_data():
+    """Handles file upload, mask data, processes image/video, returns results."""
+    logger.info("--- [API /api/process] Request Received ---")
+    try:
+        params, error_response = _parse_process_form()
+        if error_response:
+            return error_response
+
+        timer = StageTimer()
+        if params["is_image"]:
+            with timer.span("upload"):
+                image_bytes = read_upload_buffer(params["file"])
+            api_result, http_status = _process_upload(params, image_bytes=image_bytes, timer=timer,
+                                                      admission_timeout=app.config['ADMISSION_WAIT_SECONDS'])
         else:
-            api_result["status"] = "success"
-            http_status = 200
-
-        api_result["message"] = status_message
-        api_result["details"] = {
-            "processing_method": processing_method_detail,
-            "input_filename": file.filename,
-            "input_mimetype": mime_type,
-            "is_video": is_video,
-            "mask_provided": bool(mask_bytes),
-            "blur_applied": blur_amount > 0,
-            "blur_level": blur_amount,
-            "disclaimer": "Quality varies. Artifacts possible, especially with video (static mask used). Video processing can be slow."
-        }
+            temp_video_path = None
+            try:
+                with timer.span("upload"):
+                    temp_video_path, params["input_sha256"] = _save_upload_to_temp(params["file"])
+            except Exception as save_err:
+                logger.exception(f"[API] Could not save uploaded video: {save_err}")
+                return jsonify({"error": f"Could not save uploaded video: {save_err}", "status": "error",
+                                "message": f"Error during video processing: {save_err}"}), 500
+            api_result, http_status = _process_upload(params, temp_video_path=temp_video_path, timer=timer,
+                                                      admission_timeout=app.config['ADMISSION_WAIT_SECONDS'])
 
-        print(f"[API] Responding with status: {api_result.get('status', 'N/A')}, HTTP code: {http_status}")
-        print(f"--- [/api/process] Request Handled ---")
+        if "result_image_bytes" in api_result:
+            # Binary transport (images and video previews): image in the body, status and details in headers
+            result_bytes = api_result.pop("result_image_bytes")
+            response = Response(iter_buffer_chunks(result_bytes), status=http_status,
+                                mimetype=api_result.pop("result_mimetype"))
+            response.headers['Content-Length'] = str(len(result_bytes))
+            response.headers['X-Result-Status'] = api_result["status"]
+            response.headers['X-Result-Message'] = api_result["message"].encode('ascii', 'replace').decode('ascii')
+            response.headers['X-Result-Details'] = json.dumps(api_result["details"])
+            logger.info(f"[API] Responding with {len(result_bytes)} image bytes, status: {api_result['status']}")
+            logger.info("--- [/api/process] Request Handled ---")
+            return response
+
+        logger.info(f"[API] Responding with status: {api_result.get('status', 'N/A')}, HTTP code: {http_status}")
+        logger.info("--- [/api/process] Request Handled ---")
         return jsonify(api_result), http_status
 
+    except AdmissionRejectedError as admission_err:
+        logger.warning(f"[API] Request refused by admission control: {admission_err}")
+        response = jsonify({"error": str(admission_err), "status": "error", "message": str(admission_err)})
+        if admission_err.retry_after:
+            response.headers['Retry-After'] = str(admission_err.retry_after)
+        return response, admission_err.http_status
     except Exception as e:
          # Catch unexpected errors in the route handler itself
-         print(f"[API FATAL ERROR] Unexpected error in /api/process route: {e}")
-         traceback.print_exc()
+         logger.exception(f"[API] Unexpected error in /api/process route: {e}")
+         return jsonify({
+             "error": "An unexpected server error occurred.",
+             "status": "error",
+             "message": f"Server Error: {e}",
+         }), 500
+
+
+class BatchMaskPreparer:
+    """
+    Looks a batch's mask up in `mask_cache` once per distinct image resolution and keeps the
+    PreparedMask for the rest of the batch, even if the cache evicts it; safe to call from worker threads.
+    """
+
+    def __init__(self, mask_bytes):
+        self.mask_bytes = mask_bytes
+        self._masks = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, width, height):
+        with self._lock:
+            if (width, height) not in self._masks:
+                self._masks[(width, height)] = mask_cache.get(self.mask_bytes, width, height, log_prefix="BATCH")
+            return self._masks[(width, height)]
+
+
+def _process_batch_item(index, filename, image_bytes, base_params, mask_lookup):
+    """Processes one batch image; failures are reported in the item instead of raised."""
+    mime_type, _ = mimetypes.guess_type(filename)
+    item = {"index": index, "filename": filename}
+    if not (mime_type and mime_type.startswith('image')):
+        item.update({"status": "error", "error": f"Unsupported file type: '{mime_type or 'Unknown'}'. Batches accept images only."})
+        return item
+    try:
+        params = dict(base_params, filename=filename, mime_type=mime_type)
+        api_result, _ = _process_upload(params, image_bytes=image_bytes, prepared_mask_lookup=mask_lookup)
+        item.update(api_result)
+    except AdmissionRejectedError as admission_err:
+        item.update({"status": "error", "error": str(admission_err)})
+    except Exception as item_err:
+        logger.exception(f"[BATCH] Item {index} ('{filename}') failed: {item_err}")
+        item.update({"status": "error", "error": f"Server Error: {item_err}"})
+    return item
+
+
+@app.route('/api/batch', methods=['POST'])
+def process_batch():
+    """
+    Removes the same masked object from many images in one request.
+
+    Form fields: one or more 'image_files', the mask ('mask_file' or 'mask_data'), 'blur_amount',
+    and 'response_format': 'ndjson' (default; one JSON line per image as it finishes, results
+    under /output/, then a summary line) or 'zip' (processed images plus results.json).
+    """
+    logger.info("--- [API /api/batch] Request Received ---")
+    try:
+        files = [file for file in request.files.getlist('image_files') if file and file.filename]
+        if not files:
+            logger.error("[API] No 'image_files' parts in the batch request.")
+            return jsonify({"error": "No 'image_files' parts in the request."}), 400
+        response_format = request.form.get('response_format', 'ndjson')
+        if response_format not in ("ndjson", "zip"):
+            return jsonify({"error": f"Unknown response_format '{response_format}'. Use 'ndjson' or 'zip'."}), 400
+
+        mask_bytes = _read_mask_from_request()
+        blur_amount = _read_blur_from_request()
+        base_params = {
+            "blur_mode": _read_blur_mode_from_request(),
+            "is_video": False,
+            "is_image": True,
+            "mask_bytes": mask_bytes,
+            "blur_amount": blur_amount,
+            "reuse_threshold": 0.0,
+            "result_format": "binary" if response_format == "zip" else "url",
+        }
+        (base_params["output_format"], base_params["png_compression"], base_params["quality"],
+         _, _) = _read_encoding_from_request()
+        mask_lookup = BatchMaskPreparer(mask_bytes) if mask_bytes else None
+        # The upload streams close with the request, so map or read every item now
+        items = [(index, file.filename, read_upload_buffer(file)) for index, file in enumerate(files)]
+        logger.info(f"[API] Batch of {len(items)} image(s), response format: {response_format}")
+
+        pool = ThreadPoolExecutor(max_workers=max(1, app.config['BATCH_WORKERS']), thread_name_prefix="batch")
+        futures = [pool.submit(_process_batch_item, index, filename, image_bytes, base_params, mask_lookup)
+                   for index, filename, image_bytes in items]
+        del items # Workers hold the bytes they still need
+
+        if response_format == "zip":
+            try:
+                results = [future.result() for future in futures]
+            finally:
+                pool.shutdown(wait=False)
+            archive = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+            with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_STORED) as zip_file: # PNGs are already compressed
+                for item in results:
+                    result_bytes = item.pop("result_image_bytes", None)
+                    item.pop("result_mimetype", None)
+                    if result_bytes is not None and item.get("status") != "error":
+                        base_name = os.path.splitext(os.path.basename(item["filename"]))[0]
+                        extension = IMAGE_OUTPUT_FORMATS[item["details"].get("output_format", "png")][0]
+                        item["archive_name"] = f"{item['index']:04d}_{base_name}{extension}"
+                        zip_file.writestr(item["archive_name"], result_bytes)
+                zip_file.writestr("results.json", json.dumps(results, indent=2))
+            archive.seek(0)
+            logger.info("--- [/api/batch] Request Handled (ZIP) ---")
+            return send_file(archive, mimetype='application/zip', as_attachment=True,
+                             download_name='batch_results.zip')
+
+        def result_stream():
+            counts = {"success": 0, "warning": 0, "error": 0}
+            try:
+                for future in as_completed(futures):
+                    item = future.result()
+                    counts[item.get("status", "error")] = counts.get(item.get("status", "error"), 0) + 1
+                    yield json.dumps(item) + "\n"
+                yield json.dumps({"summary": dict(counts, total=len(futures))}) + "\n"
+                logger.info(f"--- [/api/batch] Request Handled ({counts}) ---")
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True) # Client went away: drop queued items
+
+        return Response(stream_with_context(result_stream()), mimetype='application/x-ndjson')
+
+    except Exception as e:
+         logger.exception(f"[API] Unexpected error in /api/batch route: {e}")
+         return jsonify({
+             "error": "An unexpected server error occurred.",
+             "status": "error",
+             "message": f"Server Error: {e}",
+         }), 500
+
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Returns result cache hit/miss/eviction counters, with the prepared mask cache's under 'mask_cache'."""
+    cache_stats = result_cache.stats()
+    cache_stats["mask_cache"] = mask_cache.stats()
+    return jsonify(cache_stats), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Exposes stage latencies, video fps, payload sizes and queue depths in the Prometheus text format."""
+    lines = [line for metric in metrics_registry for line in metric.render()]
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queues an image/video job (same form fields as /api/process) and returns its ID immediately."""
+    logger.info("--- [API /api/jobs] Job Submission Received ---")
+    try:
+        timer = StageTimer()
+        with _jobs_lock:
+            _prune_finished_jobs()
+            pending = sum(1 for job in _jobs.values() if job.status == "queued")
+        QUEUE_DEPTH.observe(pending, queue="jobs")
+        if pending >= app.config['JOB_MAX_PENDING']:
+            logger.warning(f"[API] Job queue full ({pending} pending). Rejecting submission.")
+            response = jsonify({"error": "Job queue is full. Try again later.", "status": "error"})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+
+        params, error_response = _parse_process_form()
+        if error_response:
+            return error_response
+
+        # The upload stream closes with the request, so take the data now
+        file = params.pop("file")
+        if params["result_format"] == "binary":
+            params["result_format"] = "url" # Job results are polled as JSON
+        image_bytes = temp_video_path = None
+        with timer.span("upload"):
+            if params["is_image"]:
+                image_bytes = read_upload_buffer(file)
+            else:
+                temp_video_path, params["input_sha256"] = _save_upload_to_temp(file)
+
+        job = ProcessingJob(params, request.url_root)
+        job.save_state()
+        with _jobs_lock:
+            _jobs[job.job_id] = job
+        _job_executor.submit(_run_job, job, image_bytes, temp_video_path, timer)
+        logger.info(f"[API] Queued job {job.job_id}.")
+
+        return jsonify({
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": url_for('job_status', job_id=job.job_id),
+            "events_url": url_for('job_events', job_id=job.job_id),
+        }), 202
+
+    except Exception as e:
+         logger.exception(f"[API] Unexpected error in /api/jobs route: {e}")
          return jsonify({
              "error": "An unexpected server error occurred.",
              "status": "error",
@@ -476,9 +3285,78 @@ def process_data():
          }), 500
 
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Returns a job's status and progress; includes the /api/process result payload once finished."""
+    job_state = load_job_state(job_id)
+    if job_state is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(describe_job(job_state)), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancels a queued or running job, whichever server process runs it. Finished jobs are left unchanged."""
+    job_state = load_job_state(job_id)
+    if job_state is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job_state["status"] in ProcessingJob.TERMINAL_STATES:
+        return jsonify(describe_job(job_state)), 200
+    # The owning process notices the marker at the job's next progress report
+    with open(_job_file_path(job_id, ".cancel"), 'w', encoding='utf-8'):
+        pass
+    with _jobs_lock:
+        local_job = _jobs.get(job_id)
+    if local_job is not None:
+        local_job.cancel_event.set()
+    logger.info(f"[API] Cancellation requested for job {job_id}.")
+    return jsonify(describe_job(job_state)), 202
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Streams job progress as Server-Sent Events ('progress' events, then one final 'done' event).
+
+    Opt-in alternative to polling /api/jobs/<id>. Each stream ends after JOB_EVENTS_MAX_SECONDS
+    without a 'done' event; EventSource then reconnects (after the 'retry' delay sent first).
+    """
+    job_state = load_job_state(job_id)
+    if job_state is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def event_stream():
+        current_state = job_state
+        last_payload = None
+        last_sent = 0.0
+        deadline = time.time() + app.config['JOB_EVENTS_MAX_SECONDS']
+        yield "retry: 1000\n\n"
+        while current_state["status"] not in ProcessingJob.TERMINAL_STATES:
+            if time.time() >= deadline:
+                return # Frees the worker; the client reconnects
+            payload = json.dumps(describe_job(current_state))
+            # Send on change, plus a keep-alive every 15s for proxies
+            if payload != last_payload or time.time() - last_sent > 15:
+                yield f"event: progress\ndata: {payload}\n\n"
+                last_payload = payload
+                last_sent = time.time()
+            time.sleep(0.5)
+            next_state = load_job_state(job_id)
+            if next_state is None: # State file removed from under the job
+                break
+            current_state = next_state
+        yield f"event: done\ndata: {json.dumps(describe_job(current_state))}\n\n"
+
+    return Response(event_stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 # --- Run the Application ---
 if __name__ == '__main__':
     # Set debug=False for production!
     # Use a proper WSGI server like Gunicorn or Waitress in production.
-    # Example: gunicorn --workers 4 --bind 0.0.0.0:5000 app:app
+    # Example: WEB_CONCURRENCY=4 gunicorn --worker-class gthread --threads 8 --bind 0.0.0.0:5000 app:app
+    # (gunicorn reads its worker count from WEB_CONCURRENCY, which also splits the resource budgets).
+    # Threaded workers keep answering polls and /events streams while long requests run, and keep
+    # heartbeating, so gunicorn's timeout does not kill a worker together with its background jobs.
     app.run(debug=True, host='0.0.0.0', port=5000)
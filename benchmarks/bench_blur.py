@@ -0,0 +1,86 @@
+"""
+Benchmark: blur engine vs the exact full-frame Gaussian blur.
+
+For each blur level, times `cv2.GaussianBlur` over the whole frame (the previous behaviour)
+against `gaussian_blur` (large-kernel approximation) and `apply_blur(..., mode="mask")`
+(mask area only), and reports the approximation error against the exact result.
+
+Usage:
+    python benchmarks/bench_blur.py [--width 3840 --height 2160] [--levels 10 20 35 50]
+                                    [--repeat 3] [--json results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import apply_blur, gaussian_blur  # noqa: E402
+
+
+def make_image(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(image, (5, 5), 0) # Some spatial correlation, like real content
+
+
+def make_mask(width, height):
+    """A corner-logo sized rectangle (about 1.5% of the frame)."""
+    mask = np.zeros((height, width), np.uint8)
+    cv2.rectangle(mask, (int(width * 0.78), int(height * 0.88)), (int(width * 0.97), int(height * 0.97)), 255, -1)
+    return mask
+
+
+def best_time(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--levels', type=int, nargs='+', default=[10, 20, 35, 50],
+                        help="blur_amount values (kernel = 2 * level + 1)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    image = make_image(args.width, args.height)
+    mask = make_mask(args.width, args.height)
+    results = []
+    print(f"{'kernel':>7} {'exact (ms)':>10} {'approx (ms)':>11} {'max err':>7} {'mean err':>8} {'mask-only (ms)':>14}")
+    for level in args.levels:
+        kernel_size = 2 * level + 1
+        exact_s, exact = best_time(lambda: cv2.GaussianBlur(image, (kernel_size, kernel_size), 0), args.repeat)
+        approx_s, approx = best_time(lambda: gaussian_blur(image, kernel_size), args.repeat)
+        mask_s, _ = best_time(lambda: apply_blur(image, kernel_size, mask=mask, mode="mask"), args.repeat)
+        error = np.abs(exact.astype(np.int16) - approx.astype(np.int16))
+        row = {
+            "kernel_size": kernel_size,
+            "exact_ms": round(exact_s * 1000, 2),
+            "approx_ms": round(approx_s * 1000, 2),
+            "mask_only_ms": round(mask_s * 1000, 2),
+            "max_abs_error": int(error.max()),
+            "mean_abs_error": round(float(error.mean()), 4),
+        }
+        results.append(row)
+        print(f"{kernel_size:>7} {row['exact_ms']:>10.1f} {row['approx_ms']:>11.1f} {row['max_abs_error']:>7} "
+              f"{row['mean_abs_error']:>8.3f} {row['mask_only_ms']:>14.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
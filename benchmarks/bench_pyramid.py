@@ -0,0 +1,101 @@
+"""
+Benchmark: pyramid inpainting vs full-resolution TELEA on large masks.
+
+Generates a synthetic photo-like image (smooth gradients + texture) with a large masked
+region, then times `cv2.inpaint` at full resolution against `inpaint_pyramid` and reports
+PSNR of the pyramid result against the full-resolution result inside the hole.
+
+Usage:
+    python benchmarks/bench_pyramid.py [--width 6000 --height 4000] [--coverage 0.02 0.05 0.1]
+                                       [--repeat 1] [--json results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import IMAGE_INPAINT_RADIUS, inpaint_pyramid  # noqa: E402
+
+
+def make_image(width, height, seed=0):
+    """Smooth colour gradients plus mild noise, so inpainting has structure to follow."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), np.float32)
+    image[..., 0] = 255 * (0.5 + 0.5 * np.sin(6 * x + 3 * y))
+    image[..., 1] = 255 * (0.5 + 0.5 * np.cos(4 * y - 2 * x))
+    image[..., 2] = 255 * x * y
+    image += rng.normal(0, 6, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_mask(width, height, coverage):
+    """A centred ellipse covering roughly `coverage` of the frame."""
+    mask = np.zeros((height, width), np.uint8)
+    area = coverage * width * height
+    axis_x = int(np.sqrt(area * 1.5 / np.pi))
+    axis_y = int(area / (np.pi * axis_x))
+    cv2.ellipse(mask, (width // 2, height // 2), (axis_x, axis_y), 0, 0, 360, 255, -1)
+    return mask
+
+
+def psnr(reference, candidate, mask):
+    hole = mask > 0
+    mse = np.mean((reference[hole].astype(np.float64) - candidate[hole].astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def time_call(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=6000)
+    parser.add_argument('--height', type=int, default=4000)
+    parser.add_argument('--coverage', type=float, nargs='+', default=[0.02, 0.05, 0.1])
+    parser.add_argument('--radius', type=int, default=IMAGE_INPAINT_RADIUS)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    image = make_image(args.width, args.height)
+    results = []
+    print(f"{'coverage':>8} {'masked px':>11} {'full (s)':>9} {'pyramid (s)':>11} {'speedup':>8} {'PSNR (dB)':>9}")
+    for coverage in args.coverage:
+        mask = make_mask(args.width, args.height, coverage)
+        full_s, full = time_call(lambda: cv2.inpaint(image, mask, args.radius, cv2.INPAINT_TELEA), args.repeat)
+        pyramid_s, pyramid = time_call(lambda: inpaint_pyramid(image, mask, args.radius), args.repeat)
+        row = {
+            "width": args.width,
+            "height": args.height,
+            "coverage": coverage,
+            "masked_pixels": int(cv2.countNonZero(mask)),
+            "full_seconds": round(full_s, 4),
+            "pyramid_seconds": round(pyramid_s, 4),
+            "speedup": round(full_s / pyramid_s, 2),
+            "psnr_db": round(psnr(full, pyramid, mask), 2),
+        }
+        results.append(row)
+        print(f"{coverage:>8.3f} {row['masked_pixels']:>11} {full_s:>9.3f} {pyramid_s:>11.3f} "
+              f"{row['speedup']:>7.1f}x {row['psnr_db']:>9.2f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
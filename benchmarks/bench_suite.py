@@ -0,0 +1,289 @@
+"""
+Benchmark suite: image helper, video helper and /api/process on synthetic inputs.
+
+Inputs are generated offline from fixed seeds: noise and gradient images at 720p/1080p/4K
+with masks covering 0.5%-30% of the frame (the largest resolution also through the tiled
+engine), and short generated videos. Every case runs in
+a fresh process, so its peak RSS is its own, and reports latency percentiles (plus
+frames/sec for videos).
+
+With --baseline, results are compared to a stored run and the script exits with status 1
+if any case is slower (p50), lower-throughput (fps) or bigger (peak RSS) than the baseline
+by more than --tolerance. Baselines only make sense on the machine that produced them.
+
+Usage:
+    python benchmarks/bench_suite.py [--quick] [--repeat 5] [--threads 1] [--json results.json]
+                                     [--baseline baseline.json [--tolerance 0.25]]
+                                     [--save-baseline baseline.json]
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module  # noqa: E402
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+COVERAGES = (0.005, 0.05, 0.3)
+PATTERNS = ("noise", "gradient")
+
+
+def make_image(width, height, pattern, seed=0):
+    """'noise': uniform random pixels (worst case for encoders); 'gradient': smooth colour ramps."""
+    rng = np.random.default_rng(seed)
+    if pattern == "noise":
+        return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), np.float32)
+    image[..., 0] = 255 * (0.5 + 0.5 * np.sin(6 * x + 3 * y))
+    image[..., 1] = 255 * (0.5 + 0.5 * np.cos(4 * y - 2 * x))
+    image[..., 2] = 255 * x * y
+    image += rng.normal(0, 4, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_mask(width, height, coverage, seed=0):
+    """Mask of about `coverage` of the frame: one logo-like box plus a few smaller blobs."""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), np.uint8)
+    area = coverage * width * height
+    box_w = int(np.sqrt(area * 0.7 * 3))
+    box_h = int(area * 0.7 / max(box_w, 1))
+    x0, y0 = int(width * 0.05), int(height * 0.05)
+    cv2.rectangle(mask, (x0, y0), (min(width - 1, x0 + box_w), min(height - 1, y0 + box_h)), 255, -1)
+    blob_radius = max(2, int(np.sqrt(area * 0.3 / 4 / np.pi)))
+    for _ in range(4):
+        center_x = int(rng.integers(blob_radius, width - blob_radius))
+        center_y = int(rng.integers(blob_radius, height - blob_radius))
+        cv2.circle(mask, (center_x, center_y), blob_radius, 255, -1)
+    return mask
+
+
+def make_video(path, width, height, frames, fps=25, seed=0):
+    """Gradient background with a moving square and mild noise, written as MP4."""
+    rng = np.random.default_rng(seed)
+    background = make_image(width, height, "gradient", seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    size = height // 6
+    for i in range(frames):
+        frame = background.copy()
+        x = int((width - size) * i / max(frames - 1, 1))
+        cv2.rectangle(frame, (x, height // 2), (x + size, height // 2 + size), (255, 255, 255), -1)
+        noise = rng.integers(-3, 4, frame.shape, dtype=np.int16)
+        writer.write(np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    writer.release()
+
+
+def encode_png(image):
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1) # bytes on macOS, KiB elsewhere
+
+
+def build_cases(quick):
+    """Returns the case list; --quick keeps one small configuration per code path."""
+    resolutions = ["720p"] if quick else list(RESOLUTIONS)
+    coverages = (0.05,) if quick else COVERAGES
+    cases = []
+    for resolution in resolutions:
+        for pattern in PATTERNS:
+            for coverage in coverages:
+                cases.append({"name": f"image/{resolution}/{pattern}/{coverage:.1%}", "kind": "image",
+                              "resolution": resolution, "pattern": pattern, "coverage": coverage})
+        cases.append({"name": f"route_image/{resolution}/gradient/5.0%", "kind": "route_image",
+                      "resolution": resolution, "pattern": "gradient", "coverage": 0.05})
+    # Real inputs only reach the tiled engine above IMAGE_TILE_MIN_PIXELS; force it at the largest size
+    cases.append({"name": f"image_tiled/{resolutions[-1]}/gradient/30.0%", "kind": "image",
+                  "resolution": resolutions[-1], "pattern": "gradient", "coverage": 0.3, "tiled": True})
+    video_resolutions = ["720p"] if quick else ["720p", "1080p"]
+    for resolution in video_resolutions:
+        for pipeline_threads in (0, 4):
+            engine = f"pipeline{pipeline_threads}" if pipeline_threads else "serial"
+            cases.append({"name": f"video/{resolution}/{engine}", "kind": "video", "resolution": resolution,
+                          "coverage": 0.02, "frames": 24 if quick else 60, "pipeline_threads": pipeline_threads})
+        cases.append({"name": f"route_video/{resolution}", "kind": "route_video", "resolution": resolution,
+                      "coverage": 0.02, "frames": 24 if quick else 60, "pipeline_threads": 4})
+    return cases
+
+
+def run_case(case, repeat, threads, blur_amount):
+    """Runs one case (in a fresh worker process) and returns its measurements."""
+    if threads:
+        cv2.setNumThreads(threads)
+    flask_app = app_module.app
+    # The server setup run before the first request applies CPU_THREAD_BUDGET / WEB_CONCURRENCY and the
+    # memory governor; derive them from the arguments so route cases run with the same threads
+    flask_app.config['CPU_THREAD_BUDGET'] = cv2.getNumThreads()
+    flask_app.config['WEB_CONCURRENCY'] = 1
+    flask_app.config['MEMORY_BUDGET_BYTES'] = -1 # Measure processing, not admission waits
+    app_module.result_cache.enabled = False # Repeats must not be served from the cache
+    if case.get("tiled"):
+        app_module.IMAGE_TILE_MIN_PIXELS = 0
+    width, height = RESOLUTIONS[case["resolution"]]
+    mask_bytes = encode_png(make_mask(width, height, case["coverage"]))
+    timings = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        flask_app.config['OUTPUT_FOLDER'] = work_dir
+        app_module.result_cache.folder = work_dir # Evicted after every route call
+        app_module._setup_server_process() # Now rather than inside the first timed request
+        if threads:
+            cv2.setNumThreads(threads)
+        if case["kind"] in ("image", "route_image"):
+            image_bytes = encode_png(make_image(width, height, case["pattern"]))
+            client = flask_app.test_client()
+            for _ in range(repeat):
+                started = time.perf_counter()
+                if case["kind"] == "image":
+                    _, _, info = app_module.attempt_image_object_removal_with_mask(
+                        image_bytes, mask_bytes, blur_amount
+                    )
+                    if info == "Error":
+                        raise RuntimeError(f"{case['name']}: image helper failed")
+                else:
+                    response = client.post('/api/process', data={
+                        'image_file': (io.BytesIO(image_bytes), 'bench.png'),
+                        'mask_file': (io.BytesIO(mask_bytes), 'mask.png'),
+                        'blur_amount': str(blur_amount), 'result_format': 'binary',
+                    })
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{case['name']}: HTTP {response.status_code}")
+                timings.append(time.perf_counter() - started)
+            frames = None
+        else:
+            video_path = os.path.join(work_dir, "input.mp4")
+            make_video(video_path, width, height, case["frames"])
+            flask_app.config['VIDEO_PIPELINE_THREADS'] = case["pipeline_threads"]
+            flask_app.config['VIDEO_WORKERS'] = 1
+            client = flask_app.test_client()
+            for i in range(repeat):
+                started = time.perf_counter()
+                if case["kind"] == "video":
+                    app_module.attempt_video_object_removal_with_mask(
+                        video_path, os.path.join(work_dir, f"output{i}.mp4"), mask_bytes, blur_amount,
+                        pipeline_threads=case["pipeline_threads"]
+                    )
+                else:
+                    with open(video_path, 'rb') as video_file:
+                        response = client.post('/api/process', data={
+                            'image_file': (video_file, 'bench.mp4'),
+                            'mask_file': (io.BytesIO(mask_bytes), 'mask.png'),
+                            'blur_amount': str(blur_amount),
+                        })
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{case['name']}: HTTP {response.status_code}")
+                timings.append(time.perf_counter() - started)
+            frames = case["frames"]
+
+    if threads and cv2.getNumThreads() != threads:
+        raise RuntimeError(f"{case['name']}: OpenCV threads changed to {cv2.getNumThreads()} during the run")
+    timings_ms = np.array(timings) * 1000
+    result = {
+        "name": case["name"],
+        "repeat": repeat,
+        "p50_ms": round(float(np.percentile(timings_ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(timings_ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(timings_ms, 99)), 2),
+        "mean_ms": round(float(timings_ms.mean()), 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "cv_threads": cv2.getNumThreads(),
+    }
+    if frames:
+        result["fps"] = round(frames / (result["p50_ms"] / 1000), 2)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regression descriptions (empty if none)."""
+    baseline_by_name = {entry["name"]: entry for entry in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        reference = baseline_by_name.get(result["name"])
+        if reference is None:
+            continue
+        checks = [
+            ("p50_ms", result["p50_ms"] > reference["p50_ms"] * (1 + tolerance)),
+            ("fps", result.get("fps") is not None and reference.get("fps") is not None
+             and result["fps"] < reference["fps"] * (1 - tolerance)),
+            ("peak_rss_mb", result.get("peak_rss_mb") is not None and reference.get("peak_rss_mb") is not None
+             and result["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + tolerance)),
+        ]
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append(f"{result['name']}: {metric} {result[metric]} vs baseline {reference[metric]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help="One small case per code path (720p only).")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--blur', type=int, default=0, help="blur_amount passed to every case.")
+    parser.add_argument('--threads', type=int, default=0,
+                        help="cv2.setNumThreads for every case (0 keeps OpenCV's default). Pin it for stable numbers.")
+    parser.add_argument('--filter', help="Only run cases whose name contains this string.")
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Baseline JSON to compare against; regressions exit with status 1.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown/growth.")
+    parser.add_argument('--save-baseline', help="Write this run as a baseline JSON.")
+    args = parser.parse_args()
+
+    cases = [case for case in build_cases(args.quick) if not args.filter or args.filter in case["name"]]
+    results = []
+    print(f"{'case':<34} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} {'fps':>7} {'peak RSS (MB)':>13}")
+    for case in cases:
+        # A fresh process per case, so peak RSS is not inherited from earlier cases
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(run_case, case, args.repeat, args.threads, args.blur).result()
+        results.append(result)
+        fps = f"{result['fps']:.1f}" if result.get("fps") else "-"
+        print(f"{result['name']:<34} {result['p50_ms']:>9.1f} {result['p90_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+              f"{fps:>7} {result['peak_rss_mb'] if result['peak_rss_mb'] is not None else '-':>13}")
+
+    run = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "settings": {"repeat": args.repeat, "blur": args.blur, "threads": args.threads, "quick": args.quick},
+        "results": results,
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as json_file:
+                json.dump(run, json_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}.")
+
+
+if __name__ == '__main__':
+    main()
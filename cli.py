@@ -0,0 +1,368 @@
+"""
+Headless batch processing: removes a masked watermark from every image and video under a folder.
+
+Drives the same helpers as /api/process (attempt_image_object_removal_with_mask and
+attempt_video_object_removal_with_mask) directly, without HTTP, multipart or base64. Items
+are spread over a process pool and written to a mirror of the input tree.
+
+The mask is either one file for the whole run (--mask) or a file of a given name looked up
+per folder (--mask-name): each input uses the nearest such file in its own folder or an
+ancestor folder inside the input root, falling back to --mask.
+
+Every finished item is appended to a JSONL manifest (default: <output>/manifest.jsonl). A
+rerun skips items the manifest records as done, as long as the input, the mask content and
+the output-affecting options are unchanged and the output still exists. An interrupted run
+therefore resumes where it stopped, failed items are retried, and a run with another mask
+or other settings processes everything again.
+
+Usage:
+    python cli.py INPUT_DIR OUTPUT_DIR (--mask mask.png | --mask-name mask.png)
+                  [--blur 0] [--blur-mode full|mask] [--workers N]
+                  [--format auto|png|webp|jpeg] [--quality Q] [--png-compression C]
+                  [--video-codec mp4v] [--video-container mp4] [--video-threads 0]
+                  [--reuse-threshold 0] [--manifest PATH]
+"""
+import argparse
+import collections
+import functools
+import hashlib
+import json
+import mimetypes
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+os.environ.setdefault('LOG_LEVEL', 'ERROR') # Item failures are reported by the CLI itself
+import cv2  # noqa: E402
+
+import app as app_module  # noqa: E402
+
+MANIFEST_NAME = "manifest.jsonl"
+DONE_STATUSES = ("ok", "warning")
+
+
+def media_kind(path):
+    """Returns 'image', 'video' or None, judged like the upload route does (by MIME type)."""
+    mime_type, _ = mimetypes.guess_type(path)
+    if mime_type and mime_type.startswith('image'):
+        return "image"
+    if mime_type and mime_type.startswith('video'):
+        return "video"
+    return None
+
+
+def find_mask(input_root, folder, mask_name, default_mask):
+    """Nearest `mask_name` file from `folder` up to `input_root`, else `default_mask`."""
+    if mask_name:
+        while True:
+            candidate = os.path.join(folder, mask_name)
+            if os.path.isfile(candidate):
+                return candidate
+            if os.path.samefile(folder, input_root):
+                break
+            folder = os.path.dirname(folder)
+    return default_mask
+
+
+def collect_items(input_root, output_root, mask_name, default_mask):
+    """
+    Walks the input tree and returns one work item per image/video, in a stable order.
+
+    Outputs are named after their input without its extension. Inputs that would share an
+    output name that way (a.png and a.jpg, clip.mp4 and clip.avi) keep their extension
+    instead, giving a.png.png, a.jpg.png and so on, so no item overwrites another's result.
+    """
+    items = []
+    output_abs = os.path.abspath(output_root)
+    for folder, subfolders, filenames in os.walk(input_root):
+        # Never descend into the output tree if it lives inside the input tree
+        subfolders[:] = sorted(name for name in subfolders
+                               if os.path.abspath(os.path.join(folder, name)) != output_abs)
+        mask_path = find_mask(input_root, folder, mask_name, default_mask)
+        for filename in sorted(filenames):
+            if filename == mask_name:
+                continue
+            input_path = os.path.join(folder, filename)
+            kind = media_kind(input_path)
+            if kind is None or (default_mask and os.path.abspath(input_path) == os.path.abspath(default_mask)):
+                continue
+            relative_path = os.path.relpath(input_path, input_root)
+            input_stat = os.stat(input_path)
+            items.append({
+                "input": relative_path.replace(os.sep, "/"),
+                "input_path": input_path,
+                "output_base": os.path.join(output_root, relative_path),
+                "kind": kind,
+                "mask_path": mask_path,
+                "size": input_stat.st_size,
+                "mtime_ns": input_stat.st_mtime_ns,
+            })
+    # Compared case-insensitively, as the output may land on a case-insensitive filesystem
+    base_counts = collections.Counter(os.path.splitext(item["output_base"])[0].casefold() for item in items)
+    for item in items:
+        stem = os.path.splitext(item["output_base"])[0]
+        if base_counts[stem.casefold()] == 1:
+            item["output_base"] = stem
+    return items
+
+
+def load_manifest(manifest_path):
+    """Returns {input: last record} from a manifest; a truncated last line (crash) is ignored."""
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+        for line in manifest_file:
+            try:
+                record = json.loads(line)
+                records[record["input"]] = record
+            except (ValueError, KeyError):
+                continue
+    return records
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Options that change an item's output, per kind (the rest only affect speed or placement)
+OUTPUT_OPTIONS = {
+    "image": ("blur", "blur_mode", "format", "quality", "png_compression"),
+    "video": ("blur", "blur_mode", "video_codec", "video_container", "reuse_threshold"),
+}
+
+
+def settings_digest(item, options, mask_digests):
+    """
+    Hash of everything besides the input that determines an item's output: mask content and options.
+
+    `mask_digests` maps mask paths to `file_digest` results, filled as masks are first seen.
+    """
+    mask_path = item["mask_path"]
+    if mask_path and mask_path not in mask_digests:
+        mask_digests[mask_path] = file_digest(mask_path)
+    settings = {
+        "version": app_module.RESULT_CACHE_VERSION,
+        "mask": mask_digests[mask_path] if mask_path else None,
+        "options": {name: options[name] for name in OUTPUT_OPTIONS[item["kind"]]},
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def is_done(item, record, output_root):
+    """
+    True if the manifest shows the item finished from the same input, mask and options
+    (see `settings_digest`) and its output still exists.
+    """
+    return (record is not None and record.get("status") in DONE_STATUSES
+            and record.get("size") == item["size"] and record.get("mtime_ns") == item["mtime_ns"]
+            and record.get("settings") == item["settings"]
+            and os.path.exists(os.path.join(output_root, record.get("output", ""))))
+
+
+# --- Worker process ---
+_options = None
+
+
+def _init_worker(options, cv_threads):
+    """Pool initializer: stores the run options and gives each worker its share of the cores."""
+    global _options
+    _options = options
+    cv2.setNumThreads(cv_threads)
+
+
+@functools.lru_cache(maxsize=16)
+def _read_mask(mask_path):
+    with open(mask_path, 'rb') as mask_file:
+        return mask_file.read()
+
+
+def _process_image(item, mask_bytes, stats):
+    with open(item["input_path"], 'rb') as image_file:
+        image_bytes = image_file.read()
+    processed_bytes, message, info = app_module.attempt_image_object_removal_with_mask(
+        image_bytes, mask_bytes, _options["blur"], output_format=_options["format"],
+        png_compression=_options["png_compression"], quality=_options["quality"],
+        blur_mode=_options["blur_mode"], stats=stats
+    )
+    if info == "Error":
+        raise RuntimeError(message)
+    output_path = item["output_base"] + app_module.IMAGE_OUTPUT_FORMATS[stats["output_format"]][0]
+    partial_path = f"{output_path}.partial"
+    with open(partial_path, 'wb') as output_file:
+        output_file.write(processed_bytes)
+    os.replace(partial_path, output_path) # Never leave a half-written file under the final name
+    return output_path, message, info
+
+
+def _process_video(item, mask_bytes, stats):
+    container = _options["video_container"]
+    output_path = f"{item['output_base']}.{container}"
+    partial_path = f"{item['output_base']}.partial.{container}" # The writer picks the container by extension
+    try:
+        message, info = app_module.attempt_video_object_removal_with_mask(
+            item["input_path"], partial_path, mask_bytes, _options["blur"],
+            reuse_threshold=_options["reuse_threshold"], pipeline_threads=_options["video_threads"],
+            fourcc_code=_options["video_codec"], blur_mode=_options["blur_mode"], stats=stats
+        )
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return output_path, message, info
+
+
+def process_item(item):
+    """Processes one input; returns its manifest record (errors are recorded, not raised)."""
+    started = time.perf_counter()
+    stats = {}
+    record = {"input": item["input"], "kind": item["kind"], "size": item["size"], "mtime_ns": item["mtime_ns"],
+              "settings": item["settings"]}
+    try:
+        if item["mask_path"] is None:
+            raise ValueError("No mask found for this file.")
+        mask_bytes = _read_mask(item["mask_path"])
+        os.makedirs(os.path.dirname(item["output_base"]) or ".", exist_ok=True)
+        if item["kind"] == "image":
+            output_path, message, info = _process_image(item, mask_bytes, stats)
+        else:
+            output_path, message, info = _process_video(item, mask_bytes, stats)
+        record.update({
+            "status": "warning" if "No Mask" in info else "ok",
+            "output": os.path.relpath(output_path, _options["output_root"]).replace(os.sep, "/"),
+            "output_bytes": os.path.getsize(output_path),
+            "message": message,
+        })
+        if item["kind"] == "video":
+            record["frames"] = stats.get("frames_processed", 0)
+    except Exception as item_err:
+        record.update({"status": "error", "message": str(item_err)})
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+# --- Main process ---
+def summarize(records, skipped, wall_seconds):
+    """Prints totals and throughput for the items processed in this run."""
+    failed = sum(1 for record in records if record["status"] == "error")
+    print(f"\nProcessed {len(records)} item(s) ({failed} failed), skipped {skipped} already done, "
+          f"in {wall_seconds:.1f} s.")
+    for kind in ("image", "video"):
+        done = [record for record in records if record["kind"] == kind and record["status"] != "error"]
+        if not done:
+            continue
+        bytes_in = sum(record["size"] for record in done)
+        line = (f"  {kind}s: {len(done)} in {wall_seconds:.1f} s wall, {len(done) / wall_seconds:.2f} items/s, "
+                f"{bytes_in / wall_seconds / 1e6:.1f} MB/s in, "
+                f"{sum(record['seconds'] for record in done) / len(done):.2f} s/item in a worker")
+        if kind == "video":
+            frames = sum(record.get("frames", 0) for record in done)
+            line += f", {frames} frames at {frames / wall_seconds:.1f} fps"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Remove a masked watermark from every image and video in a folder tree.")
+    parser.add_argument("input_dir", help="Folder to process (recursively).")
+    parser.add_argument("output_dir", help="Mirror tree for the results; created if missing.")
+    parser.add_argument("--mask", help="PNG mask used for every file (or for files without a per-folder mask).")
+    parser.add_argument("--mask-name", help="File name of per-folder masks, e.g. mask.png; the nearest one "
+                                            "in a file's folder or its ancestors applies.")
+    parser.add_argument("--blur", type=int, default=0, help="Blur level 0-50 (default 0).")
+    parser.add_argument("--blur-mode", choices=app_module.BLUR_MODES, default="full")
+    parser.add_argument("--format", default="auto", choices=("auto",) + tuple(app_module.IMAGE_OUTPUT_FORMATS),
+                        help="Image output format (default: same as the input).")
+    parser.add_argument("--quality", type=int, help="WebP/JPEG quality 1-100.")
+    parser.add_argument("--png-compression", type=int, help="PNG compression level 0-9.")
+    parser.add_argument("--video-codec", default=app_module.app.config['VIDEO_FOURCC'], help="Output fourcc.")
+    parser.add_argument("--video-container", default=app_module.app.config['VIDEO_CONTAINER'],
+                        choices=tuple(app_module.VIDEO_CONTAINERS))
+    parser.add_argument("--video-threads", type=int, default=0,
+                        help="Pipeline threads per video (default 0: serial loop; parallelism comes from --workers).")
+    parser.add_argument("--reuse-threshold", type=float, default=0.0, help="Temporal patch reuse threshold (0 = off).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores).")
+    parser.add_argument("--manifest", help=f"Manifest path (default: OUTPUT_DIR/{MANIFEST_NAME}).")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"input folder not found: {args.input_dir}")
+    if not args.mask and not args.mask_name:
+        parser.error("give --mask, --mask-name or both")
+    if args.mask and not os.path.isfile(args.mask):
+        parser.error(f"mask not found: {args.mask}")
+    if not 0 <= args.blur <= 50:
+        parser.error("--blur must be between 0 and 50")
+    if args.quality is not None and not 1 <= args.quality <= 100:
+        parser.error("--quality must be between 1 and 100")
+    if args.png_compression is not None and not 0 <= args.png_compression <= 9:
+        parser.error("--png-compression must be between 0 and 9")
+    if len(args.video_codec) != 4:
+        parser.error("--video-codec must be a four-character code")
+    args.workers = max(1, args.workers)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.output_dir, MANIFEST_NAME)
+    options = {
+        "output_root": args.output_dir,
+        "blur": args.blur,
+        "blur_mode": args.blur_mode,
+        "format": None if args.format == "auto" else args.format,
+        "quality": args.quality,
+        "png_compression": args.png_compression,
+        "video_codec": args.video_codec,
+        "video_container": args.video_container,
+        "video_threads": args.video_threads,
+        "reuse_threshold": args.reuse_threshold,
+    }
+    items = collect_items(args.input_dir, args.output_dir, args.mask_name, args.mask)
+    mask_digests = {}
+    for item in items:
+        item["settings"] = settings_digest(item, options, mask_digests)
+    previous = load_manifest(manifest_path)
+    pending = [item for item in items if not is_done(item, previous.get(item["input"]), args.output_dir)]
+    skipped = len(items) - len(pending)
+    print(f"{len(items)} file(s) found, {skipped} already done, {len(pending)} to process "
+          f"on {min(args.workers, len(pending)) if pending else 0} worker(s).")
+
+    workers = min(args.workers, len(pending)) or 1
+    cv_threads = max(1, (os.cpu_count() or 1) // workers)
+    records = []
+    started = time.perf_counter()
+    interrupted = False
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(options, cv_threads))
+    try:
+        with open(manifest_path, 'a', encoding='utf-8') as manifest_file:
+            futures = [pool.submit(process_item, item) for item in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                manifest_file.write(json.dumps(record) + "\n")
+                manifest_file.flush() # A record is only written once its output is in place
+                line = f"[{len(records)}/{len(pending)}] {record['status']:7} {record['input']} ({record['seconds']:.2f} s)"
+                if record["status"] == "error":
+                    line += f": {record['message']}"
+                print(line, flush=True)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted; finished items are in the manifest and will be skipped on the next run.")
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+
+    summarize(records, skipped, max(time.perf_counter() - started, 1e-9))
+    if interrupted:
+        return 130
+    return 1 if any(record["status"] == "error" for record in records) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,6 +13,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const processHeader = document.getElementById('process-header');
     const loadingIndicator = document.getElementById('loading-indicator');
     const loadingVideoNote = document.getElementById('loading-video-note');
+    const loadingProgress = document.getElementById('loading-progress');
+    const cancelJobBtn = document.getElementById('cancel-job-btn');
     const resultsBox = document.getElementById('results-box');
     const errorMessageDiv = document.getElementById('error-message');
     const successMessageDiv = document.getElementById('success-message');
@@ -39,6 +41,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const blurSlider = document.getElementById('blur-slider');
     const blurValueSpan = document.getElementById('blur-value');
     const blurAmountHidden = document.getElementById('blur-amount-hidden'); // Hidden input for form
+    const blurMaskOnlyCheckbox = document.getElementById('blur-mask-only');
+    const videoPreviewControls = document.getElementById('video-preview-controls');
+    const videoPreviewCheckbox = document.getElementById('video-preview');
 
     // --- State Variables ---
     let currentTool = 'brush'; // 'brush', 'box', 'polygon'
@@ -55,6 +60,7 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentBrushSize = 10; // Current brush size from slider
     let currentBlurAmount = 0; // Current blur amount from slider
     let resizeObserver = null; // Observer for preview element resize
+    let currentJobId = null; // Background job currently being processed (videos)
 
     // --- Utility Functions ---
     const showElement = (el) => { if (el) el.style.display = 'block'; };
@@ -284,6 +290,7 @@ document.addEventListener('DOMContentLoaded', () => {
         shapes = []; // Clear previous shapes
         currentPolygonPoints = []; // Clear polygon points
         isVideoFile = file.type.startsWith('video');
+        if (isVideoFile) { showElement(videoPreviewControls); } else { hideElement(videoPreviewControls); }
 
         resetDrawingState(); // Clear canvas, reset interaction states
         hideElement(resultsBox);
@@ -542,6 +549,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (undoBtn) { undoBtn.addEventListener('click', undoLast); }
         if (clearDrawingBtn) { clearDrawingBtn.addEventListener('click', clearAllDrawings); }
         if (finishPolygonBtn) { finishPolygonBtn.addEventListener('click', () => finishCurrentPolygon(true)); }
+        if (cancelJobBtn) { cancelJobBtn.addEventListener('click', cancelCurrentJob); }
     };
 
     // --- Tool Selection Logic ---
@@ -900,19 +908,29 @@ document.addEventListener('DOMContentLoaded', () => {
                     tempCtx.restore();
                 });
 
-                // Get mask as base64 PNG
-                const maskDataURL = tempCanvas.toDataURL('image/png');
-                if (!maskDataURL || maskDataURL === 'data:,') { showError("Failed to generate mask data."); return; }
-                console.log(`Generated mask data URL (${(maskDataURL.length / 1024).toFixed(1)} KB)`);
-
-                // --- Prepare FormData ---
-                const formData = new FormData();
-                formData.append('image_file', currentFile);
-                formData.append('mask_data', maskDataURL);
-                formData.append('blur_amount', currentBlurAmount.toString()); // Send current blur value
-
-                // --- Send API Request ---
-                handleApiRequest('/api/process', { method: 'POST', body: formData });
+                // Get mask as a binary PNG (no base64 overhead)
+                tempCanvas.toBlob((maskBlob) => {
+                    if (!maskBlob) { showError("Failed to generate mask data."); return; }
+                    console.log(`Generated mask PNG (${(maskBlob.size / 1024).toFixed(1)} KB)`);
+
+                    // --- Prepare FormData ---
+                    const formData = new FormData();
+                    formData.append('image_file', currentFile);
+                    formData.append('mask_file', maskBlob, 'mask.png');
+                    formData.append('blur_amount', currentBlurAmount.toString()); // Send current blur value
+                    formData.append('blur_mode', blurMaskOnlyCheckbox?.checked ? 'mask' : 'full');
+                    formData.append('result_format', 'url'); // Result image is fetched from /output/
+                    const previewOnly = isVideoFile && videoPreviewCheckbox?.checked;
+                    if (previewOnly) { formData.append('preview', '1'); } // Contact sheet of sampled frames
+
+                    // --- Send API Request ---
+                    // Videos run as background jobs so progress can be shown; images and video previews stay synchronous
+                    if (isVideoFile && !previewOnly) {
+                        handleJobRequest(formData);
+                    } else {
+                        handleApiRequest('/api/process', { method: 'POST', body: formData });
+                    }
+                }, 'image/png');
             });
         }
     };
@@ -959,6 +977,75 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // --- Background Job Handling (Videos) ---
+    const updateJobProgress = (progress) => {
+        if (!loadingProgress || !progress) return;
+        let text = `${progress.frames_done} / ${progress.total_frames || '?'} frames`;
+        if (progress.percent !== null && progress.percent !== undefined) text += ` (${progress.percent}%)`;
+        if (progress.fps) text += ` - ${progress.fps} fps`;
+        if (progress.eta_seconds !== null && progress.eta_seconds !== undefined) text += ` - ETA ${Math.ceil(progress.eta_seconds)}s`;
+        loadingProgress.textContent = text;
+    };
+
+    const pollJob = async (statusUrl) => {
+        // Polling keeps no server worker busy between requests (the /events stream would)
+        while (true) {
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+            if (!response.ok) { throw new Error(job?.error || `Job status request failed with status ${response.status}`); }
+            if (['finished', 'failed', 'cancelled'].includes(job.status)) { return job; }
+            updateJobProgress(job.progress);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    };
+
+    const handleJobRequest = async (formData) => {
+        showFlexElement(loadingIndicator);
+        hideElement(resultsBox); // Hide previous results
+        hideElement(errorMessageDiv); hideElement(successMessageDiv);
+        showElement(loadingVideoNote);
+        if (loadingProgress) loadingProgress.textContent = 'Queued...';
+
+        try {
+            console.log('Submitting background job to /api/jobs...');
+            const response = await fetch('/api/jobs', { method: 'POST', body: formData });
+            const submitted = await response.json().catch(() => null);
+            if (!response.ok || !submitted?.job_id) {
+                throw new Error(submitted?.error || `Job submission failed with status ${response.status}`);
+            }
+            currentJobId = submitted.job_id;
+            showInlineBlockElement(cancelJobBtn);
+
+            const job = await pollJob(submitted.status_url);
+            console.log('Job finished:', job);
+            if (job.status === 'cancelled') { throw new Error('Processing was cancelled.'); }
+            if (job.status !== 'finished') { throw new Error(job.error || 'Processing failed on server.'); }
+            if (job.result?.status === 'error') {
+                throw new Error(job.result.message || job.result.error || 'Processing failed on server.');
+            }
+            showSuccess(job.result);
+
+        } catch (error) {
+            console.error('Job Error:', error);
+            showError(error.message || 'Unknown job error.');
+        } finally {
+            currentJobId = null;
+            hideElement(cancelJobBtn);
+            if (loadingProgress) loadingProgress.textContent = '';
+            hideElement(loadingIndicator);
+        }
+    };
+
+    const cancelCurrentJob = async () => {
+        if (!currentJobId) return;
+        try {
+            await fetch(`/api/jobs/${currentJobId}`, { method: 'DELETE' });
+            if (loadingProgress) loadingProgress.textContent = 'Cancelling...';
+        } catch (error) {
+            console.error('Cancel request failed:', error);
+        }
+    };
+
     // --- Display API Results ---
     const showSuccess = (data) => {
         hideElement(errorMessageDiv); // Ensure error is hidden
@@ -1000,16 +1087,18 @@ document.addEventListener('DOMContentLoaded', () => {
         hideElement(resultVideoArea); hideElement(resultVideoPlayer); resultVideoPlayer.src = '';
         hideElement(downloadBtn); downloadBtn.href = '#'; downloadBtn.removeAttribute('download');
 
-        // Display Result Image
-        if (data?.result_image_data) {
+        // Display Result Image (URL in /output/, or legacy data URI)
+        const resultImageSrc = data?.result_image_url || data?.result_image_data;
+        if (resultImageSrc) {
             console.log("Displaying image result.");
-            resultImage.src = data.result_image_data;
+            resultImage.src = resultImageSrc;
             showElement(resultImage);
             showElement(resultImageContainer);
-            downloadBtn.href = data.result_image_data;
+            downloadBtn.href = resultImageSrc;
             const fname = data.details?.input_filename || 'image.png';
             const baseName = fname.split('.').slice(0, -1).join('.') || fname;
-            downloadBtn.setAttribute('download', `processed_${baseName}.png`);
+            const resultExt = data.result_filename?.split('.').pop() || 'png'; // Output format may differ from PNG
+            downloadBtn.setAttribute('download', `processed_${baseName}.${resultExt}`);
             showInlineBlockElement(downloadBtn);
         }
         // Display Result Video
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import app.py and cli.py from the repository root; keep the server quiet
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
@@ -0,0 +1,50 @@
+"""Decompression bombs are refused from the header, before any pixels are decoded."""
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import app
+
+
+@pytest.fixture
+def bomb_png():
+    # 200 megapixels that compress to a few KB
+    buffer = io.BytesIO()
+    Image.new('1', (20000, 10000)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_bomb_header_is_refused(bomb_png):
+    with pytest.raises(app.AdmissionRejectedError) as rejected:
+        app.estimate_image_peak_bytes(bomb_png)
+    assert rejected.value.http_status == 413
+
+
+def test_bomb_upload_gets_413(bomb_png, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.app.config, 'OUTPUT_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app.result_cache, 'folder', str(tmp_path))
+    app._setup_server_process() # Would raise the limits below to fit this machine's memory
+    monkeypatch.setattr(app.PILImage, 'MAX_IMAGE_PIXELS', app.PIL_DEFAULT_MAX_PIXELS)
+    monkeypatch.setattr(app.memory_governor, 'budget_bytes', 512 * 2 ** 20)
+    mask_png = cv2.imencode('.png', np.full((10, 10), 255, np.uint8))[1].tobytes()
+    response = app.app.test_client().post('/api/process', data={
+        'image_file': (io.BytesIO(bomb_png), 'bomb.png'),
+        'mask_file': (io.BytesIO(mask_png), 'mask.png'),
+    })
+    assert response.status_code == 413
+
+
+def test_budget_raises_pillow_limit(monkeypatch):
+    monkeypatch.setattr(app.PILImage, 'MAX_IMAGE_PIXELS', app.PIL_DEFAULT_MAX_PIXELS)
+    monkeypatch.setitem(app.app.config, 'MEMORY_BUDGET_BYTES', 64 * 2 ** 30)
+    monkeypatch.setitem(app.app.config, 'WEB_CONCURRENCY', 1)
+    monkeypatch.setattr(app.memory_governor, 'budget_bytes', app.memory_governor.budget_bytes)
+    threads = cv2.getNumThreads()
+    try:
+        app._configure_resource_budgets()
+    finally:
+        cv2.setNumThreads(threads)
+    assert app.PILImage.MAX_IMAGE_PIXELS == 64 * 2 ** 30 // (3 * app.IMAGE_PEAK_FRAME_COPIES + 1)
@@ -0,0 +1,55 @@
+"""Resuming a CLI run: finished items are skipped unless the mask or the options changed."""
+import json
+import os
+
+import cv2
+import numpy as np
+
+import cli
+
+
+def write_tree(root):
+    rng = np.random.default_rng(0)
+    os.makedirs(root / "in" / "sub")
+    for name in ("a.png", "b.jpg", "sub/c.png"):
+        cv2.imwrite(str(root / "in" / name), rng.integers(0, 256, size=(48, 64, 3), dtype=np.uint8))
+    write_mask(root / "mask.png", 10)
+
+
+def write_mask(path, left):
+    mask = np.zeros((48, 64), np.uint8)
+    mask[10:20, left:left + 20] = 255
+    cv2.imwrite(str(path), mask)
+
+
+def run(root, capsys, *extra_args):
+    exit_code = cli.main([str(root / "in"), str(root / "out"), "--mask", str(root / "mask.png"),
+                          "--workers", "1", *extra_args])
+    assert exit_code == 0
+    return capsys.readouterr().out.splitlines()[0]
+
+
+def test_resume_skips_done_items_and_reruns_on_changes(tmp_path, capsys):
+    write_tree(tmp_path)
+
+    assert run(tmp_path, capsys).startswith("3 file(s) found, 0 already done, 3 to process")
+    assert run(tmp_path, capsys).startswith("3 file(s) found, 3 already done, 0 to process")
+
+    # Other options that change the output
+    assert run(tmp_path, capsys, "--blur", "3").startswith("3 file(s) found, 0 already done, 3 to process")
+    assert run(tmp_path, capsys, "--blur", "3").startswith("3 file(s) found, 3 already done, 0 to process")
+    # Only the image options count for images
+    assert run(tmp_path, capsys, "--blur", "3", "--video-codec", "MJPG").startswith(
+        "3 file(s) found, 3 already done")
+
+    # Same mask path, different content
+    write_mask(tmp_path / "mask.png", 30)
+    assert run(tmp_path, capsys, "--blur", "3").startswith("3 file(s) found, 0 already done, 3 to process")
+
+    # A deleted output is redone on its own
+    os.remove(tmp_path / "out" / "a.png")
+    assert run(tmp_path, capsys, "--blur", "3").startswith("3 file(s) found, 2 already done, 1 to process")
+
+    with open(tmp_path / "out" / "manifest.jsonl", encoding="utf-8") as manifest_file:
+        records = [json.loads(line) for line in manifest_file]
+    assert all(record["status"] == "ok" and record["settings"] for record in records)
@@ -0,0 +1,85 @@
+"""The image helper works in place: its peak memory stays near two decoded frames."""
+import json
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+WIDTH, HEIGHT = 4000, 3000
+MARGIN = 1.25
+
+# Runs in a fresh interpreter, so the parent's allocations do not hide the helper's peak
+CHILD_SCRIPT = r"""
+import json, os, sys
+sys.path.insert(0, sys.argv[1])
+os.environ['LOG_LEVEL'] = 'ERROR'
+import cv2, numpy as np
+import app
+
+def peak_rss_bytes():
+    # VmHWM restarts at exec, unlike ru_maxrss, which keeps the parent's peak
+    with open('/proc/self/status') as status_file:
+        for line in status_file:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+
+with open(sys.argv[2], 'rb') as image_file:
+    image_bytes = image_file.read()
+with open(sys.argv[3], 'rb') as mask_file:
+    mask_bytes = mask_file.read()
+# Warm up codecs and OpenCV's thread pool on a small image first
+small = cv2.imencode('.jpg', np.zeros((64, 64, 3), np.uint8))[1].tobytes()
+small_mask = cv2.imencode('.png', np.full((64, 64), 255, np.uint8))[1].tobytes()
+app.attempt_image_object_removal_with_mask(small, small_mask)
+# Prepare the mask up front, as a server with a warm mask cache would: its one-off connected
+# component labels (4 bytes per pixel) are not part of the per-image peak
+app.mask_cache.get(mask_bytes, int(sys.argv[4]), int(sys.argv[5])).rois(app.IMAGE_INPAINT_RADIUS + 1)
+try:
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5') # Restart VmHWM at the current RSS
+    peak_reset = True
+except OSError:
+    peak_reset = False
+baseline = peak_rss_bytes()
+result, message, info = app.attempt_image_object_removal_with_mask(image_bytes, mask_bytes)
+peak = peak_rss_bytes()
+print(json.dumps({"baseline": baseline, "peak": peak, "peak_reset": peak_reset, "result_bytes": len(result),
+                  "info": info}))
+"""
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs /proc/self/status (VmHWM)")
+def test_image_helper_peak_memory(tmp_path):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    image = np.dstack([x * 255 // WIDTH, y * 255 // HEIGHT, (x + y) * 127 // (WIDTH + HEIGHT)]).astype(np.uint8)
+    image += rng.integers(0, 8, size=image.shape, dtype=np.uint8)
+    del x, y
+    mask = np.zeros((HEIGHT, WIDTH), np.uint8)
+    mask[200:400, 300:1500] = 255
+    mask[2500:2800, 3000:3900] = 255
+    image_path = tmp_path / "large.jpg"
+    mask_path = tmp_path / "mask.png"
+    cv2.imwrite(str(image_path), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    cv2.imwrite(str(mask_path), mask)
+    del image, mask
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, repo_root, str(image_path), str(mask_path), str(WIDTH), str(HEIGHT)],
+        capture_output=True, text=True, check=True, timeout=300
+    )
+    measured = json.loads(completed.stdout.strip().splitlines()[-1])
+    if not measured["peak_reset"]:
+        pytest.skip("cannot reset the peak RSS (/proc/self/clear_refs)")
+
+    frame_bytes = WIDTH * HEIGHT * 3
+    mask_bytes = WIDTH * HEIGHT
+    encoded_bytes = os.path.getsize(image_path) + measured["result_bytes"]
+    ceiling = (2 * frame_bytes + mask_bytes + encoded_bytes) * MARGIN
+    growth = measured["peak"] - measured["baseline"]
+    assert "Error" not in measured["info"]
+    assert growth < ceiling, f"peak grew by {growth / 2 ** 20:.0f} MB, ceiling {ceiling / 2 ** 20:.0f} MB"
@@ -0,0 +1,74 @@
+"""Region-wise inpainting must match a single full-frame cv2.inpaint call exactly."""
+import cv2
+import numpy as np
+import pytest
+
+import app
+
+
+def make_frame(height=240, width=320, seed=0):
+    """Smooth gradients plus noise, so TELEA has real texture to propagate."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    frame = np.dstack([(x * 255 // width), (y * 255 // height), ((x + y) * 127 // (width + height))]).astype(np.int16)
+    frame += rng.integers(-20, 21, size=frame.shape, dtype=np.int16)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def mask_with(shape, rects=(), circles=()):
+    mask = np.zeros(shape, np.uint8)
+    for x0, y0, x1, y1 in rects:
+        mask[y0:y1, x0:x1] = 255
+    for cx, cy, r in circles:
+        cv2.circle(mask, (cx, cy), r, 255, -1)
+    return mask
+
+
+MASKS = {
+    "several_components": dict(rects=[(20, 20, 50, 40), (200, 30, 230, 70), (120, 150, 170, 180)],
+                               circles=[(270, 200, 12)]),
+    "near_edges": dict(rects=[(0, 0, 15, 12), (310, 100, 320, 130), (100, 232, 140, 240)],
+                       circles=[(319, 239, 9)]),
+    # Components a few pixels apart: their padded boxes overlap and are merged
+    "merged_boxes": dict(rects=[(100, 100, 120, 120), (124, 104, 140, 118), (110, 123, 130, 135)]),
+    "large_fraction": dict(rects=[(10, 10, 300, 220)]),
+}
+
+
+@pytest.mark.parametrize("mask_name", sorted(MASKS))
+@pytest.mark.parametrize("radius", [app.VIDEO_INPAINT_RADIUS, app.IMAGE_INPAINT_RADIUS])
+def test_regions_match_full_frame_inpaint(mask_name, radius):
+    frame = make_frame()
+    mask = mask_with(frame.shape[:2], **MASKS[mask_name])
+    expected = cv2.inpaint(frame, mask, inpaintRadius=radius, flags=cv2.INPAINT_TELEA)
+
+    result = app.inpaint_mask_regions(frame, mask, radius)
+
+    assert np.abs(result.astype(np.int16) - expected).max() == 0
+
+
+def test_merged_boxes_are_disjoint():
+    mask = mask_with((240, 320), **MASKS["merged_boxes"])
+    rois = app.compute_mask_rois(mask, app.IMAGE_INPAINT_RADIUS + 1)
+    assert len(rois) == 1
+    x0, y0, x1, y1 = rois[0]
+    assert (x0, y0) == (100 - 10, 100 - 10) and (x1, y1) == (140 + 10, 135 + 10)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_in_place_and_threaded_match_full_frame_inpaint(workers):
+    frame = make_frame(seed=1)
+    mask = mask_with(frame.shape[:2], **MASKS["several_components"])
+    expected = cv2.inpaint(frame, mask, inpaintRadius=app.IMAGE_INPAINT_RADIUS, flags=cv2.INPAINT_TELEA)
+
+    result = app.inpaint_mask_regions(frame, mask, app.IMAGE_INPAINT_RADIUS, dst=frame, workers=workers)
+
+    assert result is frame
+    assert np.abs(result.astype(np.int16) - expected).max() == 0
+
+
+def test_empty_mask_returns_copy():
+    frame = make_frame()
+    result = app.inpaint_mask_regions(frame, np.zeros(frame.shape[:2], np.uint8), app.IMAGE_INPAINT_RADIUS)
+    assert result is not frame
+    assert np.array_equal(result, frame)
@@ -0,0 +1,22 @@
+"""/output/ serves result files only, not the result cache's sidecars and lock markers."""
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.app.config, 'OUTPUT_FOLDER', str(tmp_path))
+    for name in ("result.png", "clip.mp4", "abc.json", "abc.png.lock", "abc.png.1234.tmp"):
+        (tmp_path / name).write_bytes(b"data")
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("name", ["result.png", "clip.mp4"])
+def test_results_are_served(client, name):
+    assert client.get(f"/output/{name}").status_code == 200
+
+
+@pytest.mark.parametrize("name", ["abc.json", "abc.png.lock", "abc.png.1234.tmp"])
+def test_cache_internals_are_not_served(client, name):
+    assert client.get(f"/output/{name}").status_code == 404
@@ -0,0 +1,87 @@
+"""Temporal patch reuse: cached patches on static footage, a fresh inpaint once the surroundings change."""
+import cv2
+import numpy as np
+
+import app
+
+HEIGHT, WIDTH = 120, 160
+RADIUS = app.VIDEO_INPAINT_RADIUS
+
+
+def make_frame(seed):
+    noise = np.random.default_rng(seed).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (0, 0), 2)
+
+
+def make_mask():
+    mask = np.zeros((HEIGHT, WIDTH), np.uint8)
+    mask[40:60, 30:70] = 255
+    mask[80:100, 110:140] = 255
+    return mask
+
+
+def test_identical_frames_reuse_patches():
+    mask = make_mask()
+    frame = make_frame(0)
+    reuser = app.PatchReuseInpainter(mask, RADIUS, threshold=1.0)
+
+    first = reuser.process(frame)
+    later = [reuser.process(frame.copy()) for _ in range(4)]
+
+    assert reuser.patches_total == 5 * len(reuser.rois)
+    assert reuser.patches_reused == 4 * len(reuser.rois)
+    assert reuser.reuse_ratio > 0
+    assert all(np.array_equal(result, first) for result in later)
+    assert np.array_equal(first, cv2.inpaint(frame, mask, RADIUS, cv2.INPAINT_TELEA))
+
+
+def test_changes_inside_the_hole_still_reuse():
+    mask = make_mask()
+    frame = make_frame(0)
+    reuser = app.PatchReuseInpainter(mask, RADIUS, threshold=1.0)
+    reuser.process(frame)
+
+    flickering = frame.copy()
+    flickering[mask > 0] = 255  # The watermark itself changes; TELEA never reads these pixels
+    reuser.process(flickering)
+
+    assert reuser.patches_reused == len(reuser.rois)
+
+
+def test_changed_ring_forces_fresh_inpaint():
+    mask = make_mask()
+    reuser = app.PatchReuseInpainter(mask, RADIUS, threshold=1.0)
+    reuser.process(make_frame(0))
+
+    cut = make_frame(1)  # Scene cut: everything around the holes changes
+    result = reuser.process(cut)
+
+    assert reuser.patches_reused == 0
+    assert reuser.reuse_ratio == 0.0
+    assert np.array_equal(result, cv2.inpaint(cut, mask, RADIUS, cv2.INPAINT_TELEA))
+
+
+def write_video(path, frames):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (WIDTH, HEIGHT))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+def test_video_helper_reports_reuse_ratio(tmp_path):
+    mask_bytes = cv2.imencode('.png', make_mask())[1].tobytes()
+    static_path = str(tmp_path / "static.avi")
+    cut_path = str(tmp_path / "cut.avi")
+    write_video(static_path, [make_frame(0)] * 20)
+    write_video(cut_path, [make_frame(0)] * 10 + [make_frame(1)] * 10)
+
+    static_stats = {}
+    app.attempt_video_object_removal_with_mask(static_path, str(tmp_path / "static_out.avi"), mask_bytes,
+                                               reuse_threshold=2.0, fourcc_code='MJPG', stats=static_stats)
+    cut_stats = {}
+    app.attempt_video_object_removal_with_mask(cut_path, str(tmp_path / "cut_out.avi"), mask_bytes,
+                                               reuse_threshold=2.0, fourcc_code='MJPG', stats=cut_stats)
+
+    # Only the first frame of each segment (and the frame after the cut) is inpainted from scratch
+    assert static_stats["patch_reuse_ratio"] > 0.5
+    assert 0 < cut_stats["patch_reuse_ratio"] < static_stats["patch_reuse_ratio"]
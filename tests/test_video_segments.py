@@ -0,0 +1,70 @@
+"""The segmented video engine must keep every frame, in order."""
+import cv2
+import numpy as np
+
+import app
+
+WIDTH, HEIGHT = 160, 120
+FRAME_COUNT = 210 # Four segments of MIN_SEGMENT_FRAMES or more
+INDEX_BITS = 8
+BLOCK_WIDTH = WIDTH // INDEX_BITS
+BLOCK_HEIGHT = 60
+
+
+def encode_index(index):
+    """A frame whose top half shows `index` in binary: one black/white block per bit (survives JPEG)."""
+    frame = np.full((HEIGHT, WIDTH, 3), 128, np.uint8)
+    for bit in range(INDEX_BITS):
+        frame[:BLOCK_HEIGHT, bit * BLOCK_WIDTH:(bit + 1) * BLOCK_WIDTH] = 255 if index >> bit & 1 else 0
+    return frame
+
+
+def decode_index(frame):
+    index = 0
+    for bit in range(INDEX_BITS):
+        block = frame[8:BLOCK_HEIGHT - 8, bit * BLOCK_WIDTH + 4:(bit + 1) * BLOCK_WIDTH - 4]
+        if block.mean() > 127:
+            index |= 1 << bit
+    return index
+
+
+def read_indices(path):
+    cap = cv2.VideoCapture(path)
+    indices = []
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            indices.append(decode_index(frame))
+    finally:
+        cap.release()
+    return indices
+
+
+def test_segments_are_joined_in_frame_order(tmp_path):
+    input_path = str(tmp_path / "numbered.avi")
+    writer = cv2.VideoWriter(input_path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (WIDTH, HEIGHT))
+    for index in range(FRAME_COUNT):
+        writer.write(encode_index(index))
+    writer.release()
+    assert read_indices(input_path) == list(range(FRAME_COUNT))
+
+    # Mask in the bottom half, well away from the index blocks
+    mask = np.zeros((HEIGHT, WIDTH), np.uint8)
+    mask[90:105, 60:100] = 255
+    mask_bytes = cv2.imencode('.png', mask)[1].tobytes()
+    output_path = str(tmp_path / "result.avi")
+    stats = {}
+    progress = []
+
+    app.attempt_video_object_removal_with_mask(
+        input_path, output_path, mask_bytes, workers=4, fourcc_code='MJPG', stats=stats,
+        progress_callback=lambda done, total: progress.append(done)
+    )
+
+    assert stats["video_workers"] == 4
+    assert stats["frames_processed"] == FRAME_COUNT
+    assert read_indices(output_path) == list(range(FRAME_COUNT))
+    assert progress and progress[-1] == FRAME_COUNT
+    assert progress == sorted(progress)